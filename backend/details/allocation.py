@@ -0,0 +1,520 @@
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from details.models import DetailInStock, PlannedDetail
+from tasks.models import Task
+
+__all__ = [
+    'Allocation',
+    'AllocationSnapshot',
+    'AllocationPlan',
+    'StockAccessStats',
+    'BaseStockStrategy',
+    'FirstFitStockStrategy',
+    'LargestFirstStockStrategy',
+    'SingleWarehouseStockStrategy',
+    'STOCK_STRATEGIES',
+    'get_stock_strategy',
+    'BaseAllocationSolver',
+    'GreedyAllocationSolver',
+    'PriorityAllocationSolver',
+    'ALLOCATION_SOLVERS',
+    'get_allocation_solver',
+    'get_connected_components',
+    'get_task_weights',
+    'get_weighted_completion',
+    'serialize_plan',
+]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Allocation:
+    """
+    Quantity of a planned detail taken from a single stock row.
+    """
+    task_id: int
+    planned_detail_id: int
+    detail_in_stock_id: int
+    quantity: int
+
+
+@dataclass
+class AllocationSnapshot:
+    """
+    Everything a solver needs to allocate a list of tasks, loaded up front.
+    """
+    tasks: list[Task]
+    # task id -> planned details that are not fully allocated yet
+    planned_details: dict[int, list[PlannedDetail]]
+    # detail id -> stock rows with quantity, ordered by id
+    details_in_stock: dict[int, list[DetailInStock]]
+    # detail id -> ids of its similar details
+    similar_details: dict[int, set[int]]
+    _similar_stock: dict[int, list[DetailInStock]] = field(default_factory=dict, repr=False)
+
+    def get_own_stock(self, detail_id: int) -> list[DetailInStock]:
+        return self.details_in_stock.get(detail_id, [])
+
+    def get_similar_stock(self, detail_id: int) -> list[DetailInStock]:
+        """
+        Stock rows of the similar details, ordered by id like the database query they replace.
+        """
+        if detail_id not in self._similar_stock:
+            rows = []
+            for similar_detail_id in self.similar_details.get(detail_id, ()):
+                rows.extend(self.get_own_stock(similar_detail_id))
+            rows.sort(key=lambda row: row.id)
+            self._similar_stock[detail_id] = rows
+        return self._similar_stock[detail_id]
+
+    def get_total_quantity_in_stock(self, detail_id: int) -> int:
+        """
+        In-memory counterpart of PlannedDetailAllocationService.get_total_quantity_in_stock:
+        own stock plus the stock of similar details.
+        """
+        return (
+            sum(row.quantity for row in self.get_own_stock(detail_id))
+            + sum(row.quantity for row in self.get_similar_stock(detail_id))
+        )
+
+
+@dataclass
+class StockAccessStats:
+    """
+    Stock rows an allocation had to lock and the rows and warehouses it actually took from.
+    """
+    rows_locked: int = 0
+    rows_touched: int = 0
+    warehouse_ids: set[int] = field(default_factory=set)
+
+    @property
+    def warehouses_touched(self) -> int:
+        return len(self.warehouse_ids)
+
+    def merge(self, other: 'StockAccessStats'):
+        self.rows_locked += other.rows_locked
+        self.rows_touched += other.rows_touched
+        self.warehouse_ids.update(other.warehouse_ids)
+
+
+@dataclass
+class AllocationPlan:
+    """
+    Result of planning: what to take from where and which rows change.
+    """
+    allocations: list[Allocation] = field(default_factory=list)
+    planned_details: dict[int, PlannedDetail] = field(default_factory=dict)
+    details_in_stock: dict[int, DetailInStock] = field(default_factory=dict)
+    in_progress_task_ids: list[int] = field(default_factory=list)
+    completed_task_ids: list[int] = field(default_factory=list)
+    query_count: int = 0
+    stock_access_stats: StockAccessStats = field(default_factory=StockAccessStats)
+
+    @property
+    def allocated_quantity(self) -> int:
+        return sum(allocation.quantity for allocation in self.allocations)
+
+    def merge(self, other: 'AllocationPlan'):
+        """
+        Add the changes of a plan computed over disjoint stock.
+        """
+        self.allocations.extend(other.allocations)
+        self.planned_details.update(other.planned_details)
+        self.details_in_stock.update(other.details_in_stock)
+        self.in_progress_task_ids.extend(other.in_progress_task_ids)
+        self.completed_task_ids.extend(other.completed_task_ids)
+        self.query_count += other.query_count
+        self.stock_access_stats.merge(other.stock_access_stats)
+
+
+def get_connected_components(detail_ids: Iterable[int], similar_details: dict[int, set[int]]) -> list[set[int]]:
+    """
+    Split details into groups that never compete for the same stock.
+    Details that share a similar detail, directly or through others, end up in the same group.
+    """
+    parent = {}
+
+    def find(detail_id: int) -> int:
+        parent.setdefault(detail_id, detail_id)
+        while parent[detail_id] != detail_id:
+            parent[detail_id] = parent[parent[detail_id]]
+            detail_id = parent[detail_id]
+        return detail_id
+
+    detail_ids = list(detail_ids)
+    for detail_id in detail_ids:
+        root = find(detail_id)
+        for similar_detail_id in similar_details.get(detail_id, ()):
+            similar_root = find(similar_detail_id)
+            if similar_root != root:
+                parent[similar_root] = root
+
+    components = defaultdict(set)
+    for detail_id in detail_ids:
+        components[find(detail_id)].add(detail_id)
+    return sorted(components.values(), key=min)
+
+
+def get_task_weights(tasks: Iterable[Task]) -> dict[int, float]:
+    """
+    Weight of completing a task: 1 for the earliest deadline, decreasing with every day after it.
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return {}
+    first_date = min(task.expected_date for task in tasks)
+    return {task.id: 1 / (1 + (task.expected_date - first_date).days) for task in tasks}
+
+
+class BaseStockStrategy:
+    """
+    Chooses the stock rows a quantity is taken from and the order they are consumed in.
+    """
+    name: str
+
+    def choose(self, rows: Iterable[DetailInStock], quantity: int) -> list[DetailInStock]:
+        """
+        The rows to take quantity from, only as many as needed while they are enough.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _take_until(rows: Iterable[DetailInStock], quantity: int) -> list[DetailInStock]:
+        chosen = []
+        for row in rows:
+            if quantity <= 0:
+                break
+            if row.quantity > 0:
+                chosen.append(row)
+                quantity -= row.quantity
+        return chosen
+
+
+class FirstFitStockStrategy(BaseStockStrategy):
+    """
+    Rows in id order, the original behaviour.
+    """
+    name = 'first-fit'
+
+    def choose(self, rows: Iterable[DetailInStock], quantity: int) -> list[DetailInStock]:
+        return self._take_until(sorted(rows, key=lambda row: row.id), quantity)
+
+
+class LargestFirstStockStrategy(BaseStockStrategy):
+    """
+    The smallest single row that covers the quantity (best fit), otherwise the largest rows first.
+    """
+    name = 'largest-first'
+
+    def choose(self, rows: Iterable[DetailInStock], quantity: int) -> list[DetailInStock]:
+        rows = [row for row in rows if row.quantity > 0]
+        fitting_rows = [row for row in rows if row.quantity >= quantity]
+        if fitting_rows:
+            return [min(fitting_rows, key=lambda row: (row.quantity, row.id))]
+        return self._take_until(sorted(rows, key=lambda row: (-row.quantity, row.id)), quantity)
+
+
+class SingleWarehouseStockStrategy(LargestFirstStockStrategy):
+    """
+    Rows of a single warehouse that covers the quantity with the fewest rows,
+    otherwise the warehouses with the most stock first.
+    """
+    name = 'single-warehouse'
+
+    def choose(self, rows: Iterable[DetailInStock], quantity: int) -> list[DetailInStock]:
+        rows_by_warehouse = defaultdict(list)
+        for row in rows:
+            if row.quantity > 0:
+                rows_by_warehouse[row.warehouse_id].append(row)
+
+        covering = []
+        for warehouse_id, warehouse_rows in rows_by_warehouse.items():
+            if sum(row.quantity for row in warehouse_rows) >= quantity:
+                chosen = super().choose(warehouse_rows, quantity)
+                covering.append((len(chosen), warehouse_id, chosen))
+        if covering:
+            return min(covering, key=lambda candidate: candidate[:2])[2]
+
+        warehouses = sorted(
+            rows_by_warehouse.items(),
+            key=lambda item: (-sum(row.quantity for row in item[1]), item[0]),
+        )
+        ordered_rows = [
+            row
+            for _, warehouse_rows in warehouses
+            for row in sorted(warehouse_rows, key=lambda row: (-row.quantity, row.id))
+        ]
+        return self._take_until(ordered_rows, quantity)
+
+
+STOCK_STRATEGIES: dict[str, type[BaseStockStrategy]] = {
+    FirstFitStockStrategy.name: FirstFitStockStrategy,
+    LargestFirstStockStrategy.name: LargestFirstStockStrategy,
+    SingleWarehouseStockStrategy.name: SingleWarehouseStockStrategy,
+}
+
+
+def get_stock_strategy(name: str) -> BaseStockStrategy:
+    try:
+        return STOCK_STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown stock strategy: {name}") from None
+
+
+class BaseAllocationSolver:
+    """
+    Computes an AllocationPlan from an AllocationSnapshot without touching the database.
+    The stock strategy decides which stock rows each planned detail is taken from.
+    """
+    name: str
+
+    def __init__(self, stock_strategy: BaseStockStrategy | None = None):
+        self.stock_strategy = stock_strategy or FirstFitStockStrategy()
+
+    def solve(self, snapshot: AllocationSnapshot) -> AllocationPlan:
+        raise NotImplementedError
+
+    def _allocate_planned_detail(
+            self,
+            snapshot: AllocationSnapshot,
+            plan: AllocationPlan,
+            planned_detail: PlannedDetail,
+    ):
+        """
+        Allocate a planned detail from its own stock first, then from similar details.
+        """
+        for get_stock in (snapshot.get_own_stock, snapshot.get_similar_stock):
+            missing_quantity = planned_detail.planned_quantity - planned_detail.quantity_in_stock
+            if missing_quantity <= 0:
+                break
+            rows = self.stock_strategy.choose(get_stock(planned_detail.detail_id), missing_quantity)
+            self._allocate_from_stock(plan, planned_detail, rows)
+
+    @staticmethod
+    def _allocate_from_stock(
+            plan: AllocationPlan,
+            planned_detail: PlannedDetail,
+            in_stock: Iterable[DetailInStock],
+    ):
+        for detail_in_stock in in_stock:
+            need_to_allocate_pcs = planned_detail.planned_quantity - planned_detail.quantity_in_stock
+            if need_to_allocate_pcs <= 0:
+                break
+            alloc_pcs = min(detail_in_stock.quantity, need_to_allocate_pcs)
+            if alloc_pcs <= 0:
+                continue
+            detail_in_stock.quantity -= alloc_pcs
+            planned_detail.quantity_in_stock += alloc_pcs
+            plan.details_in_stock[detail_in_stock.id] = detail_in_stock
+            plan.planned_details[planned_detail.id] = planned_detail
+            plan.allocations.append(
+                Allocation(
+                    task_id=planned_detail.task_id,
+                    planned_detail_id=planned_detail.id,
+                    detail_in_stock_id=detail_in_stock.id,
+                    quantity=alloc_pcs,
+                ),
+            )
+
+
+class GreedyAllocationSolver(BaseAllocationSolver):
+    """
+    Tasks are taken in the given order.
+    Tasks that can be fully allocated are handled first, then the remaining ones in order.
+    """
+    name = 'greedy'
+
+    def solve(self, snapshot: AllocationSnapshot) -> AllocationPlan:
+        plan = AllocationPlan()
+        tasks_to_allocate_partially = []
+
+        for task in snapshot.tasks:
+            planned_details = snapshot.planned_details.get(task.id, [])
+            if all(
+                planned_detail.planned_quantity <= snapshot.get_total_quantity_in_stock(planned_detail.detail_id)
+                for planned_detail in planned_details
+            ):
+                for planned_detail in planned_details:
+                    self._allocate_planned_detail(snapshot, plan, planned_detail)
+                plan.completed_task_ids.append(task.id)
+            else:
+                tasks_to_allocate_partially.append(task)
+
+        for task in tasks_to_allocate_partially:
+            for planned_detail in snapshot.planned_details.get(task.id, []):
+                self._allocate_planned_detail(snapshot, plan, planned_detail)
+            plan.in_progress_task_ids.append(task.id)
+
+        return plan
+
+
+class PriorityAllocationSolver(BaseAllocationSolver):
+    """
+    Plans all tasks together to complete as many tasks as possible, weighted by deadline.
+
+    Every task is scored by its deadline weight divided by the share of the reachable
+    stock (own and similar details) it would consume. Tasks are tried in score order
+    and kept only if all their planned details can be covered, so a single early task
+    no longer drains stock that would have completed several later ones. Stock left
+    after that is allocated partially in deadline order.
+
+    The completion pass is O(planned details * reachable stock rows); once time_limit
+    seconds have passed the remaining tasks fall through to partial allocation.
+    """
+    name = 'priority'
+
+    def __init__(self, time_limit: float | None = 60, stock_strategy: BaseStockStrategy | None = None):
+        super().__init__(stock_strategy=stock_strategy)
+        self.time_limit = time_limit
+
+    def solve(self, snapshot: AllocationSnapshot) -> AllocationPlan:
+        plan = AllocationPlan()
+        started_at = time.monotonic()
+        weights = get_task_weights(snapshot.tasks)
+        task_order = {task.id: index for index, task in enumerate(snapshot.tasks)}
+
+        candidates = []
+        for task in snapshot.tasks:
+            score = self._get_task_score(snapshot, task, weights[task.id])
+            if score is not None:
+                candidates.append((-score, task.expected_date, task_order[task.id], task))
+        candidates.sort(key=lambda candidate: candidate[:3])
+
+        completed_task_ids = set()
+        for _, _, _, task in candidates:
+            if self.time_limit is not None and time.monotonic() - started_at > self.time_limit:
+                logger.warning("Priority solver time limit reached, the rest is allocated partially")
+                break
+            if self._try_complete_task(snapshot, plan, task):
+                completed_task_ids.add(task.id)
+
+        remaining_tasks = sorted(
+            (task for task in snapshot.tasks if task.id not in completed_task_ids),
+            key=lambda task: (task.expected_date, task_order[task.id]),
+        )
+        for task in remaining_tasks:
+            for planned_detail in snapshot.planned_details.get(task.id, []):
+                self._allocate_planned_detail(snapshot, plan, planned_detail)
+            plan.in_progress_task_ids.append(task.id)
+
+        plan.completed_task_ids = [task.id for task in snapshot.tasks if task.id in completed_task_ids]
+        return plan
+
+    @staticmethod
+    def _get_task_score(snapshot: AllocationSnapshot, task: Task, weight: float) -> float | None:
+        """
+        Deadline weight per share of reachable stock, None if the task can't be completed at all.
+        """
+        cost = 0.0
+        for planned_detail in snapshot.planned_details.get(task.id, []):
+            need = planned_detail.planned_quantity - planned_detail.quantity_in_stock
+            available = snapshot.get_total_quantity_in_stock(planned_detail.detail_id)
+            if need > available:
+                return None
+            if need > 0:
+                cost += need / available
+        return weight / (cost or 1e-9)
+
+    def _try_complete_task(self, snapshot: AllocationSnapshot, plan: AllocationPlan, task: Task) -> bool:
+        """
+        Allocate all planned details of a task, or nothing if one of them can't be covered.
+        """
+        planned_details = snapshot.planned_details.get(task.id, [])
+        tentative_plan = AllocationPlan()
+        initial_quantities = {planned_detail.id: planned_detail.quantity_in_stock for planned_detail in planned_details}
+
+        for planned_detail in planned_details:
+            self._allocate_planned_detail(snapshot, tentative_plan, planned_detail)
+            if planned_detail.quantity_in_stock < planned_detail.planned_quantity:
+                for allocation in tentative_plan.allocations:
+                    tentative_plan.details_in_stock[allocation.detail_in_stock_id].quantity += allocation.quantity
+                for planned_detail_to_revert in planned_details:
+                    planned_detail_to_revert.quantity_in_stock = initial_quantities[planned_detail_to_revert.id]
+                return False
+
+        plan.allocations.extend(tentative_plan.allocations)
+        plan.planned_details.update(tentative_plan.planned_details)
+        plan.details_in_stock.update(tentative_plan.details_in_stock)
+        return True
+
+
+ALLOCATION_SOLVERS: dict[str, type[BaseAllocationSolver]] = {
+    GreedyAllocationSolver.name: GreedyAllocationSolver,
+    PriorityAllocationSolver.name: PriorityAllocationSolver,
+}
+
+
+def get_allocation_solver(name: str, stock_strategy: str | None = None) -> BaseAllocationSolver:
+    try:
+        solver_class = ALLOCATION_SOLVERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown allocation solver: {name}") from None
+    return solver_class(stock_strategy=get_stock_strategy(stock_strategy) if stock_strategy else None)
+
+
+def get_weighted_completion(snapshot: AllocationSnapshot, plan: AllocationPlan) -> float:
+    """
+    Sum of the deadline weights of the completed tasks.
+    """
+    weights = get_task_weights(snapshot.tasks)
+    return sum(weights[task_id] for task_id in plan.completed_task_ids)
+
+
+def serialize_plan(snapshot: AllocationSnapshot, plan: AllocationPlan) -> dict:
+    """
+    JSON-ready view of a plan per task, per planned detail and per stock row.
+    Expects the snapshot the plan was computed from.
+    """
+    allocations_by_planned_detail = defaultdict(list)
+    allocated_by_stock_row = defaultdict(int)
+    for allocation in plan.allocations:
+        allocations_by_planned_detail[allocation.planned_detail_id].append(
+            {'detail_in_stock_id': allocation.detail_in_stock_id, 'quantity': allocation.quantity},
+        )
+        allocated_by_stock_row[allocation.detail_in_stock_id] += allocation.quantity
+
+    completed_task_ids = set(plan.completed_task_ids)
+    tasks = []
+    for task in snapshot.tasks:
+        planned_details = []
+        for planned_detail in snapshot.planned_details.get(task.id, []):
+            allocations = allocations_by_planned_detail[planned_detail.id]
+            allocated = sum(allocation['quantity'] for allocation in allocations)
+            planned_details.append({
+                'id': planned_detail.id,
+                'detail_id': planned_detail.detail_id,
+                'planned_quantity': planned_detail.planned_quantity,
+                'quantity_in_stock_before': planned_detail.quantity_in_stock - allocated,
+                'quantity_in_stock_after': planned_detail.quantity_in_stock,
+                'allocations': allocations,
+            })
+        tasks.append({
+            'id': task.id,
+            'expected_date': task.expected_date.isoformat(),
+            'status': Task.Status.COMPLETED if task.id in completed_task_ids else Task.Status.IN_PROGRESS,
+            'planned_details': planned_details,
+        })
+
+    details_in_stock = [
+        {
+            'id': detail_in_stock.id,
+            'detail_id': detail_in_stock.detail_id,
+            'quantity_before': detail_in_stock.quantity + allocated_by_stock_row[detail_in_stock.id],
+            'quantity_after': detail_in_stock.quantity,
+            'allocated': allocated_by_stock_row[detail_in_stock.id],
+        }
+        for detail_in_stock in sorted(plan.details_in_stock.values(), key=lambda row: row.id)
+    ]
+
+    return {
+        'completed_tasks': len(plan.completed_task_ids),
+        'in_progress_tasks': len(plan.in_progress_task_ids),
+        'allocated_quantity': plan.allocated_quantity,
+        'tasks': tasks,
+        'details_in_stock': details_in_stock,
+    }
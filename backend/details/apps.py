@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DetailsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'details'
+
+    def ready(self):
+        from details import signals  # noqa: F401
@@ -1,3 +1,6 @@
+from typing import Iterable
+
+
 class NotEnoughDetail(Exception):
 
     def __init__(
@@ -38,3 +41,14 @@ class AllocationDetailError(Exception):
         if self.task_id:
             msg += f" - {self.task_id}"
         return msg
+
+
+class ComponentAllocationError(Exception):
+
+    def __init__(self, detail_ids: Iterable[int]):
+        self.message = "Allocation of component failed"
+        self.detail_ids = sorted(detail_ids)
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message}: details {self.detail_ids} - {self.__cause__}"
@@ -0,0 +1,23 @@
+from details.models import DetailInStock
+from django.db.models import QuerySet
+from django_filters import rest_framework as filters
+
+__all__ = ['DetailInStockFilter']
+
+
+class DetailInStockFilter(filters.FilterSet):
+    """
+    Filters of the stock lists, served by the (detail, warehouse) indexes of DetailInStock.
+    """
+    detail = filters.NumberFilter(field_name='detail_id')
+    warehouse = filters.NumberFilter(field_name='warehouse_id')
+    substitution_group = filters.NumberFilter(field_name='detail__substitution_group')
+    in_stock = filters.BooleanFilter(method='filter_in_stock', label='Only rows with quantity > 0')
+
+    class Meta:
+        model = DetailInStock
+        fields = ['detail', 'warehouse', 'substitution_group', 'in_stock']
+
+    @staticmethod
+    def filter_in_stock(queryset: QuerySet[DetailInStock], name: str, value: bool) -> QuerySet[DetailInStock]:
+        return queryset.filter(quantity__gt=0) if value else queryset.filter(quantity=0)
@@ -0,0 +1,18 @@
+from details.services import AllocationEntryDAO
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Fold pending allocation ledger entries into stock and planned detail quantities'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Entries per transaction',
+        )
+
+    def handle(self, *args, **options):
+        compacted = AllocationEntryDAO().compact(batch_size=options['batch_size'])
+        self.stdout.write(f"Compacted {compacted} allocation entries")
@@ -0,0 +1,50 @@
+import json
+import sys
+from pathlib import Path
+
+from details.stock_import import STOCK_IMPORT_FORMATS, StockImportService
+from django.core.management import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a stock dump of detail, warehouse and quantity rows from CSV with a header or NDJSON. '
+        'Rows replace the quantity in stock of their (detail, warehouse).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dump file, - reads stdin')
+        parser.add_argument(
+            '--format',
+            choices=STOCK_IMPORT_FORMATS,
+            help='Format of the dump, taken from the file extension by default',
+        )
+        parser.add_argument('--json', action='store_true', help='Write the result as JSON')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or Path(path).suffix.lstrip('.').lower()
+        if file_format == 'jsonl':
+            file_format = 'ndjson'
+        if file_format not in STOCK_IMPORT_FORMATS:
+            raise CommandError(f"Pass --format, the format of {path} is not one of {', '.join(STOCK_IMPORT_FORMATS)}")
+
+        if path == '-':
+            result = StockImportService().import_stock(sys.stdin, file_format)
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8-sig') as lines:
+                    result = StockImportService().import_stock(lines, file_format)
+            except OSError as exc:
+                raise CommandError(str(exc)) from exc
+
+        if options['json']:
+            self.stdout.write(json.dumps(result.as_dict(), indent=2))
+            return
+        self.stdout.write(
+            f"Imported {result.rows} rows in {result.seconds:.2f}s ({result.rows_per_second} rows/s): "
+            f"{result.inserted} inserted, {result.updated} updated, {result.duplicates} duplicates, "
+            f"{result.rejected} rejected ({result.rejected_invalid} invalid, {result.rejected_unknown} unknown)"
+        )
+        for line in result.invalid_lines:
+            self.stderr.write(line)
@@ -0,0 +1,15 @@
+from details.services import DetailDAO, detail_cache
+from django.core.management import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Recompute the substitution group of every detail, e.g. after loading fixtures'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            DetailDAO().rebuild_substitution_groups()
+            detail_cache.invalidate()
+        self.stdout.write(
+            f"{DetailDAO.model.objects.values('substitution_group').distinct().count()} substitution groups",
+        )
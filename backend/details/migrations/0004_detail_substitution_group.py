@@ -0,0 +1,48 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:00
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_substitution_groups(apps, schema_editor):
+    Detail = apps.get_model('details', 'Detail')
+    parent = {}
+
+    def find(detail_id):
+        parent.setdefault(detail_id, detail_id)
+        while parent[detail_id] != detail_id:
+            parent[detail_id] = parent[parent[detail_id]]
+            detail_id = parent[detail_id]
+        return detail_id
+
+    for detail_id in Detail.objects.values_list('id', flat=True):
+        find(detail_id)
+    for from_detail_id, to_detail_id in Detail.similar_details.through.objects.values_list(
+        'from_detail_id', 'to_detail_id',
+    ):
+        from_root, to_root = find(from_detail_id), find(to_detail_id)
+        if from_root != to_root:
+            parent[max(from_root, to_root)] = min(from_root, to_root)
+
+    groups = defaultdict(list)
+    for detail_id in parent:
+        groups[find(detail_id)].append(detail_id)
+    for group_id, detail_ids in groups.items():
+        Detail.objects.filter(id__in=detail_ids).update(substitution_group=min(detail_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0003_rename_planed_quantity_planneddetail_planned_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detail',
+            name='substitution_group',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_substitution_groups, migrations.RunPython.noop),
+    ]
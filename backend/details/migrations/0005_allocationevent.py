@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0004_detail_substitution_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('stock_increased', 'Stock Increased'), ('planned_detail_changed', 'Planned Detail Changed')], max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('detail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_events', to='details.detail')),
+            ],
+            options={
+                'verbose_name': 'Allocation Event',
+                'verbose_name_plural': 'Allocation Events',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0005_allocationevent'),
+        ('tasks', '0003_task_allocated_at_alter_task_expected_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('compacted_at', models.DateTimeField(blank=True, null=True)),
+                ('detail_in_stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_entries', to='details.detailinstock')),
+                ('planned_detail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_entries', to='details.planneddetail')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_entries', to='tasks.task')),
+            ],
+            options={
+                'verbose_name': 'Allocation Entry',
+                'verbose_name_plural': 'Allocation Entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('compacted_at__isnull', True)), fields=['id'], name='allocation_entry_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CREATE_TRIGGER = """
+CREATE FUNCTION details_sync_detail_stock_total() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.detail_id = OLD.detail_id THEN
+        IF NEW.quantity <> OLD.quantity THEN
+            UPDATE details_detailstocktotal
+            SET quantity = quantity + NEW.quantity - OLD.quantity
+            WHERE detail_id = NEW.detail_id;
+        END IF;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE details_detailstocktotal
+        SET quantity = quantity - OLD.quantity
+        WHERE detail_id = OLD.detail_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO details_detailstocktotal (detail_id, quantity)
+        VALUES (NEW.detail_id, NEW.quantity)
+        ON CONFLICT (detail_id) DO UPDATE SET quantity = details_detailstocktotal.quantity + EXCLUDED.quantity;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER details_detailinstock_sync_total
+AFTER INSERT OR DELETE OR UPDATE OF detail_id, quantity ON details_detailinstock
+FOR EACH ROW EXECUTE FUNCTION details_sync_detail_stock_total();
+
+INSERT INTO details_detailstocktotal (detail_id, quantity)
+SELECT detail_id, SUM(quantity) FROM details_detailinstock GROUP BY detail_id;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER details_detailinstock_sync_total ON details_detailinstock;
+DROP FUNCTION details_sync_detail_stock_total();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0006_allocationentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetailStockTotal',
+            fields=[
+                ('detail', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_total', serialize=False, to='details.detail')),
+                ('quantity', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Detail Stock Total',
+                'verbose_name_plural': 'Detail Stock Totals',
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0007_detailstocktotal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detailinstock',
+            index=models.Index(fields=['detail', 'warehouse'], name='detail_in_stock_detail_wh_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detailinstock',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['warehouse', 'detail'], name='detail_in_stock_available_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:20
+
+from django.db import migrations
+
+# totals are net of pending allocation ledger entries: a pending entry takes its quantity off the total
+# of the detail of its stock row and compaction, which moves it into DetailInStock.quantity, gives it back
+CREATE_TRIGGER = """
+CREATE FUNCTION details_sync_detail_stock_total_pending() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.compacted_at IS NULL THEN
+        UPDATE details_detailstocktotal t
+        SET quantity = t.quantity + OLD.quantity
+        FROM details_detailinstock s
+        WHERE s.id = OLD.detail_in_stock_id AND t.detail_id = s.detail_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.compacted_at IS NULL THEN
+        INSERT INTO details_detailstocktotal (detail_id, quantity)
+        SELECT s.detail_id, -NEW.quantity FROM details_detailinstock s WHERE s.id = NEW.detail_in_stock_id
+        ON CONFLICT (detail_id) DO UPDATE SET quantity = details_detailstocktotal.quantity + EXCLUDED.quantity;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER details_allocationentry_sync_total
+AFTER INSERT OR DELETE OR UPDATE OF compacted_at, quantity, detail_in_stock_id ON details_allocationentry
+FOR EACH ROW EXECUTE FUNCTION details_sync_detail_stock_total_pending();
+
+CREATE OR REPLACE FUNCTION details_sync_detail_stock_total() RETURNS trigger AS $$
+DECLARE
+    pending bigint := 0;
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.detail_id = OLD.detail_id THEN
+        IF NEW.quantity <> OLD.quantity THEN
+            UPDATE details_detailstocktotal
+            SET quantity = quantity + NEW.quantity - OLD.quantity
+            WHERE detail_id = NEW.detail_id;
+        END IF;
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        -- pending entries of the row move to the total of its new detail with it
+        SELECT COALESCE(SUM(quantity), 0) INTO pending
+        FROM details_allocationentry
+        WHERE detail_in_stock_id = NEW.id AND compacted_at IS NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE details_detailstocktotal
+        SET quantity = quantity - OLD.quantity + pending
+        WHERE detail_id = OLD.detail_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO details_detailstocktotal (detail_id, quantity)
+        VALUES (NEW.detail_id, NEW.quantity - pending)
+        ON CONFLICT (detail_id) DO UPDATE SET quantity = details_detailstocktotal.quantity + EXCLUDED.quantity;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE details_detailstocktotal t
+SET quantity = t.quantity - pending.quantity
+FROM (
+    SELECT s.detail_id, SUM(e.quantity) AS quantity
+    FROM details_allocationentry e
+    JOIN details_detailinstock s ON s.id = e.detail_in_stock_id
+    WHERE e.compacted_at IS NULL
+    GROUP BY s.detail_id
+) pending
+WHERE t.detail_id = pending.detail_id;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER details_allocationentry_sync_total ON details_allocationentry;
+DROP FUNCTION details_sync_detail_stock_total_pending();
+
+CREATE OR REPLACE FUNCTION details_sync_detail_stock_total() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.detail_id = OLD.detail_id THEN
+        IF NEW.quantity <> OLD.quantity THEN
+            UPDATE details_detailstocktotal
+            SET quantity = quantity + NEW.quantity - OLD.quantity
+            WHERE detail_id = NEW.detail_id;
+        END IF;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE details_detailstocktotal
+        SET quantity = quantity - OLD.quantity
+        WHERE detail_id = OLD.detail_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO details_detailstocktotal (detail_id, quantity)
+        VALUES (NEW.detail_id, NEW.quantity)
+        ON CONFLICT (detail_id) DO UPDATE SET quantity = details_detailstocktotal.quantity + EXCLUDED.quantity;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE details_detailstocktotal t
+SET quantity = totals.quantity
+FROM (SELECT detail_id, SUM(quantity) AS quantity FROM details_detailinstock GROUP BY detail_id) totals
+WHERE t.detail_id = totals.detail_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('details', '0008_detailinstock_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -9,6 +9,8 @@ class Detail(models.Model):
         'self',
         blank=True,
     )
+    # id of the connected component of the similar details graph, maintained by details.signals
+    substitution_group = models.BigIntegerField(null=True, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
@@ -29,6 +31,13 @@ class PlannedDetail(models.Model):
     def __str__(self):
         return f"id: {self.id} - detail: {self.detail}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # used by details.signals to detect a raised planned quantity
+        instance._loaded_planned_quantity = instance.__dict__.get('planned_quantity')
+        return instance
+
     class Meta:
         verbose_name = 'Planned Detail'
         verbose_name_plural = 'Planned Details'
@@ -47,10 +56,43 @@ class DetailInStock(models.Model):
     def __str__(self):
         return f"id: {self.id} - detail: {self.detail} - pcs: {self.quantity}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # used by details.signals to detect arriving stock
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
     class Meta:
         verbose_name = 'Detail In Stock'
         verbose_name_plural = 'Details In Stock'
         ordering = ['id']
+        indexes = [
+            # stock list filters and the stock import upsert by (detail, warehouse)
+            models.Index(fields=['detail', 'warehouse'], name='detail_in_stock_detail_wh_idx'),
+            # the same filters on rows that still hold stock
+            models.Index(
+                fields=['warehouse', 'detail'],
+                condition=models.Q(quantity__gt=0),
+                name='detail_in_stock_available_idx',
+            ),
+        ]
+
+
+class DetailStockTotal(models.Model):
+    """
+    Sum of DetailInStock.quantity per detail net of pending AllocationEntry quantities,
+    maintained by database triggers on every stock and allocation ledger write.
+    """
+    detail = models.OneToOneField(Detail, on_delete=models.CASCADE, primary_key=True, related_name='stock_total')
+    quantity = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"detail: {self.detail_id} - pcs: {self.quantity}"
+
+    class Meta:
+        verbose_name = 'Detail Stock Total'
+        verbose_name_plural = 'Detail Stock Totals'
 
 
 class WareHouse(models.Model):
@@ -68,3 +110,54 @@ class WareHouse(models.Model):
         verbose_name = 'Warehouse'
         verbose_name_plural = 'Warehouses'
         ordering = ['id']
+
+
+class AllocationEvent(models.Model):
+    """
+    Durable queue of changes that may let waiting planned details of a detail be allocated.
+    """
+
+    class Reason(models.TextChoices):
+        STOCK_INCREASED = 'stock_increased', 'Stock Increased'
+        PLANNED_DETAIL_CHANGED = 'planned_detail_changed', 'Planned Detail Changed'
+
+    detail = models.ForeignKey(Detail, on_delete=models.CASCADE, related_name='allocation_events')
+    reason = models.CharField(max_length=30, choices=Reason.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"id: {self.id} - detail: {self.detail_id} - {self.reason}"
+
+    class Meta:
+        verbose_name = 'Allocation Event'
+        verbose_name_plural = 'Allocation Events'
+        ordering = ['id']
+
+
+class AllocationEntry(models.Model):
+    """
+    Append-only ledger of stock taken by planned details, a negative quantity gives stock back.
+    Entries with compacted_at set are already included in DetailInStock.quantity and
+    PlannedDetail.quantity_in_stock, pending entries are folded in by AllocationEntryDAO.compact.
+    """
+    task = models.ForeignKey('tasks.Task', on_delete=models.CASCADE, related_name='allocation_entries')
+    planned_detail = models.ForeignKey(PlannedDetail, on_delete=models.CASCADE, related_name='allocation_entries')
+    detail_in_stock = models.ForeignKey(DetailInStock, on_delete=models.CASCADE, related_name='allocation_entries')
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    compacted_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"id: {self.id} - planned detail: {self.planned_detail_id} - pcs: {self.quantity}"
+
+    class Meta:
+        verbose_name = 'Allocation Entry'
+        verbose_name_plural = 'Allocation Entries'
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(compacted_at__isnull=True),
+                name='allocation_entry_pending_idx',
+            ),
+        ]
@@ -0,0 +1,451 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from details.allocation import (
+    AllocationPlan, AllocationSnapshot,
+    BaseAllocationSolver, GreedyAllocationSolver,
+)
+from details.exceptions import ComponentAllocationError
+from details.models import Detail, DetailInStock, PlannedDetail
+from details.services import AllocationEntryDAO, DetailStockTotalDAO, stock_availability_cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from sa_project.services.helpers import count_queries
+from tasks.models import Task
+
+__all__ = ['AllocationPlanner', 'ShardedAllocationPlanner']
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+
+
+class AllocationPlanner:
+    """
+    Allocates a list of tasks with a fixed number of queries.
+
+    Stock, planned details and similar details are loaded once, the plan is
+    computed in memory by the solver (by default with the same greedy rules
+    TaskService.allocate_task_list used to apply row by row), and the result
+    is written with bulk updates and recorded in the allocation ledger.
+
+    With append_only the counters are not updated at all: allocations are only
+    inserted into the ledger and pending entries are taken into account when
+    loading, until AllocationEntryDAO.compact folds them into the counters.
+
+    Stock is read without locks and only the rows the plan takes from are locked, so
+    a stock strategy that touches fewer rows also takes fewer locks. If one of them
+    changed in between the plan is made again, the last attempt locks every eligible
+    row up front. plan.stock_access_stats counts the locked and touched rows.
+    """
+    max_plan_attempts = 3
+
+    def __init__(
+            self,
+            solver: BaseAllocationSolver | None = None,
+            using: str = DEFAULT_DB_ALIAS,
+            append_only: bool = False,
+    ):
+        self.solver = solver or GreedyAllocationSolver()
+        self.using = using
+        self.append_only = append_only
+        self.allocation_entry_dao = AllocationEntryDAO()
+        self.detail_stock_total_dao = DetailStockTotalDAO()
+
+    def allocate(self, tasks: Iterable[Task], detail_ids: Iterable[int] | None = None) -> AllocationPlan:
+        """
+        Load, plan and apply the allocation of tasks in one transaction.
+
+        With detail_ids only the planned details of those details are allocated and a task
+        is COMPLETED once none of its planned details is short, whichever detail they are for.
+        """
+        with count_queries(self.using) as counter, transaction.atomic(using=self.using):
+            snapshot, plan = self.load_and_plan(tasks, detail_ids=detail_ids)
+            if detail_ids is None:
+                self.apply(snapshot, plan)
+            else:
+                self._apply_quantities(plan)
+                self._set_statuses_from_planned_details(snapshot.tasks, plan)
+                self._apply_statuses(snapshot.tasks, plan)
+        plan.query_count = counter.count
+        logger.info(
+            "Allocated %s pcs for %s tasks (%s completed) in %s queries",
+            plan.allocated_quantity,
+            len(snapshot.tasks),
+            len(plan.completed_task_ids),
+            plan.query_count,
+        )
+        return plan
+
+    def dry_run(self, tasks: Iterable[Task]) -> tuple[AllocationSnapshot, AllocationPlan]:
+        """
+        Plan the allocation of tasks without row locks or writes.
+        Data is read in one read-only repeatable read transaction, so it is consistent and can run on a replica.
+        """
+        connection = connections[self.using]
+        starts_transaction = not connection.in_atomic_block
+        with count_queries(self.using) as counter, transaction.atomic(using=self.using):
+            if starts_transaction:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            snapshot = self.load(tasks, lock=False)
+        plan = self.plan(snapshot)
+        plan.query_count = counter.count
+        return snapshot, plan
+
+    def load_and_plan(
+            self,
+            tasks: Iterable[Task],
+            detail_ids: Iterable[int] | None = None,
+    ) -> tuple[AllocationSnapshot, AllocationPlan]:
+        """
+        Plan the allocation of tasks with the planned details locked and lock the stock rows the plan takes from.
+        """
+        tasks = list(tasks)
+        rows_locked = 0
+        for attempt in range(1, self.max_plan_attempts + 1):
+            lock_stock = attempt == self.max_plan_attempts
+            snapshot = self.load(tasks, lock=True, detail_ids=detail_ids, lock_stock=lock_stock)
+            loaded_quantities = {
+                detail_in_stock.id: detail_in_stock.quantity
+                for details_in_stock in snapshot.details_in_stock.values()
+                for detail_in_stock in details_in_stock
+            }
+            plan = self.plan(snapshot)
+            if lock_stock:
+                rows_locked += len(loaded_quantities)
+                break
+            with transaction.atomic(using=self.using):
+                locked_quantities = self._lock_stock(plan.details_in_stock)
+                rows_locked += len(locked_quantities)
+                unchanged = all(
+                    locked_quantities.get(row_id) == loaded_quantities[row_id] for row_id in plan.details_in_stock
+                )
+                if not unchanged:
+                    # rolling back to the savepoint releases the row locks, the next attempt locks in id order again
+                    transaction.set_rollback(True, using=self.using)
+            if unchanged:
+                break
+            logger.info("Stock changed while planning, planning again (attempt %s)", attempt + 1)
+
+        plan.stock_access_stats.rows_locked = rows_locked
+        plan.stock_access_stats.rows_touched = len(plan.details_in_stock)
+        plan.stock_access_stats.warehouse_ids = {
+            detail_in_stock.warehouse_id for detail_in_stock in plan.details_in_stock.values()
+        }
+        return snapshot, plan
+
+    def load(
+            self,
+            tasks: Iterable[Task],
+            lock: bool = True,
+            detail_ids: Iterable[int] | None = None,
+            lock_stock: bool = False,
+    ) -> AllocationSnapshot:
+        """
+        Load the data needed to allocate tasks, locking planned details if requested and stock rows with lock_stock.
+        With detail_ids only the planned details of those details are loaded.
+        """
+        tasks = list(tasks)
+
+        planned_details_query = (
+            PlannedDetail.objects.using(self.using)
+            .filter(task_id__in=[task.id for task in tasks], quantity_in_stock__lt=F('planned_quantity'))
+            .only('id', 'task_id', 'detail_id', 'planned_quantity', 'quantity_in_stock')
+            .order_by('id')
+        )
+        if detail_ids is not None:
+            planned_details_query = planned_details_query.filter(detail_id__in=detail_ids)
+        if lock:
+            planned_details_query = planned_details_query.select_for_update()
+
+        planned_details = defaultdict(list)
+        detail_ids = set()
+        for planned_detail in planned_details_query:
+            planned_details[planned_detail.task_id].append(planned_detail)
+            detail_ids.add(planned_detail.detail_id)
+
+        similar_details = defaultdict(set)
+        similar_details_query = (
+            Detail.similar_details.through.objects.using(self.using)
+            .filter(from_detail_id__in=detail_ids)
+            .values_list('from_detail_id', 'to_detail_id')
+        )
+        for from_detail_id, to_detail_id in similar_details_query:
+            similar_details[from_detail_id].add(to_detail_id)
+
+        stock_detail_ids = detail_ids.union(*similar_details.values())
+        details_in_stock_query = (
+            DetailInStock.objects.using(self.using)
+            .filter(detail_id__in=stock_detail_ids, quantity__gt=0)
+            .only('id', 'detail_id', 'warehouse_id', 'quantity')
+            .order_by('id')
+        )
+        if lock_stock:
+            details_in_stock_query = details_in_stock_query.select_for_update()
+
+        details_in_stock = defaultdict(list)
+        for detail_in_stock in details_in_stock_query:
+            details_in_stock[detail_in_stock.detail_id].append(detail_in_stock)
+
+        if self.append_only:
+            self._subtract_pending_entries(planned_details, details_in_stock)
+
+        return AllocationSnapshot(
+            tasks=tasks,
+            planned_details=dict(planned_details),
+            details_in_stock=dict(details_in_stock),
+            similar_details=dict(similar_details),
+        )
+
+    def plan(self, snapshot: AllocationSnapshot) -> AllocationPlan:
+        """
+        Compute the allocation plan in memory.
+        """
+        return self.solver.solve(snapshot)
+
+    def apply(self, snapshot: AllocationSnapshot, plan: AllocationPlan):
+        """
+        Write the plan to the database with bulk updates.
+        """
+        self._apply_quantities(plan)
+        self._apply_statuses(snapshot.tasks, plan)
+
+    def _lock_stock(self, detail_in_stock_ids: Iterable[int]) -> dict[int, int]:
+        """
+        Lock stock rows in id order like every other allocation path, their current quantity per id.
+        """
+        detail_in_stock_ids = sorted(detail_in_stock_ids)
+        if not detail_in_stock_ids:
+            return {}
+        quantities = dict(
+            DetailInStock.objects.using(self.using)
+            .filter(id__in=detail_in_stock_ids)
+            .order_by('id')
+            .select_for_update()
+            .values_list('id', 'quantity'),
+        )
+        if self.append_only:
+            pending = self.allocation_entry_dao.get_pending_quantities(
+                'detail_in_stock_id',
+                detail_in_stock_ids,
+                using=self.using,
+            )
+            quantities = {row_id: quantity - pending.get(row_id, 0) for row_id, quantity in quantities.items()}
+        return quantities
+
+    def _subtract_pending_entries(
+            self,
+            planned_details: dict[int, list[PlannedDetail]],
+            details_in_stock: dict[int, list[DetailInStock]],
+    ):
+        """
+        Bring loaded counters up to date with the pending ledger entries.
+        """
+        planned_detail_list = [item for items in planned_details.values() for item in items]
+        pending = self.allocation_entry_dao.get_pending_quantities(
+            'planned_detail_id',
+            [planned_detail.id for planned_detail in planned_detail_list],
+            using=self.using,
+        )
+        for planned_detail in planned_detail_list:
+            planned_detail.quantity_in_stock += pending.get(planned_detail.id, 0)
+
+        detail_in_stock_list = [item for items in details_in_stock.values() for item in items]
+        pending = self.allocation_entry_dao.get_pending_quantities(
+            'detail_in_stock_id',
+            [detail_in_stock.id for detail_in_stock in detail_in_stock_list],
+            using=self.using,
+        )
+        for detail_in_stock in detail_in_stock_list:
+            detail_in_stock.quantity -= pending.get(detail_in_stock.id, 0)
+
+    def _apply_quantities(self, plan: AllocationPlan):
+        # stock writes and pending entries update the totals of their details, locked in detail order first
+        self.detail_stock_total_dao.lock(
+            [detail_in_stock.detail_id for detail_in_stock in plan.details_in_stock.values()],
+            using=self.using,
+        )
+        if not self.append_only:
+            PlannedDetail.objects.using(self.using).bulk_update(
+                plan.planned_details.values(),
+                ['quantity_in_stock'],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            DetailInStock.objects.using(self.using).bulk_update(
+                plan.details_in_stock.values(),
+                ['quantity'],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            stock_availability_cache.invalidate()
+        self.allocation_entry_dao.record(
+            plan.allocations,
+            compacted=not self.append_only,
+            using=self.using,
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+    def _set_statuses_from_planned_details(self, tasks: list[Task], plan: AllocationPlan):
+        """
+        Replace the solver's task statuses with the state of all planned details of the tasks.
+        """
+        task_ids = [task.id for task in tasks]
+        planned_details = PlannedDetail.objects.using(self.using).filter(task_id__in=task_ids)
+        if self.append_only:
+            planned_details = self.allocation_entry_dao.annotate_pending_quantity(planned_details).filter(
+                planned_quantity__gt=F('quantity_in_stock') + F('pending_quantity'),
+            )
+        else:
+            planned_details = planned_details.filter(quantity_in_stock__lt=F('planned_quantity'))
+        short_task_ids = set(planned_details.order_by().values_list('task_id', flat=True).distinct())
+        plan.completed_task_ids = [task_id for task_id in task_ids if task_id not in short_task_ids]
+        plan.in_progress_task_ids = [task_id for task_id in task_ids if task_id in short_task_ids]
+
+    def _apply_statuses(self, tasks: Iterable[Task], plan: AllocationPlan):
+        statuses = {task_id: Task.Status.IN_PROGRESS for task_id in plan.in_progress_task_ids}
+        statuses.update({task_id: Task.Status.COMPLETED for task_id in plan.completed_task_ids})
+        for status in (Task.Status.IN_PROGRESS, Task.Status.COMPLETED):
+            task_ids = [task_id for task_id, task_status in statuses.items() if task_status == status]
+            if task_ids:
+                Task.objects.using(self.using).filter(id__in=task_ids).update(status=status, updated_at=timezone.now())
+        for task in tasks:
+            task.status = statuses.get(task.id, task.status)
+
+
+class ShardedAllocationPlanner(AllocationPlanner):
+    """
+    Allocates every connected component of the similar details graph in its own transaction.
+
+    Components come from Detail.substitution_group. Stock only flows between similar
+    details, so components never compete for the same stock rows and are allocated
+    in parallel, one thread and connection per component. A component whose transaction
+    fails is rolled back alone and ComponentAllocationError is raised once the others are written.
+    A task with planned details in several components is COMPLETED only if it was
+    completed in each of them; statuses are written once all components have finished.
+
+    The solver only sees the planned details of a task in the component at hand, so rules that
+    look at the whole task, like the fully allocatable first pass of the greedy solver, are applied
+    per component. For tasks spanning several components the result can differ from AllocationPlanner:
+    a task that can't be covered in one component still takes stock first in the others.
+    """
+
+    def __init__(
+            self,
+            solver: BaseAllocationSolver | None = None,
+            using: str = DEFAULT_DB_ALIAS,
+            workers: int = 1,
+            append_only: bool = False,
+    ):
+        super().__init__(solver=solver, using=using, append_only=append_only)
+        self.workers = workers
+
+    def allocate(self, tasks: Iterable[Task]) -> AllocationPlan:
+        tasks = list(tasks)
+        with count_queries(self.using) as counter:
+            components, task_components = self.get_components(tasks)
+
+        component_tasks = [[] for _ in components]
+        for task in tasks:
+            for index in task_components.get(task.id, ()):
+                component_tasks[index].append(task)
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(self._allocate_component_in_thread, component_tasks[index], component)
+                    for index, component in enumerate(components)
+                ]
+                # a failed transaction fails its component only, anything else is a bug and is raised right away
+                results = []
+                for future in futures:
+                    error = future.exception()
+                    results.append(error if isinstance(error, DatabaseError) else future.result())
+        else:
+            results = []
+            for index, component in enumerate(components):
+                try:
+                    results.append(self._allocate_component(component_tasks[index], component))
+                except DatabaseError as error:
+                    results.append(error)
+
+        plan = AllocationPlan()
+        failed_components = {}
+        completions = defaultdict(int)
+        for index, result in enumerate(results):
+            if isinstance(result, DatabaseError):
+                logger.error("Allocation of component %s failed: %s", sorted(components[index]), result)
+                failed_components[index] = result
+                continue
+            plan.merge(result)
+            for task_id in result.completed_task_ids:
+                completions[task_id] += 1
+
+        plan.completed_task_ids = []
+        plan.in_progress_task_ids = []
+        for task in tasks:
+            indexes = task_components.get(task.id, set())
+            if indexes & failed_components.keys():
+                continue
+            if completions[task.id] == len(indexes):
+                plan.completed_task_ids.append(task.id)
+            else:
+                plan.in_progress_task_ids.append(task.id)
+
+        with count_queries(self.using) as status_counter, transaction.atomic(using=self.using):
+            self._apply_statuses(tasks, plan)
+        plan.query_count += counter.count + status_counter.count
+
+        logger.info(
+            "Allocated %s pcs for %s tasks (%s completed) in %s components, %s queries",
+            plan.allocated_quantity,
+            len(tasks),
+            len(plan.completed_task_ids),
+            len(components),
+            plan.query_count,
+        )
+        if failed_components:
+            index, error = next(iter(failed_components.items()))
+            raise ComponentAllocationError(components[index]) from error
+        return plan
+
+    def get_components(self, tasks: list[Task]) -> tuple[list[set[int]], dict[int, set[int]]]:
+        """
+        Planned details of tasks grouped by Detail.substitution_group, and the component indexes of every task.
+        """
+        planned_details = (
+            PlannedDetail.objects.using(self.using)
+            .filter(task_id__in=[task.id for task in tasks], quantity_in_stock__lt=F('planned_quantity'))
+            .values_list(
+                'task_id',
+                'detail_id',
+                Coalesce('detail__substitution_group', 'detail_id', output_field=BigIntegerField()),
+            )
+        )
+
+        component_indexes = {}
+        components = []
+        task_components = defaultdict(set)
+        for task_id, detail_id, substitution_group in planned_details:
+            if substitution_group not in component_indexes:
+                component_indexes[substitution_group] = len(components)
+                components.append(set())
+            index = component_indexes[substitution_group]
+            components[index].add(detail_id)
+            task_components[task_id].add(index)
+        return components, dict(task_components)
+
+    def _allocate_component(self, tasks: list[Task], detail_ids: set[int]) -> AllocationPlan:
+        with count_queries(self.using) as counter, transaction.atomic(using=self.using):
+            _, plan = self.load_and_plan(tasks, detail_ids=detail_ids)
+            self._apply_quantities(plan)
+        plan.query_count = counter.count
+        return plan
+
+    def _allocate_component_in_thread(self, tasks: list[Task], detail_ids: set[int]) -> AllocationPlan:
+        try:
+            return self._allocate_component(tasks, detail_ids)
+        finally:
+            connections.close_all()
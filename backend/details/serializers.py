@@ -1,13 +1,17 @@
-from details.models import Detail, DetailInStock, PlannedDetail
+from details.models import Detail, DetailInStock, PlannedDetail, WareHouse
 from rest_framework import serializers
+from sa_project.services.sparse_fields import SparseFieldsSerializerMixin
 from tasks.models import Task
 
 
-class BaseDetailSerializer(serializers.ModelSerializer):
+class BaseDetailSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Detail
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at', 'id']
+        expandable_fields = {
+            'similar_details': ('details.serializers.BaseDetailSerializer', {'many': True}),
+        }
 
 
 class CreateDetailSerializer(BaseDetailSerializer):
@@ -18,11 +22,26 @@ class DetailWithSimilarDetailsSerializer(BaseDetailSerializer):
     similar_details = BaseDetailSerializer(many=True, read_only=True)
 
 
-class BasePlannedDetailSerializer(serializers.ModelSerializer):
+class BasePlannedDetailSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PlannedDetail
         fields = '__all__'
         read_only_fields = ['id', 'quantity_in_stock']
+        expandable_fields = {
+            'detail': ('details.serializers.BaseDetailSerializer', {}),
+            'task': ('tasks.serializers.BaseTaskSerializer', {}),
+        }
+
+
+class PlannedDetailWithDetailSerializer(BasePlannedDetailSerializer):
+    detail_name = serializers.CharField(source='detail.name', read_only=True)
+    detail_unit_of_measurement = serializers.CharField(source='detail.unit_of_measurement', read_only=True)
+    detail_price_for_unit = serializers.DecimalField(
+        source='detail.price_for_unit',
+        max_digits=10,
+        decimal_places=2,
+        read_only=True,
+    )
 
 
 class CreatePlannedDetailsSerializer(BasePlannedDetailSerializer):
@@ -30,10 +49,128 @@ class CreatePlannedDetailsSerializer(BasePlannedDetailSerializer):
     task = serializers.PrimaryKeyRelatedField(queryset=Task.objects)
 
 
-class DetailInStockSerializer(serializers.ModelSerializer):
-    detail = BaseDetailSerializer(read_only=True)
+class BulkPlannedDetailListSerializer(serializers.ListSerializer):
+    """
+    Checks the ids the rows reference with one query per model instead of one per row.
+    Errors are returned as a list with the errors of each row at its position.
+    """
+    # (field, source, model) of the referenced ids
+    referenced_fields = [('id', 'id', PlannedDetail), ('detail', 'detail_id', Detail), ('task', 'task_id', Task)]
+    max_rows = 1000
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', self.max_rows)
+        super().__init__(*args, **kwargs)
+
+    def run_child_validation(self, data):
+        # keep the field errors of a row, its references are still checked with the other rows
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            return exc
+
+    def to_internal_value(self, data):
+        rows = super().to_internal_value(data)
+        errors = [row.detail if isinstance(row, serializers.ValidationError) else {} for row in rows]
+        rows = [{} if isinstance(row, serializers.ValidationError) else row for row in rows]
+        for field_name, source, model in self.referenced_fields:
+            ids = {row[source] for row in rows if source in row}
+            if not ids:
+                continue
+            existing_ids = set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+            for row, row_errors in zip(rows, errors):
+                if source in row and row[source] not in existing_ids:
+                    row_errors[field_name] = [
+                        serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist'].format(
+                            pk_value=row[source],
+                        ),
+                    ]
+
+        seen_ids = set()
+        for row, row_errors in zip(rows, errors):
+            if 'id' not in row:
+                continue
+            if row['id'] in seen_ids:
+                row_errors.setdefault('id', []).append('Duplicated planned detail.')
+            seen_ids.add(row['id'])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return rows
+
 
+class BulkCreatePlannedDetailSerializer(BasePlannedDetailSerializer):
+    detail = serializers.IntegerField(source='detail_id')
+    task = serializers.IntegerField(source='task_id')
+
+    class Meta(BasePlannedDetailSerializer.Meta):
+        list_serializer_class = BulkPlannedDetailListSerializer
+
+
+class BulkUpdatePlannedDetailSerializer(BulkCreatePlannedDetailSerializer):
+    id = serializers.IntegerField()
+    detail = serializers.IntegerField(source='detail_id', required=False)
+    task = serializers.IntegerField(source='task_id', required=False)
+
+
+class DetailInStockSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = DetailInStock
         fields = '__all__'
         read_only_fields = ['id']
+        expandable_fields = {
+            'detail': ('details.serializers.BaseDetailSerializer', {}),
+            'warehouse': ('details.serializers.WareHouseSerializer', {}),
+        }
+
+
+class DetailInStockWithDetailSerializer(DetailInStockSerializer):
+    detail = BaseDetailSerializer(read_only=True)
+
+
+class WareHouseSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = WareHouse
+        fields = '__all__'
+
+
+class DetailInStockTotalSerializer(serializers.Serializer):
+    """
+    Stock total of a detail, a warehouse or a substitution group, only the fields of the group are set.
+    """
+    detail = serializers.IntegerField(source='detail_id', required=False)
+    detail_name = serializers.CharField(source='detail__name', required=False)
+    detail_unit_of_measurement = serializers.CharField(source='detail__unit_of_measurement', required=False)
+    warehouse = serializers.IntegerField(source='warehouse_id', required=False)
+    warehouse_name = serializers.CharField(source='warehouse__name', required=False)
+    substitution_group = serializers.IntegerField(source='detail__substitution_group', required=False)
+    total_quantity = serializers.IntegerField()
+    stock_rows = serializers.IntegerField()
+
+
+class DetailInStockTotalQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=['detail', 'warehouse', 'substitution_group'], default='detail')
+
+
+class StockImportResultSerializer(serializers.Serializer):
+    rows = serializers.IntegerField()
+    rejected = serializers.IntegerField()
+    rejected_invalid = serializers.IntegerField()
+    rejected_unknown = serializers.IntegerField()
+    duplicates = serializers.IntegerField()
+    inserted = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    allocation_events = serializers.IntegerField()
+    seconds = serializers.FloatField()
+    rows_per_second = serializers.IntegerField()
+    invalid_lines = serializers.ListField(child=serializers.CharField())
+
+
+class StockAvailabilityRequestSerializer(serializers.Serializer):
+    detail = serializers.IntegerField(source='detail_id', min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class StockAvailabilitySerializer(StockAvailabilityRequestSerializer):
+    own_quantity = serializers.IntegerField()
+    similar_quantity = serializers.IntegerField()
+    shortfall = serializers.IntegerField()
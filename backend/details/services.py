@@ -1,31 +1,140 @@
 import logging
+from collections import defaultdict
 from typing import Iterable
 
+from details.allocation import (
+    Allocation, BaseStockStrategy,
+    FirstFitStockStrategy, StockAccessStats,
+    get_connected_components,
+)
 from details.exceptions import NotEnoughDetail
-from details.models import Detail, DetailInStock, PlannedDetail
-from django.db import transaction
-from django.db.models import F, QuerySet, Sum
+from details.models import (
+    AllocationEntry, AllocationEvent,
+    Detail, DetailInStock, DetailStockTotal,
+    PlannedDetail, WareHouse,
+)
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import BigIntegerField, Count, F, Max, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from sa_project.services.base_dao import BaseDao
-from sa_project.services.helpers import prefetch_related
-
-__all__ = ['DetailDAO', 'PlannedDetailDAO', 'DetailInStockDAO', 'PlannedDetailAllocationService']
+from sa_project.services.cache import VersionedCache
+from sa_project.services.helpers import prefetch_related, select_related
+from sa_project.services.query_budget import query_budget
+
+__all__ = [
+    'detail_cache',
+    'warehouse_cache',
+    'stock_availability_cache',
+    'DetailDAO',
+    'PlannedDetailDAO',
+    'DetailInStockDAO',
+    'WareHouseDAO',
+    'DetailStockTotalDAO',
+    'AllocationEntryDAO',
+    'PlannedDetailAllocationService',
+    'StockAvailabilityService',
+]
 
 from tasks.models import Task
 
 logger = logging.getLogger(__name__)
 
+# catalog reads, invalidated by details.signals on every detail, similar details and warehouse write
+detail_cache = VersionedCache('details')
+warehouse_cache = VersionedCache('warehouses')
+# stock availability per detail, invalidated by details.signals and by every bulk write of stock quantities
+stock_availability_cache = VersionedCache('stock_availability', timeout=settings.STOCK_AVAILABILITY_CACHE_TIMEOUT)
+
 
 class DetailDAO(BaseDao):
     model = Detail
 
-    @prefetch_related(['similar_details'])
+    @prefetch_related(['similar_details__similar_details'])
     def get_all_details_with_similar_details(self) -> QuerySet[Detail]:
         return self.model.objects.all()
 
+    @staticmethod
+    def get_similar_detail_ids_query(detail_ids: Iterable[int]) -> QuerySet:
+        """
+        Subquery of the ids of details similar to any of detail_ids, resolved by the database in the same query.
+        """
+        return (
+            Detail.similar_details.through.objects
+            .filter(from_detail_id__in=detail_ids)
+            .values('to_detail_id')
+        )
+
+    def get_eligible_stock_filter(self, detail_ids: Iterable[int], using_similar: bool = True) -> Q:
+        """
+        Filter for DetailInStock rows that can cover planned details of detail_ids:
+        their own stock and, if using_similar, the stock of their similar details.
+        """
+        detail_ids = list(detail_ids)
+        stock_filter = Q(detail_id__in=detail_ids)
+        if using_similar:
+            stock_filter |= Q(detail_id__in=self.get_similar_detail_ids_query(detail_ids))
+        return stock_filter
+
+    def merge_substitution_groups(self, detail_ids: Iterable[int]) -> int | None:
+        """
+        Put details and everything already grouped with them into one substitution group.
+        """
+        detail_ids = set(detail_ids)
+        group_ids = {
+            substitution_group or detail_id
+            for detail_id, substitution_group in
+            self.model.objects.filter(id__in=detail_ids).values_list('id', 'substitution_group')
+        }
+        if not group_ids:
+            return None
+        group_id = min(group_ids)
+        self.model.objects.filter(
+            Q(id__in=detail_ids) | Q(substitution_group__in=group_ids),
+        ).exclude(substitution_group=group_id).update(substitution_group=group_id, updated_at=timezone.now())
+        return group_id
+
+    def rebuild_substitution_groups(self, group_ids: Iterable[int] | None = None):
+        """
+        Recompute substitution groups from the similar details graph, for the given groups or all details.
+        Each connected component gets the smallest detail id in it as group id.
+        """
+        details = self.model.objects.all()
+        if group_ids is not None:
+            group_ids = list(group_ids)
+            details = details.filter(Q(substitution_group__in=group_ids) | Q(id__in=group_ids))
+        detail_ids = list(details.values_list('id', flat=True))
+
+        similar_details = defaultdict(set)
+        similar_details_query = (
+            Detail.similar_details.through.objects
+            .filter(from_detail_id__in=detail_ids)
+            .values_list('from_detail_id', 'to_detail_id')
+        )
+        for from_detail_id, to_detail_id in similar_details_query:
+            similar_details[from_detail_id].add(to_detail_id)
+
+        for component in get_connected_components(detail_ids, similar_details):
+            group_id = min(component)
+            self.model.objects.filter(id__in=component).exclude(
+                substitution_group=group_id,
+            ).update(substitution_group=group_id, updated_at=timezone.now())
+
 
 class PlannedDetailDAO(BaseDao):
     model = PlannedDetail
 
+    @staticmethod
+    def get_planned_details_with_detail() -> QuerySet[PlannedDetail]:
+        """
+        Planned details joined with the name, unit and price of their detail and nothing else of it.
+        """
+        return PlannedDetail.objects.select_related('detail').only(
+            'id', 'task_id', 'detail_id', 'planned_quantity', 'quantity_in_stock',
+            'detail__name', 'detail__unit_of_measurement', 'detail__price_for_unit',
+        )
+
     @staticmethod
     def get_planned_details_from_task(task: Task) -> QuerySet[PlannedDetail]:
         return (
@@ -33,16 +142,415 @@ class PlannedDetailDAO(BaseDao):
             .select_related('detail')
         ).select_for_update()
 
+    @staticmethod
+    def get_allocation_state_for_export() -> QuerySet:
+        """
+        Planned details with their task and detail, allocated quantity including pending allocation ledger entries.
+        """
+        return (
+            AllocationEntryDAO().annotate_pending_quantity(PlannedDetail.objects.all())
+            .annotate(allocated_quantity=F('quantity_in_stock') + F('pending_quantity'))
+            .annotate(missing_quantity=Greatest(F('planned_quantity') - F('allocated_quantity'), Value(0)))
+            .order_by('id')
+            .values_list(
+                'id', 'task_id', 'task__status', 'task__expected_date', 'detail_id', 'detail__name',
+                'planned_quantity', 'allocated_quantity', 'missing_quantity',
+            )
+        )
+
+    @staticmethod
+    @query_budget(4)
+    def bulk_create_planned_details(rows: list[dict]) -> list[PlannedDetail]:
+        """
+        Insert the planned details with one statement. bulk_create skips post_save,
+        so the allocation events details.signals would queue are created here.
+        """
+        with transaction.atomic():
+            planned_details = PlannedDetail.objects.bulk_create(PlannedDetail(**row) for row in rows)
+            PlannedDetailDAO._enqueue_planned_detail_changes(
+                planned_detail.detail_id for planned_detail in planned_details if planned_detail.planned_quantity > 0
+            )
+        return planned_details
+
+    @staticmethod
+    @query_budget(5)
+    def bulk_update_planned_details(rows: list[dict]) -> list[PlannedDetail]:
+        """
+        Update the planned details of rows, each with its id, with one statement
+        and queue allocation events for raised planned quantities.
+        """
+        with transaction.atomic():
+            planned_details = PlannedDetail.objects.select_for_update().in_bulk([row['id'] for row in rows])
+            changed_fields = set()
+            changed_detail_ids = set()
+            for row in rows:
+                planned_detail = planned_details[row['id']]
+                for field_name, value in row.items():
+                    setattr(planned_detail, field_name, value)
+                changed_fields.update(row.keys() - {'id'})
+                if planned_detail.planned_quantity > planned_detail._loaded_planned_quantity:
+                    changed_detail_ids.add(planned_detail.detail_id)
+                planned_detail._loaded_planned_quantity = planned_detail.planned_quantity
+            if changed_fields:
+                PlannedDetail.objects.bulk_update(planned_details.values(), sorted(changed_fields))
+            PlannedDetailDAO._enqueue_planned_detail_changes(changed_detail_ids)
+        return [planned_details[row['id']] for row in rows]
+
+    @staticmethod
+    def _enqueue_planned_detail_changes(detail_ids: Iterable[int]):
+        AllocationEvent.objects.bulk_create(
+            AllocationEvent(detail_id=detail_id, reason=AllocationEvent.Reason.PLANNED_DETAIL_CHANGED)
+            for detail_id in sorted(set(detail_ids))
+        )
+
 
 class DetailInStockDAO(BaseDao):
     model = DetailInStock
+    # GROUP BY columns of the stock totals, the key first
+    total_groups = {
+        'detail': ['detail_id', 'detail__name', 'detail__unit_of_measurement'],
+        'warehouse': ['warehouse_id', 'warehouse__name'],
+        'substitution_group': ['detail__substitution_group'],
+    }
+
+    @prefetch_related(['detail__similar_details'])
+    @select_related(['detail', 'warehouse'])
+    def get_details_in_stock_with_detail(self) -> QuerySet[DetailInStock]:
+        return self.model.objects.all()
+
+    def get_totals(self, queryset: QuerySet[DetailInStock], group_by: str) -> QuerySet:
+        """
+        Quantity and number of stock rows of the queryset per detail, warehouse or substitution group,
+        summed by the database. Quantities are net of pending allocation ledger entries, like the export.
+        """
+        columns = self.total_groups[group_by]
+        return (
+            AllocationEntryDAO().annotate_pending_quantity(queryset, 'detail_in_stock_id')
+            .order_by()
+            .values(*columns)
+            .annotate(total_quantity=Sum(F('quantity') - F('pending_quantity')), stock_rows=Count('id'))
+            .order_by(columns[0])
+        )
+
+    @staticmethod
+    def get_stock_for_export() -> QuerySet:
+        """
+        Stock rows with their detail and warehouse, quantity net of pending allocation ledger entries.
+        """
+        return (
+            AllocationEntryDAO().annotate_pending_quantity(DetailInStock.objects.all(), 'detail_in_stock_id')
+            .annotate(available_quantity=F('quantity') - F('pending_quantity'))
+            .order_by('id')
+            .values_list(
+                'id', 'detail_id', 'detail__name', 'detail__unit_of_measurement',
+                'warehouse_id', 'warehouse__name', 'available_quantity',
+            )
+        )
+
+
+class WareHouseDAO(BaseDao):
+    model = WareHouse
+
+
+class DetailStockTotalDAO(BaseDao):
+    """
+    Reads of the per-detail stock totals kept up to date by the details_detailinstock and
+    details_allocationentry triggers, net of pending allocation ledger entries.
+    """
+    model = DetailStockTotal
+
+    def get_available_quantity_expression(self, detail_field: str, using_similar: bool = True) -> Coalesce:
+        """
+        Expression for the quantity in stock for the detail referenced by detail_field of the outer query,
+        its own stock plus the stock of its similar details.
+        """
+        own_quantity = self.model.objects.filter(detail_id=OuterRef(detail_field)).values('quantity')
+        available = Coalesce(Subquery(own_quantity), Value(0))
+        if using_similar:
+            similar_quantity = (
+                Detail.similar_details.through.objects
+                .filter(from_detail_id=OuterRef(detail_field))
+                .order_by()
+                .values('from_detail_id')
+                .annotate(total=Sum('to_detail__stock_total__quantity'))
+                .values('total')
+            )
+            available = available + Coalesce(Subquery(similar_quantity), Value(0))
+        return available
+
+    def get_group_quantity_expression(self, group_field: str) -> Coalesce:
+        """
+        Expression for the quantity in stock of the substitution group referenced by group_field of the outer query.
+        """
+        group_quantity = (
+            self.model.objects
+            .filter(detail__substitution_group=OuterRef(group_field))
+            .order_by()
+            .values('detail__substitution_group')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return Coalesce(Subquery(group_quantity), Value(0))
+
+    def get_available_quantities(self, detail_ids: Iterable[int], using_similar: bool = True) -> dict[int, int]:
+        """
+        Quantity in stock per detail, its own stock plus the stock of its similar details, in one query.
+        """
+        return dict(
+            Detail.objects.filter(id__in=set(detail_ids))
+            .annotate(available_quantity=self.get_available_quantity_expression('id', using_similar))
+            .values_list('id', 'available_quantity'),
+        )
+
+    @query_budget(1)
+    def get_own_and_similar_quantities(self, detail_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
+        """
+        (own quantity, quantity of the similar details) in stock per existing detail, in one grouped query.
+        """
+        return {
+            detail_id: (own_quantity, similar_quantity)
+            for detail_id, own_quantity, similar_quantity in (
+                Detail.objects.filter(id__in=set(detail_ids))
+                .order_by()
+                .values('id')
+                .annotate(
+                    own_quantity=Coalesce(Max('stock_total__quantity'), Value(0)),
+                    similar_quantity=Coalesce(Sum('similar_details__stock_total__quantity'), Value(0)),
+                )
+                .values_list('id', 'own_quantity', 'similar_quantity')
+            )
+        }
+
+    def get_total_quantity(self, detail_ids: Iterable[int], using_similar: bool = True) -> int:
+        """
+        Quantity of all stock that can cover planned details of detail_ids, every stock row counted once.
+        """
+        total_quantity = self.model.objects.filter(
+            DetailDAO().get_eligible_stock_filter(detail_ids, using_similar),
+        ).aggregate(total_quantity=Sum('quantity'))
+        return total_quantity['total_quantity'] or 0
+
+    def lock(self, detail_ids: Iterable[int], using: str = DEFAULT_DB_ALIAS) -> None:
+        """
+        Lock the totals of the details in detail_id order before their stock rows or pending entries are written.
+        The triggers lock them in the order rows are written, so two writers of the same details could deadlock.
+        """
+        detail_ids = sorted(set(detail_ids))
+        if detail_ids:
+            list(
+                self.model.objects.using(using)
+                .filter(detail_id__in=detail_ids)
+                .order_by('detail_id')
+                .select_for_update()
+                .values_list('detail_id', flat=True),
+            )
+
+    def get_group_quantities(self, substitution_groups: Iterable[int]) -> dict[int, int]:
+        """
+        Quantity in stock per substitution group, an upper bound for anything planned in the group.
+        """
+        return dict(
+            self.model.objects
+            .filter(detail__substitution_group__in=substitution_groups)
+            .order_by()
+            .values_list('detail__substitution_group')
+            .annotate(total=Sum('quantity')),
+        )
+
+
+class AllocationEntryDAO(BaseDao):
+    """
+    Append-only allocation ledger.
+
+    Allocating only inserts entries; the counters on DetailInStock and PlannedDetail
+    are brought up to date by compact, which folds pending entries in with one
+    grouped UPDATE per table.
+    """
+    model = AllocationEntry
+
+    def record(
+            self,
+            allocations: Iterable[Allocation],
+            compacted: bool = False,
+            using: str = DEFAULT_DB_ALIAS,
+            batch_size: int = 1000,
+    ) -> list[AllocationEntry]:
+        """
+        Insert an entry per allocation, compacted if the counters were already updated by the caller.
+        Pending entries take their quantity off the stock totals, so they invalidate the stock availability.
+        """
+        compacted_at = timezone.now() if compacted else None
+        entries = self.model.objects.using(using).bulk_create(
+            [
+                self.model(
+                    task_id=allocation.task_id,
+                    planned_detail_id=allocation.planned_detail_id,
+                    detail_in_stock_id=allocation.detail_in_stock_id,
+                    quantity=allocation.quantity,
+                    compacted_at=compacted_at,
+                )
+                for allocation in allocations
+            ],
+            batch_size=batch_size,
+        )
+        if entries and not compacted:
+            stock_availability_cache.invalidate()
+        return entries
+
+    def get_pending_quantities(
+            self,
+            field_name: str,
+            ids: Iterable[int],
+            using: str = DEFAULT_DB_ALIAS,
+    ) -> dict[int, int]:
+        """
+        Sum of pending entries per detail_in_stock_id or planned_detail_id.
+        """
+        return dict(
+            self.model.objects.using(using)
+            .filter(compacted_at__isnull=True, **{f'{field_name}__in': ids})
+            .order_by()
+            .values_list(field_name)
+            .annotate(total=Sum('quantity'))
+        )
+
+    def annotate_pending_quantity(self, queryset: QuerySet, field_name: str = 'planned_detail_id') -> QuerySet:
+        """
+        Add pending_quantity, the stock taken by the planned detail that is not in quantity_in_stock yet,
+        or with field_name='detail_in_stock_id' the stock taken from the row that is still in its quantity.
+        """
+        pending_query = (
+            self.model.objects
+            .filter(**{field_name: OuterRef('id')}, compacted_at__isnull=True)
+            .order_by()
+            .values(field_name)
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return queryset.annotate(pending_quantity=Coalesce(Subquery(pending_query), Value(0)))
+
+    def compact(
+            self,
+            entry_ids: Iterable[int] | None = None,
+            using: str = DEFAULT_DB_ALIAS,
+            batch_size: int = 1000,
+    ) -> int:
+        """
+        Fold pending entries into the counters, batch_size entries per transaction.
+        Entries are claimed with SKIP LOCKED, so concurrent compactions never apply an entry twice.
+        """
+        pending = self.model.objects.using(using).filter(compacted_at__isnull=True)
+        if entry_ids is not None:
+            pending = pending.filter(id__in=entry_ids)
+
+        compacted = 0
+        while True:
+            with transaction.atomic(using=using):
+                ids = list(
+                    pending.select_for_update(skip_locked=True)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:batch_size],
+                )
+                if not ids:
+                    return compacted
+                entries = self.model.objects.filter(id__in=ids)
+                self._lock_counters(entries.values('planned_detail_id'), entries.values('detail_in_stock_id'), using)
+                for model, field_name, sign in (
+                        (DetailInStock, 'detail_in_stock_id', -1),
+                        (PlannedDetail, 'planned_detail_id', 1),
+                ):
+                    total_query = (
+                        self.model.objects
+                        .filter(id__in=ids, **{field_name: OuterRef('id')})
+                        .order_by()
+                        .values(field_name)
+                        .annotate(total=Sum('quantity'))
+                        .values('total')
+                    )
+                    counter = 'quantity' if model is DetailInStock else 'quantity_in_stock'
+                    model.objects.using(using).filter(
+                        id__in=self.model.objects.filter(id__in=ids).values(field_name),
+                    ).update(**{counter: F(counter) + sign * Subquery(total_query)})
+                self.model.objects.using(using).filter(id__in=ids).update(compacted_at=timezone.now())
+            compacted += len(ids)
+            stock_availability_cache.invalidate()
+
+    @staticmethod
+    def _lock_counters(planned_detail_ids: Iterable[int], detail_in_stock_ids: Iterable[int], using: str):
+        """
+        Lock the counters entries are written for in the order the planner locks them:
+        planned details and stock rows by id, then the stock totals by detail.
+        """
+        list(
+            PlannedDetail.objects.using(using)
+            .filter(id__in=planned_detail_ids)
+            .order_by('id')
+            .select_for_update()
+            .values_list('id', flat=True),
+        )
+        detail_ids = list(
+            DetailInStock.objects.using(using)
+            .filter(id__in=detail_in_stock_ids)
+            .order_by('id')
+            .select_for_update()
+            .values_list('detail_id', flat=True),
+        )
+        DetailStockTotalDAO().lock(detail_ids, using=using)
+
+    def revert_task(self, task_id: int, using: str = DEFAULT_DB_ALIAS) -> list[AllocationEntry]:
+        """
+        Give back everything the task still holds from the ledger as pending negative entries.
+        """
+        balances = (
+            self.model.objects.using(using)
+            .filter(task_id=task_id)
+            .order_by()
+            .values_list('planned_detail_id', 'detail_in_stock_id')
+            .annotate(total=Sum('quantity'))
+            .filter(total__gt=0)
+        )
+        balances = list(balances)
+        self._lock_counters(
+            [planned_detail_id for planned_detail_id, _, _ in balances],
+            [detail_in_stock_id for _, detail_in_stock_id, _ in balances],
+            using,
+        )
+        return self.record(
+            [
+                Allocation(
+                    task_id=task_id,
+                    planned_detail_id=planned_detail_id,
+                    detail_in_stock_id=detail_in_stock_id,
+                    quantity=-total,
+                )
+                for planned_detail_id, detail_in_stock_id, total in balances
+            ],
+            using=using,
+        )
 
 
 class PlannedDetailAllocationService:
     """
     Service for handling the allocation of planned details from stock.
+
+    The stock strategy chooses the rows a planned detail is taken from. Candidate rows
+    are read without locks and only the chosen ones are locked, so a strategy that
+    touches fewer rows also takes fewer locks; stock_access_stats counts both.
+
+    Like the planner, pending ledger entries are taken into account and every allocation
+    is recorded in the ledger, compacted since the counters are updated right away.
     """
 
+    def __init__(
+            self,
+            stock_strategy: BaseStockStrategy | None = None,
+            allocation_entry_dao: AllocationEntryDAO | None = None,
+    ):
+        self.stock_strategy = stock_strategy or FirstFitStockStrategy()
+        self.stock_access_stats = StockAccessStats()
+        self.allocation_entry_dao = allocation_entry_dao or AllocationEntryDAO()
+
+    @query_budget(2, per_item=13)
     def allocated_batch_planned_details(
             self,
             planned_details: Iterable[PlannedDetail],
@@ -56,6 +564,7 @@ class PlannedDetailAllocationService:
             for planned_detail in planned_details:
                 self.allocate_planned_detail(planned_detail, allocate_from_using_similar, raise_not_enough)
 
+    @query_budget(13)
     def allocate_planned_detail(
             self,
             planned_detail: PlannedDetail,
@@ -65,24 +574,24 @@ class PlannedDetailAllocationService:
         """
         Allocate a single planned detail from stock.
         """
-
-        # can't prefetch select for update
-        details_in_stock = (
-            DetailInStock.objects.filter(detail=planned_detail.detail)
-            .filter(quantity__gt=0)
-            .only('quantity')
-            .select_for_update()
-        )
+        # the stock pending entries already gave the planned detail counts as allocated until the counters are written
+        pending_quantity = self.allocation_entry_dao.get_pending_quantities(
+            'planned_detail_id',
+            [planned_detail.id],
+        ).get(planned_detail.id, 0)
+        planned_detail.quantity_in_stock += pending_quantity
+        allocations = []
 
         # Allocate from stock
-        to_update_details_in_stock = self._allocate_from_stock(
+        to_update_details_in_stock = self._allocate_from_chosen_stock(
             planned_detail,
-            details_in_stock,
+            DetailInStock.objects.filter(detail_id=planned_detail.detail_id, quantity__gt=0),
+            allocations,
         )
 
         # Allocate using similar details
         if allocate_from_using_similar and planned_detail.quantity_in_stock < planned_detail.planned_quantity:
-            self._allocate_using_similar_details(planned_detail, to_update_details_in_stock)
+            self._allocate_using_similar_details(planned_detail, to_update_details_in_stock, allocations)
 
         # Check if there are enough details in stock
         if raise_not_enough and planned_detail.quantity_in_stock < planned_detail.planned_quantity:
@@ -93,67 +602,193 @@ class PlannedDetailAllocationService:
                 in_stock_quantity=planned_detail.quantity_in_stock,
             )
 
+        planned_detail.quantity_in_stock -= pending_quantity
+        if not allocations:
+            return
+        DetailStockTotalDAO().lock(detail_in_stock.detail_id for detail_in_stock in to_update_details_in_stock)
         planned_detail.save(update_fields=['quantity_in_stock'])
         DetailInStock.objects.bulk_update(to_update_details_in_stock, ['quantity'])
+        self.allocation_entry_dao.record(allocations, compacted=True)
+        stock_availability_cache.invalidate()
 
     def _allocate_using_similar_details(
             self,
             planned_detail: PlannedDetail,
             to_update_details_in_stock: list[DetailInStock],
+            allocations: list[Allocation],
     ):
         """
         Allocate details using similar details in stock.
         """
-        similar_detail_ids = planned_detail.detail.similar_details.values_list('id', flat=True)
-
-        # can't prefetch select for update
         similar_details_in_stock = DetailInStock.objects.filter(
-            detail__id__in=similar_detail_ids,
+            detail_id__in=DetailDAO.get_similar_detail_ids_query([planned_detail.detail_id]),
             quantity__gt=0,
-        ).only('quantity').select_for_update()
+        )
 
         to_update_details_in_stock.extend(
-            self._allocate_from_stock(planned_detail, similar_details_in_stock),
+            self._allocate_from_chosen_stock(planned_detail, similar_details_in_stock, allocations),
         )
 
+    def _allocate_from_chosen_stock(
+            self,
+            planned_detail: PlannedDetail,
+            details_in_stock: QuerySet[DetailInStock],
+            allocations: list[Allocation],
+    ) -> list[DetailInStock]:
+        """
+        Lock and allocate from the rows chosen by the stock strategy, net of their pending entries.
+        Rows taken by someone else between the read and the lock are replaced by choosing again.
+        """
+        details_in_stock = details_in_stock.only('id', 'detail_id', 'warehouse_id', 'quantity')
+        updated_details_in_stock = []
+        tried_ids = set()
+        while planned_detail.quantity_in_stock < planned_detail.planned_quantity:
+            chosen = self.stock_strategy.choose(
+                details_in_stock.exclude(id__in=tried_ids),
+                planned_detail.planned_quantity - planned_detail.quantity_in_stock,
+            )
+            if not chosen:
+                break
+            chosen_ids = [detail_in_stock.id for detail_in_stock in chosen]
+            tried_ids.update(chosen_ids)
+            # locked in id order like every other allocation path, consumed in the strategy order
+            locked = {
+                detail_in_stock.id: detail_in_stock
+                for detail_in_stock in details_in_stock.filter(id__in=chosen_ids).order_by('id').select_for_update()
+            }
+            self.stock_access_stats.rows_locked += len(locked)
+            pending = self.allocation_entry_dao.get_pending_quantities('detail_in_stock_id', list(locked))
+            for detail_in_stock_id, quantity in pending.items():
+                locked[detail_in_stock_id].quantity -= quantity
+            allocated = self._allocate_from_stock(
+                planned_detail,
+                [locked[detail_in_stock_id] for detail_in_stock_id in chosen_ids if detail_in_stock_id in locked],
+            )
+            for detail_in_stock, quantity in allocated:
+                # back to the counter, the pending entries are still to be compacted
+                detail_in_stock.quantity += pending.get(detail_in_stock.id, 0)
+                allocations.append(Allocation(
+                    task_id=planned_detail.task_id,
+                    planned_detail_id=planned_detail.id,
+                    detail_in_stock_id=detail_in_stock.id,
+                    quantity=quantity,
+                ))
+            self.stock_access_stats.rows_touched += len(allocated)
+            allocated_rows = [detail_in_stock for detail_in_stock, _ in allocated]
+            self.stock_access_stats.warehouse_ids.update(
+                detail_in_stock.warehouse_id for detail_in_stock in allocated_rows
+            )
+            updated_details_in_stock.extend(allocated_rows)
+        return updated_details_in_stock
+
     @staticmethod
     def _allocate_from_stock(
             planned_detail: PlannedDetail,
             in_stock: Iterable[DetailInStock],
-    ) -> list[DetailInStock]:
+    ) -> list[tuple[DetailInStock, int]]:
         """
-        Allocate the required quantity from stock.
+        Allocate the required quantity from stock, the rows taken from with the quantity taken.
         """
         updated_details_in_stock = []
         total_allocated_pcs = planned_detail.quantity_in_stock
         need_to_allocate_pcs = planned_detail.planned_quantity
 
         for detail_in_stock in in_stock:
-            if total_allocated_pcs < need_to_allocate_pcs:
+            if total_allocated_pcs < need_to_allocate_pcs and detail_in_stock.quantity > 0:
                 alloc_pcs = min(detail_in_stock.quantity, need_to_allocate_pcs - total_allocated_pcs)
                 # Allocate the required quantity
                 detail_in_stock.quantity -= alloc_pcs
                 total_allocated_pcs += alloc_pcs
-                updated_details_in_stock.append(detail_in_stock)
+                updated_details_in_stock.append((detail_in_stock, alloc_pcs))
 
         # Update the quantity in stock for the planned detail
         planned_detail.quantity_in_stock = total_allocated_pcs
         return updated_details_in_stock
 
+    @query_budget(1)
     def is_enough_details_in_stock(self, planned_detail: PlannedDetail) -> bool:
         """
         Check if there are enough details in stock for the planned detail.
         """
         return planned_detail.planned_quantity <= self.get_total_quantity_in_stock(planned_detail)
 
+    @query_budget(1)
     def can_full_allocate(self, planned_details: Iterable[PlannedDetail]) -> bool:
         """
         Check if list of planned details can be fully allocated from stock.
+        Every planned detail is checked on its own, with one lookup of the stock totals for the whole list.
+        """
+        planned_details = list(planned_details)
+        available_quantities = DetailStockTotalDAO().get_available_quantities(
+            planned_detail.detail_id for planned_detail in planned_details
+        )
+        return all(
+            planned_detail.planned_quantity <= available_quantities.get(planned_detail.detail_id, 0)
+            for planned_detail in planned_details
+        )
+
+    @staticmethod
+    @query_budget(1)
+    def get_tasks_feasibility(tasks: Iterable[Task], with_contention: bool = True) -> dict[int, bool]:
         """
+        Whether each task can be fully allocated from stock, the planned details read in one query.
 
-        return all(self.is_enough_details_in_stock(planned_detail) for planned_detail in planned_details)
+        With contention tasks are served in deadline order like the allocator does: a task is feasible only
+        if its missing quantity plus the missing quantity of every earlier feasible task fits both in the stock
+        available to the detail (own and similar) and in the stock of the detail's substitution group.
+        Infeasible tasks take nothing, so they don't make later tasks infeasible.
+        Without it every task is checked against the whole stock on its own.
+        """
+        task_ids = [task.id for task in tasks]
+        detail_stock_total_dao = DetailStockTotalDAO()
+        planned_details = (
+            PlannedDetail.objects
+            .filter(task_id__in=task_ids, quantity_in_stock__lt=F('planned_quantity'))
+            .annotate(
+                missing_quantity=F('planned_quantity') - F('quantity_in_stock'),
+                substitution_group_key=Coalesce(
+                    'detail__substitution_group', 'detail_id', output_field=BigIntegerField(),
+                ),
+            )
+            .annotate(
+                available_quantity=detail_stock_total_dao.get_available_quantity_expression('detail_id'),
+                group_quantity=detail_stock_total_dao.get_group_quantity_expression('substitution_group_key'),
+            )
+            .order_by('task__expected_date', 'task_id')
+            .values_list(
+                'task_id', 'detail_id', 'substitution_group_key',
+                'missing_quantity', 'available_quantity', 'group_quantity',
+            )
+        )
+
+        available_quantities, group_quantities = {}, {}
+        task_demands = defaultdict(lambda: (defaultdict(int), defaultdict(int)))
+        for task_id, detail_id, group_key, missing_quantity, available_quantity, group_quantity in planned_details:
+            available_quantities[detail_id] = available_quantity
+            group_quantities[group_key] = group_quantity
+            detail_demand, group_demand = task_demands[task_id]
+            detail_demand[detail_id] += missing_quantity
+            group_demand[group_key] += missing_quantity
+
+        feasibility = dict.fromkeys(task_ids, True)
+        detail_taken, group_taken = defaultdict(int), defaultdict(int)
+        for task_id, (detail_demand, group_demand) in task_demands.items():
+            feasibility[task_id] = all(
+                detail_taken[detail_id] + quantity <= available_quantities[detail_id]
+                for detail_id, quantity in detail_demand.items()
+            ) and all(
+                group_taken[group_key] + quantity <= group_quantities[group_key]
+                for group_key, quantity in group_demand.items()
+            )
+            if with_contention and feasibility[task_id]:
+                for detail_id, quantity in detail_demand.items():
+                    detail_taken[detail_id] += quantity
+                for group_key, quantity in group_demand.items():
+                    group_taken[group_key] += quantity
+        return feasibility
 
     @staticmethod
+    @query_budget(1)
     def get_total_quantity_in_stock_batch(
             planned_details: Iterable[PlannedDetail],
             using_similar: bool = True,
@@ -161,31 +796,64 @@ class PlannedDetailAllocationService:
         """
         Get the total quantity in stock for a list of planned details.
         """
-        detail_ids = []
-        for planned_detail in planned_details:
-            detail_ids.append(planned_detail.detail_id)
-            if using_similar:
-                detail_ids.extend(list(planned_detail.detail.similar_details.values_list('id', flat=True)))
-
-        total_quantity = DetailInStock.objects.filter(
-            detail_id__in=detail_ids,
-            quantity__gt=0,
-        ).aggregate(total_quantity=Sum("quantity"))
-
-        return total_quantity.get("total_quantity") or 0
+        detail_ids = {planned_detail.detail_id for planned_detail in planned_details}
+        return DetailStockTotalDAO().get_total_quantity(detail_ids, using_similar)
 
     @staticmethod
+    @query_budget(1)
     def get_total_quantity_in_stock(planned_detail: PlannedDetail, using_similar: bool = True) -> int:
         """
-        Get the total quantity in stock for a planned detail.
+        Get the total quantity in stock for a planned detail, its own stock included.
         """
-        detail_ids = [planned_detail.detail_id]
-        if using_similar:
-            detail_ids = list(planned_detail.detail.similar_details.values_list("id", flat=True))
+        return DetailStockTotalDAO().get_available_quantities([planned_detail.detail_id], using_similar).get(
+            planned_detail.detail_id, 0,
+        )
 
-        total_quantity = DetailInStock.objects.filter(
-            detail_id__in=detail_ids,
-            quantity__gt=0,
-        ).aggregate(total_quantity=Sum("quantity"))
 
-        return total_quantity.get("total_quantity") or 0
+class StockAvailabilityService:
+    """
+    Answers whether quantities of details can be covered by stock, for many details at once.
+    Stock per detail is cached for a short time, stock writes invalidate it.
+    """
+
+    def __init__(self, detail_stock_total_dao: DetailStockTotalDAO | None = None):
+        self.detail_stock_total_dao = detail_stock_total_dao or DetailStockTotalDAO()
+
+    @query_budget(1)
+    def get_quantities(self, detail_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
+        """
+        (own quantity, similar quantity) per existing detail, the uncached ones read with one query.
+        """
+        detail_ids = set(detail_ids)
+        version = stock_availability_cache.get_version()
+        quantities = {
+            int(detail_id): tuple(value)
+            for detail_id, value in stock_availability_cache.get_many(map(str, detail_ids), version).items()
+        }
+        missing_ids = detail_ids - quantities.keys()
+        if missing_ids:
+            loaded = self.detail_stock_total_dao.get_own_and_similar_quantities(missing_ids)
+            stock_availability_cache.set_many({str(detail_id): value for detail_id, value in loaded.items()}, version)
+            quantities.update(loaded)
+        return quantities
+
+    def check(self, items: list[dict]) -> list[dict | None]:
+        """
+        Own stock, stock of the similar details and shortfall for every {'detail_id', 'quantity'} item,
+        None for unknown details. Every item is checked on its own.
+        """
+        quantities = self.get_quantities(item['detail_id'] for item in items)
+        availability = []
+        for item in items:
+            if item['detail_id'] not in quantities:
+                availability.append(None)
+                continue
+            own_quantity, similar_quantity = quantities[item['detail_id']]
+            availability.append({
+                'detail_id': item['detail_id'],
+                'quantity': item['quantity'],
+                'own_quantity': own_quantity,
+                'similar_quantity': similar_quantity,
+                'shortfall': max(item['quantity'] - own_quantity - similar_quantity, 0),
+            })
+        return availability
@@ -0,0 +1,107 @@
+from details.models import AllocationEvent, Detail, DetailInStock, PlannedDetail, WareHouse
+from details.services import DetailDAO, detail_cache, stock_availability_cache, warehouse_cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+@receiver(post_save, sender=Detail)
+def set_initial_substitution_group(sender, instance: Detail, created: bool, raw: bool, **kwargs):
+    """
+    A new detail is alone in its substitution group until similar details are added.
+    """
+    if created and not raw and instance.substitution_group is None:
+        instance.substitution_group = instance.id
+        Detail.objects.filter(id=instance.id).update(substitution_group=instance.id)
+
+
+@receiver(m2m_changed, sender=Detail.similar_details.through)
+def touch_similar_details(sender, instance: Detail, action: str, pk_set: set[int] | None, **kwargs):
+    """
+    Similar details are part of both details they link, so a change modifies both ends.
+    """
+    if action == 'pre_clear':
+        instance._cleared_similar_detail_ids = list(instance.similar_details.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        detail_ids = {instance.id, *(pk_set or ()), *getattr(instance, '_cleared_similar_detail_ids', ())}
+        Detail.objects.filter(id__in=detail_ids).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Detail)
+def touch_similar_details_of_deleted_detail(sender, instance: Detail, **kwargs):
+    """
+    Deleting a detail cascades its similar details rows away without m2m_changed,
+    so the details it was similar to are touched before they lose it.
+    """
+    Detail.objects.filter(similar_details=instance).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Detail.similar_details.through)
+def update_substitution_groups(sender, instance: Detail, action: str, pk_set: set[int] | None, **kwargs):
+    """
+    Keep Detail.substitution_group in line with the similar details graph.
+    Adding an edge merges two groups, removing edges may split a group.
+    """
+    detail_dao = DetailDAO()
+    if action == 'post_add' and pk_set:
+        instance.substitution_group = detail_dao.merge_substitution_groups({instance.id, *pk_set})
+    elif action in ('post_remove', 'post_clear'):
+        group_id = Detail.objects.filter(id=instance.id).values_list('substitution_group', flat=True).first()
+        detail_dao.rebuild_substitution_groups([group_id or instance.id])
+        instance.substitution_group = Detail.objects.filter(
+            id=instance.id,
+        ).values_list('substitution_group', flat=True).first()
+
+
+@receiver(post_save, sender=DetailInStock)
+def enqueue_stock_increase(sender, instance: DetailInStock, created: bool, raw: bool, **kwargs):
+    """
+    Arriving stock may complete waiting planned details of the detail and of its similar details.
+    """
+    loaded_quantity = 0 if created else getattr(instance, '_loaded_quantity', None)
+    if not raw and (loaded_quantity is None or instance.quantity > loaded_quantity):
+        AllocationEvent.objects.create(detail_id=instance.detail_id, reason=AllocationEvent.Reason.STOCK_INCREASED)
+    instance._loaded_quantity = instance.quantity
+
+
+@receiver(post_save, sender=PlannedDetail)
+def enqueue_planned_detail_change(sender, instance: PlannedDetail, created: bool, raw: bool, **kwargs):
+    """
+    A new or raised planned detail may be covered by stock that is already there.
+    """
+    loaded_planned_quantity = 0 if created else getattr(instance, '_loaded_planned_quantity', None)
+    if not raw and (loaded_planned_quantity is None or instance.planned_quantity > loaded_planned_quantity):
+        AllocationEvent.objects.create(
+            detail_id=instance.detail_id,
+            reason=AllocationEvent.Reason.PLANNED_DETAIL_CHANGED,
+        )
+    instance._loaded_planned_quantity = instance.planned_quantity
+
+
+@receiver(post_save, sender=Detail)
+@receiver(post_delete, sender=Detail)
+@receiver(m2m_changed, sender=Detail.similar_details.through)
+def invalidate_detail_cache(sender, **kwargs):
+    """
+    Cached detail reads nest similar details, so any detail or similar details write drops them all.
+    """
+    if not kwargs.get('raw') and kwargs.get('action', 'post_save').startswith('post_'):
+        detail_cache.invalidate()
+
+
+@receiver(post_save, sender=WareHouse)
+@receiver(post_delete, sender=WareHouse)
+def invalidate_warehouse_cache(sender, **kwargs):
+    if not kwargs.get('raw'):
+        warehouse_cache.invalidate()
+
+
+@receiver(post_save, sender=DetailInStock)
+@receiver(post_delete, sender=DetailInStock)
+@receiver(m2m_changed, sender=Detail.similar_details.through)
+def invalidate_stock_availability_cache(sender, **kwargs):
+    """
+    Availability sums the stock of a detail and of its similar details.
+    """
+    if not kwargs.get('raw') and kwargs.get('action', 'post_save').startswith('post_'):
+        stock_availability_cache.invalidate()
@@ -0,0 +1,227 @@
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from details.models import AllocationEntry, AllocationEvent, Detail, DetailInStock, DetailStockTotal, WareHouse
+from details.services import stock_availability_cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from sa_project.services.helpers import copy_rows
+
+__all__ = ['STOCK_IMPORT_FORMATS', 'StockImportResult', 'StockImportService']
+
+STOCK_IMPORT_FORMATS = ('csv', 'ndjson')
+STOCK_IMPORT_COLUMNS = ('detail', 'warehouse', 'quantity')
+MAX_INVALID_LINE_SAMPLES = 10
+MAX_BIGINT = 2 ** 63 - 1
+MAX_QUANTITY = 2 ** 31 - 1
+
+STAGING_TABLE = 'details_stock_import'
+
+CREATE_STAGING_TABLE = f"""
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+    line bigint NOT NULL,
+    detail_id bigint NOT NULL,
+    warehouse_id bigint NOT NULL,
+    quantity integer NOT NULL
+) ON COMMIT DROP
+"""
+
+# pending ledger entries are only written for locked stock rows, so the pending quantities the upsert
+# nets in stay put until commit. Totals are locked in detail order like every other stock writer does.
+LOCK_STAGED_STOCK = f"""
+SELECT t.id FROM {DetailInStock._meta.db_table} t
+WHERE EXISTS (SELECT 1 FROM {STAGING_TABLE} s WHERE s.detail_id = t.detail_id AND s.warehouse_id = t.warehouse_id)
+ORDER BY t.id
+FOR UPDATE
+"""
+LOCK_STAGED_TOTALS = f"""
+SELECT detail_id FROM {DetailStockTotal._meta.db_table}
+WHERE detail_id IN (SELECT detail_id FROM {STAGING_TABLE})
+ORDER BY detail_id
+FOR UPDATE
+"""
+
+# the last line of a (detail, warehouse) wins. Stock is not unique by (detail, warehouse),
+# the lowest id row of the pair gets the quantity and the other rows of the pair are emptied.
+# The imported quantity is what is left after every allocation, so the pending entries of a row are added
+# to its counter and compacting them later ends at the imported quantity (or above it, when pending
+# give-backs are larger than the imported quantity and the counter stops at 0).
+# Bulk SQL skips post_save, so the allocation events details.signals would queue are inserted here.
+UPSERT_STOCK = f"""
+WITH staged AS (
+    SELECT DISTINCT ON (s.detail_id, s.warehouse_id) s.detail_id, s.warehouse_id, s.quantity
+    FROM {STAGING_TABLE} s
+    JOIN {Detail._meta.db_table} d ON d.id = s.detail_id
+    JOIN {WareHouse._meta.db_table} w ON w.id = s.warehouse_id
+    ORDER BY s.detail_id, s.warehouse_id, s.line DESC
+), existing AS (
+    SELECT
+        t.id, t.detail_id, t.warehouse_id, t.quantity,
+        GREATEST(
+            CASE WHEN t.id = MIN(t.id) OVER (PARTITION BY t.detail_id, t.warehouse_id) THEN staged.quantity ELSE 0 END
+                + COALESCE((
+                    SELECT SUM(e.quantity) FROM {AllocationEntry._meta.db_table} e
+                    WHERE e.detail_in_stock_id = t.id AND e.compacted_at IS NULL
+                ), 0),
+            0
+        ) AS new_quantity
+    FROM {DetailInStock._meta.db_table} t
+    JOIN staged ON staged.detail_id = t.detail_id AND staged.warehouse_id = t.warehouse_id
+), updated AS (
+    UPDATE {DetailInStock._meta.db_table} t
+    SET quantity = existing.new_quantity
+    FROM existing
+    WHERE t.id = existing.id AND t.quantity <> existing.new_quantity
+    RETURNING t.detail_id, t.quantity - existing.quantity AS increase
+), inserted AS (
+    INSERT INTO {DetailInStock._meta.db_table} (detail_id, warehouse_id, quantity)
+    SELECT staged.detail_id, staged.warehouse_id, staged.quantity
+    FROM staged
+    WHERE NOT EXISTS (
+        SELECT 1 FROM existing
+        WHERE existing.detail_id = staged.detail_id AND existing.warehouse_id = staged.warehouse_id
+    )
+    RETURNING detail_id, quantity AS increase
+), events AS (
+    INSERT INTO {AllocationEvent._meta.db_table} (detail_id, reason, created_at)
+    SELECT DISTINCT changed.detail_id, %s, now()
+    FROM (SELECT * FROM updated UNION ALL SELECT * FROM inserted) changed
+    WHERE changed.increase > 0
+    RETURNING id
+)
+SELECT
+    (SELECT count(*) FROM {STAGING_TABLE}),
+    (SELECT count(*) FROM staged),
+    (SELECT count(*) FROM updated),
+    (SELECT count(*) FROM inserted),
+    (SELECT count(*) FROM events),
+    (
+        SELECT count(*) FROM {STAGING_TABLE} s
+        WHERE NOT EXISTS (SELECT 1 FROM {Detail._meta.db_table} d WHERE d.id = s.detail_id)
+            OR NOT EXISTS (SELECT 1 FROM {WareHouse._meta.db_table} w WHERE w.id = s.warehouse_id)
+    )
+"""
+
+
+def _parse_int(value) -> int:
+    if isinstance(value, str):
+        return int(value.strip())
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise TypeError(f"{value!r} is not an integer")
+
+
+@dataclass
+class StockImportResult:
+    rows: int = 0
+    rejected_invalid: int = 0
+    rejected_unknown: int = 0
+    duplicates: int = 0
+    inserted: int = 0
+    updated: int = 0
+    allocation_events: int = 0
+    seconds: float = 0
+    invalid_lines: list[str] = field(default_factory=list)
+
+    @property
+    def rejected(self) -> int:
+        return self.rejected_invalid + self.rejected_unknown
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows / self.seconds) if self.seconds else 0
+
+    def reject_line(self, line: int, error: str):
+        self.rejected_invalid += 1
+        if len(self.invalid_lines) < MAX_INVALID_LINE_SAMPLES:
+            self.invalid_lines.append(f'line {line}: {error}')
+
+    def as_dict(self) -> dict:
+        return {
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'rejected_invalid': self.rejected_invalid,
+            'rejected_unknown': self.rejected_unknown,
+            'duplicates': self.duplicates,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'allocation_events': self.allocation_events,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': self.rows_per_second,
+            'invalid_lines': self.invalid_lines,
+        }
+
+
+class StockImportService:
+    """
+    Import stock dumps of (detail, warehouse, quantity) rows in CSV with a header or NDJSON.
+    Lines are streamed into a temporary table with COPY and upserted into DetailInStock
+    by (detail, warehouse) with one statement, so memory does not grow with the file.
+    """
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def import_stock(self, lines: Iterable[str], file_format: str) -> StockImportResult:
+        if file_format not in STOCK_IMPORT_FORMATS:
+            raise ValueError(f"Unknown stock import format {file_format!r}")
+        result = StockImportResult()
+        started_at = time.perf_counter()
+        rows = self._iter_rows(self._iter_records(lines, file_format, result), result)
+        connection = connections[self.using]
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGING_TABLE)
+            copy_rows(STAGING_TABLE, ['line', 'detail_id', 'warehouse_id', 'quantity'], rows, using=self.using)
+            # concurrent imports of the same new pairs would both insert them, they wait for each other
+            cursor.execute(f'LOCK TABLE {DetailInStock._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(LOCK_STAGED_STOCK)
+            cursor.execute(LOCK_STAGED_TOTALS)
+            cursor.execute(UPSERT_STOCK, [AllocationEvent.Reason.STOCK_INCREASED.value])
+            (
+                staged, valid, result.updated, result.inserted, result.allocation_events, result.rejected_unknown,
+            ) = cursor.fetchone()
+            result.duplicates = staged - result.rejected_unknown - valid
+            if result.updated or result.inserted:
+                stock_availability_cache.invalidate()
+        result.seconds = time.perf_counter() - started_at
+        return result
+
+    @staticmethod
+    def _iter_records(lines: Iterable[str], file_format: str, result: StockImportResult) -> Iterator[tuple[int, dict]]:
+        if file_format == 'csv':
+            reader = csv.DictReader(lines)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                result.rows += 1
+                result.reject_line(line_number, 'invalid JSON')
+                continue
+            yield line_number, record
+
+    @staticmethod
+    def _iter_rows(records: Iterable[tuple[int, dict]], result: StockImportResult) -> Iterator[tuple[int, ...]]:
+        for line_number, record in records:
+            result.rows += 1
+            if not isinstance(record, dict):
+                result.reject_line(line_number, 'not an object')
+                continue
+            try:
+                detail_id, warehouse_id, quantity = (_parse_int(record[column]) for column in STOCK_IMPORT_COLUMNS)
+            except KeyError as exc:
+                result.reject_line(line_number, f'missing {exc.args[0]}')
+                continue
+            except (TypeError, ValueError):
+                result.reject_line(line_number, 'not an integer')
+                continue
+            if not (0 < detail_id <= MAX_BIGINT and 0 < warehouse_id <= MAX_BIGINT and 0 <= quantity <= MAX_QUANTITY):
+                result.reject_line(line_number, 'out of range')
+                continue
+            yield line_number, detail_id, warehouse_id, quantity
@@ -2,9 +2,11 @@ from typing import Type
 
 import factory
 from details.models import Detail, DetailInStock, PlannedDetail, WareHouse
+from django.db.models import F
 from django.utils import timezone
 from faker import Faker
 from tasks.models import Task
+from tasks.synthetic_data import SyntheticDataGenerator
 from tasks.tests.factories import TaskFactory, UserFactory
 
 fake = Faker()
@@ -187,3 +189,39 @@ class TestDetailDataGenerator:
         warehouse_2 = self.warehouse_factory.create()
         self._create_planned_details(tasks, details)
         self._create_details_in_stock(details, [warehouse_1, warehouse_2])
+
+
+def generate_query_budget_data(size: int, planned_details_per_task: int = 3) -> dict:
+    """
+    Synthetic data set with size tasks plus one that has the same shape at every size: the planned
+    details of the first task are in different substitution groups and can never be covered,
+    every detail of these groups has stock and the planned details of the other tasks are empty.
+    """
+    author = SyntheticDataGenerator(
+        tasks=size + 1,
+        planned_details_per_task=planned_details_per_task,
+        details=2 * size + 3 * planned_details_per_task,
+        warehouses=2,
+        stock_rows=3 * size,
+    ).generate()
+    tasks = list(Task.objects.filter(author=author))
+    PlannedDetail.objects.filter(task__in=tasks[1:]).update(planned_quantity=0)
+    planned_details = list(PlannedDetail.objects.filter(task=tasks[0]).order_by('id'))
+    group_details = Detail.objects.filter(id=F('substitution_group')).order_by('id')
+    for planned_detail, detail in zip(planned_details, group_details):
+        planned_detail.detail = detail
+        planned_detail.planned_quantity = 10 ** 6
+    PlannedDetail.objects.bulk_update(planned_details, ['detail', 'planned_quantity'])
+
+    warehouse = WareHouse.objects.first()
+    DetailInStock.objects.bulk_create(
+        DetailInStock(detail=detail, warehouse=warehouse, quantity=1)
+        for detail in Detail.objects.filter(
+            substitution_group__in=[planned_detail.detail.substitution_group for planned_detail in planned_details],
+        )
+    )
+    return {
+        'author': author,
+        'tasks': tasks,
+        'planned_details': list(PlannedDetail.objects.filter(task__in=tasks).order_by('task_id', 'id')),
+    }
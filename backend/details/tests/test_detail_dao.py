@@ -0,0 +1,150 @@
+from details.allocation import Allocation
+from details.models import AllocationEntry, Detail, DetailInStock, DetailStockTotal, PlannedDetail
+from details.services import AllocationEntryDAO, DetailDAO, DetailStockTotalDAO, PlannedDetailAllocationService
+from details.tests.factories import DetailFactory, DetailInStockFactory, PlannedDetailFactory
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestSubstitutionGroups(APITestCase):
+
+    def setUp(self):
+        self.detail_dao = DetailDAO()
+
+    @staticmethod
+    def get_groups(*details: Detail) -> list[int]:
+        groups = dict(Detail.objects.values_list('id', 'substitution_group'))
+        return [groups[detail.id] for detail in details]
+
+    def test_new_detail_has_own_group(self):
+        detail = DetailFactory()
+        self.assertEqual(self.get_groups(detail), [detail.id])
+
+    def test_adding_similar_details_merges_groups(self):
+        detail_a, detail_b, detail_c = DetailFactory.create_batch(3)
+        detail_a.similar_details.add(detail_b)
+        detail_c.similar_details.add(detail_b)
+        self.assertEqual(self.get_groups(detail_a, detail_b, detail_c), [detail_a.id] * 3)
+
+    def test_removing_similar_details_splits_group(self):
+        detail_a, detail_b, detail_c = DetailFactory.create_batch(3)
+        detail_a.similar_details.add(detail_b)
+        detail_b.similar_details.add(detail_c)
+
+        detail_b.similar_details.remove(detail_a)
+        self.assertEqual(self.get_groups(detail_a, detail_b, detail_c), [detail_a.id, detail_b.id, detail_b.id])
+
+        detail_b.similar_details.clear()
+        self.assertEqual(self.get_groups(detail_a, detail_b, detail_c), [detail_a.id, detail_b.id, detail_c.id])
+
+    def test_rebuild_substitution_groups(self):
+        detail_a, detail_b, detail_c = DetailFactory.create_batch(3)
+        detail_c.similar_details.add(detail_b)
+        Detail.objects.update(substitution_group=None)
+
+        self.detail_dao.rebuild_substitution_groups()
+        self.assertEqual(self.get_groups(detail_a, detail_b, detail_c), [detail_a.id, detail_b.id, detail_b.id])
+
+    def test_total_quantity_in_stock_includes_own_stock(self):
+        detail = DetailFactory()
+        similar_detail = DetailFactory(similar_details=[detail])
+        DetailInStockFactory(detail=detail, quantity=3)
+        DetailInStockFactory(detail=similar_detail, quantity=4)
+        planned_detail = PlannedDetail(detail=detail, planned_quantity=7)
+
+        with self.assertNumQueries(1):
+            total_quantity = PlannedDetailAllocationService.get_total_quantity_in_stock(planned_detail)
+        self.assertEqual(total_quantity, 7)
+        self.assertEqual(
+            PlannedDetailAllocationService.get_total_quantity_in_stock(planned_detail, using_similar=False),
+            3,
+        )
+
+
+class TestDetailStockTotals(APITestCase):
+
+    def setUp(self):
+        self.detail_stock_total_dao = DetailStockTotalDAO()
+        self.detail = DetailFactory()
+        self.similar_detail = DetailFactory(similar_details=[self.detail])
+        self.other_detail = DetailFactory()
+
+    @staticmethod
+    def get_totals() -> dict[int, int]:
+        return dict(DetailStockTotal.objects.filter(quantity__gt=0).values_list('detail_id', 'quantity'))
+
+    def test_totals_follow_every_stock_write(self):
+        detail_in_stock = DetailInStockFactory(detail=self.detail, quantity=3)
+        DetailInStockFactory(detail=self.detail, quantity=2)
+        self.assertEqual(self.get_totals(), {self.detail.id: 5})
+
+        detail_in_stock.quantity = 1
+        DetailInStock.objects.bulk_update([detail_in_stock], ['quantity'])
+        DetailInStock.objects.filter(detail=self.detail).update(quantity=F('quantity') + 1)
+        self.assertEqual(self.get_totals(), {self.detail.id: 5})
+
+        detail_in_stock.refresh_from_db()
+        detail_in_stock.detail = self.other_detail
+        detail_in_stock.save()
+        self.assertEqual(self.get_totals(), {self.detail.id: 3, self.other_detail.id: 2})
+
+        detail_in_stock.delete()
+        self.assertEqual(self.get_totals(), {self.detail.id: 3})
+
+    def test_totals_are_net_of_pending_entries(self):
+        detail_in_stock = DetailInStockFactory(detail=self.detail, quantity=5)
+        author, executor = UserFactory.create_batch(2)
+        task = TaskFactory(author=author, executor=executor, expected_date=timezone.now() + timezone.timedelta(days=1))
+        planned_detail = PlannedDetailFactory(task=task, detail=self.detail, planned_quantity=5)
+        allocation_entry_dao = AllocationEntryDAO()
+        allocation_entry_dao.record([
+            Allocation(
+                task_id=task.id,
+                planned_detail_id=planned_detail.id,
+                detail_in_stock_id=detail_in_stock.id,
+                quantity=3,
+            ),
+        ])
+        self.assertEqual(self.get_totals(), {self.detail.id: 2})
+        self.assertFalse(PlannedDetailAllocationService().can_full_allocate([planned_detail]))
+
+        detail_in_stock.detail = self.other_detail
+        detail_in_stock.save()
+        self.assertEqual(self.get_totals(), {self.other_detail.id: 2})
+        detail_in_stock.detail = self.detail
+        detail_in_stock.save()
+
+        allocation_entry_dao.compact()
+        detail_in_stock.refresh_from_db()
+        self.assertEqual(detail_in_stock.quantity, 2)
+        self.assertEqual(self.get_totals(), {self.detail.id: 2})
+
+        allocation_entry_dao.revert_task(task.id)
+        self.assertEqual(self.get_totals(), {self.detail.id: 5})
+        AllocationEntry.objects.filter(compacted_at__isnull=True).delete()
+        self.assertEqual(self.get_totals(), {self.detail.id: 2})
+
+    def test_can_full_allocate_in_one_query(self):
+        DetailInStockFactory(detail=self.detail, quantity=3)
+        DetailInStockFactory(detail=self.similar_detail, quantity=4)
+        planned_details = [
+            PlannedDetail(detail=self.detail, planned_quantity=7),
+            PlannedDetail(detail=self.similar_detail, planned_quantity=7),
+        ]
+        allocation_service = PlannedDetailAllocationService()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(allocation_service.can_full_allocate(planned_details))
+        planned_details.append(PlannedDetail(detail=self.other_detail, planned_quantity=1))
+        self.assertFalse(allocation_service.can_full_allocate(planned_details))
+
+    def test_group_quantities(self):
+        DetailInStockFactory(detail=self.detail, quantity=3)
+        DetailInStockFactory(detail=self.similar_detail, quantity=4)
+        DetailInStockFactory(detail=self.other_detail, quantity=5)
+        self.assertEqual(
+            self.detail_stock_total_dao.get_group_quantities([self.detail.id, self.other_detail.id]),
+            {self.detail.id: 7, self.other_detail.id: 5},
+        )
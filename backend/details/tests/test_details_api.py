@@ -1,6 +1,6 @@
 import json
 
-from details.models import Detail, PlannedDetail
+from details.models import AllocationEvent, Detail, PlannedDetail
 from details.serializers import (
     BasePlannedDetailSerializer,
     CreateDetailSerializer,
@@ -82,6 +82,7 @@ class TestPlannedDetailAPI(APITestCase):
         cls.test_data_generator.generate_test_data()
         cls.list_create_planned_details_view_name = 'list-create-planned-detail'
         cls.retrieve_update_delete_planned_detail_view_name = 'retrieve-update-destroy-planned-detail'
+        cls.bulk_planned_details_view_name = 'bulk-planned-details'
 
     def test_create_planned_detail(self):
         response = self.client.post(
@@ -101,6 +102,18 @@ class TestPlannedDetailAPI(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data.get("results", [])), PlannedDetail.objects.count())
 
+    def test_get_planned_detail_list_by_cursor(self):
+        url = f"{reverse(self.list_create_planned_details_view_name)}?cursor=&limit=2"
+        planned_detail_ids = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            planned_detail_ids.extend(planned_detail['id'] for planned_detail in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(planned_detail_ids, list(PlannedDetail.objects.order_by('id').values_list('id', flat=True)))
+
     def test_get_planned_detail(self):
         planned_detail = PlannedDetail.objects.first()
         response = self.client.get(
@@ -124,3 +137,70 @@ class TestPlannedDetailAPI(APITestCase):
             reverse(self.retrieve_update_delete_planned_detail_view_name, kwargs={'pk': planned_detail.id}),
         )
         self.assertEqual(response.status_code, 204)
+
+    def test_bulk_create_planned_details(self):
+        details = list(Detail.objects.all()[:3])
+        task = Task.objects.first()
+        rows = [{'detail': detail.id, 'task': task.id, 'planned_quantity': 5} for detail in details]
+        AllocationEvent.objects.all().delete()
+        response = self.client.post(reverse(self.bulk_planned_details_view_name), data=rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        created = PlannedDetail.objects.filter(id__in=[row['id'] for row in response.data]).order_by('id')
+        self.assertEqual(response.data, BasePlannedDetailSerializer(created, many=True).data)
+        # bulk_create skips post_save, the allocation events are queued by the DAO
+        self.assertEqual(
+            set(AllocationEvent.objects.values_list('detail_id', flat=True)),
+            {detail.id for detail in details},
+        )
+
+    def test_bulk_create_planned_details_errors_per_row(self):
+        detail = Detail.objects.first()
+        task = Task.objects.first()
+        planned_details_count = PlannedDetail.objects.count()
+        response = self.client.post(
+            reverse(self.bulk_planned_details_view_name),
+            data=[
+                {'detail': detail.id, 'task': task.id, 'planned_quantity': 5},
+                {'detail': 0, 'task': task.id, 'planned_quantity': 5},
+                {'detail': detail.id, 'task': 0, 'planned_quantity': -1},
+            ],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(list(response.data[1]), ['detail'])
+        self.assertEqual(list(response.data[2]), ['planned_quantity'])
+        self.assertEqual(PlannedDetail.objects.count(), planned_details_count)
+
+    def test_bulk_update_planned_details(self):
+        planned_details = list(PlannedDetail.objects.all()[:2])
+        response = self.client.patch(
+            reverse(self.bulk_planned_details_view_name),
+            data=[
+                {'id': planned_details[0].id, 'planned_quantity': 300},
+                {'id': planned_details[1].id, 'planned_quantity': 0},
+            ],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['planned_quantity'] for row in response.data], [300, 0])
+        for planned_detail in planned_details:
+            planned_detail.refresh_from_db()
+        self.assertEqual([planned_detail.planned_quantity for planned_detail in planned_details], [300, 0])
+
+    def test_bulk_update_planned_details_errors_per_row(self):
+        planned_detail = PlannedDetail.objects.first()
+        response = self.client.patch(
+            reverse(self.bulk_planned_details_view_name),
+            data=[
+                {'id': planned_detail.id, 'planned_quantity': 300},
+                {'id': planned_detail.id, 'planned_quantity': 400},
+                {'id': 0, 'planned_quantity': 1},
+            ],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(list(response.data[1]), ['id'])
+        self.assertEqual(list(response.data[2]), ['id'])
+        self.assertNotEqual(PlannedDetail.objects.get(id=planned_detail.id).planned_quantity, 300)
@@ -0,0 +1,111 @@
+from details.allocation import (
+    AllocationSnapshot, FirstFitStockStrategy,
+    GreedyAllocationSolver, LargestFirstStockStrategy,
+    PriorityAllocationSolver, SingleWarehouseStockStrategy,
+    get_weighted_completion,
+)
+from details.models import DetailInStock, PlannedDetail
+from django.test import SimpleTestCase
+from django.utils import timezone
+from tasks.models import Task
+
+
+class TestAllocationSolvers(SimpleTestCase):
+
+    @staticmethod
+    def build_snapshot() -> AllocationSnapshot:
+        """
+        One large task is first in line, two smaller tasks could be completed with the same stock.
+        """
+        expected_date = timezone.now().date() + timezone.timedelta(days=1)
+        tasks = [Task(id=task_id, expected_date=expected_date) for task_id in (1, 2, 3)]
+        return AllocationSnapshot(
+            tasks=tasks,
+            planned_details={
+                1: [PlannedDetail(id=1, task_id=1, detail_id=1, planned_quantity=10)],
+                2: [PlannedDetail(id=2, task_id=2, detail_id=2, planned_quantity=5)],
+                3: [PlannedDetail(id=3, task_id=3, detail_id=2, planned_quantity=5)],
+            },
+            details_in_stock={
+                2: [DetailInStock(id=1, detail_id=2, warehouse_id=1, quantity=10)],
+            },
+            similar_details={1: {2}, 2: {1}},
+        )
+
+    def test_greedy_solver_completes_first_task(self):
+        snapshot = self.build_snapshot()
+        plan = GreedyAllocationSolver().solve(snapshot)
+        self.assertEqual(plan.completed_task_ids, [1])
+        self.assertEqual(plan.in_progress_task_ids, [2, 3])
+
+    def test_priority_solver_completes_more_tasks(self):
+        greedy_snapshot = self.build_snapshot()
+        greedy_plan = GreedyAllocationSolver().solve(greedy_snapshot)
+
+        snapshot = self.build_snapshot()
+        plan = PriorityAllocationSolver().solve(snapshot)
+
+        self.assertEqual(plan.completed_task_ids, [2, 3])
+        self.assertEqual(plan.in_progress_task_ids, [1])
+        self.assertGreater(
+            get_weighted_completion(snapshot, plan),
+            get_weighted_completion(greedy_snapshot, greedy_plan),
+        )
+        for planned_details in snapshot.planned_details.values():
+            for planned_detail in planned_details:
+                if planned_detail.task_id in plan.completed_task_ids:
+                    self.assertEqual(planned_detail.quantity_in_stock, planned_detail.planned_quantity)
+        self.assertEqual(plan.allocated_quantity, 10)
+
+    def test_priority_solver_rolls_back_incomplete_task(self):
+        snapshot = self.build_snapshot()
+        snapshot.planned_details[2].append(PlannedDetail(id=4, task_id=2, detail_id=2, planned_quantity=6))
+        plan = PriorityAllocationSolver().solve(snapshot)
+
+        self.assertEqual(plan.completed_task_ids, [3])
+        self.assertEqual(plan.in_progress_task_ids, [1, 2])
+        self.assertEqual(snapshot.details_in_stock[2][0].quantity, 0)
+        self.assertEqual(snapshot.planned_details[1][0].quantity_in_stock, 5)
+        self.assertEqual([planned_detail.quantity_in_stock for planned_detail in snapshot.planned_details[2]], [0, 0])
+        self.assertEqual(plan.allocated_quantity, 10)
+
+
+class TestStockStrategies(SimpleTestCase):
+
+    def setUp(self):
+        self.rows = [
+            DetailInStock(id=1, detail_id=1, warehouse_id=1, quantity=2),
+            DetailInStock(id=2, detail_id=1, warehouse_id=2, quantity=3),
+            DetailInStock(id=3, detail_id=1, warehouse_id=1, quantity=6),
+            DetailInStock(id=4, detail_id=1, warehouse_id=2, quantity=4),
+            DetailInStock(id=5, detail_id=1, warehouse_id=3, quantity=0),
+        ]
+
+    @staticmethod
+    def get_ids(rows: list[DetailInStock]) -> list[int]:
+        return [row.id for row in rows]
+
+    def test_first_fit(self):
+        self.assertEqual(self.get_ids(FirstFitStockStrategy().choose(self.rows, 6)), [1, 2, 3])
+
+    def test_largest_first(self):
+        strategy = LargestFirstStockStrategy()
+        self.assertEqual(self.get_ids(strategy.choose(self.rows, 4)), [4])
+        self.assertEqual(self.get_ids(strategy.choose(self.rows, 9)), [3, 4])
+
+    def test_single_warehouse(self):
+        strategy = SingleWarehouseStockStrategy()
+        self.assertEqual(self.get_ids(strategy.choose(self.rows, 5)), [3])
+        self.assertEqual(self.get_ids(strategy.choose(self.rows, 7)), [3, 1])
+        self.assertEqual(self.get_ids(strategy.choose(self.rows, 12)), [3, 1, 4])
+
+    def test_solver_uses_stock_strategy(self):
+        snapshot = AllocationSnapshot(
+            tasks=[Task(id=1, expected_date=timezone.now().date())],
+            planned_details={1: [PlannedDetail(id=1, task_id=1, detail_id=1, planned_quantity=4)]},
+            details_in_stock={1: self.rows},
+            similar_details={},
+        )
+        plan = GreedyAllocationSolver(stock_strategy=LargestFirstStockStrategy()).solve(snapshot)
+        self.assertEqual(list(plan.details_in_stock), [4])
+        self.assertEqual(plan.completed_task_ids, [1])
@@ -0,0 +1,69 @@
+from details.services import detail_cache, warehouse_cache
+from details.tests.factories import DetailFactory, WareHouseFactory
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from tasks.tests.factories import UserFactory
+
+
+class TestCatalogCache(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory(is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.detail = DetailFactory(name='Bearing A')
+        self.similar_detail = DetailFactory(name='Bearing B')
+        self.warehouse = WareHouseFactory()
+
+    def get_detail_names(self) -> list[str]:
+        return sorted(detail['name'] for detail in self.client.get(reverse('list-create-detail')).data['results'])
+
+    def test_detail_list_is_cached(self):
+        self.assertEqual(self.get_detail_names(), ['Bearing A', 'Bearing B'])
+        # only the conditional GET fingerprint
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_detail_names(), ['Bearing A', 'Bearing B'])
+
+        stats = detail_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_detail_writes_invalidate(self):
+        detail_url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.detail.id})
+        self.client.get(detail_url)
+        self.get_detail_names()
+
+        self.detail.name = 'Bearing C'
+        self.detail.save()
+        self.assertEqual(self.get_detail_names(), ['Bearing B', 'Bearing C'])
+        self.assertEqual(self.client.get(detail_url).data['name'], 'Bearing C')
+
+        self.detail.similar_details.add(self.similar_detail)
+        detail = next(
+            detail for detail in self.client.get(reverse('list-create-detail')).data['results']
+            if detail['id'] == self.detail.id
+        )
+        self.assertEqual([similar['id'] for similar in detail['similar_details']], [self.similar_detail.id])
+
+        self.similar_detail.delete()
+        self.assertEqual(self.get_detail_names(), ['Bearing C'])
+
+    def test_warehouse_list_is_cached_until_written(self):
+        url = reverse('list-warehouse')
+        self.assertEqual(self.client.get(url).data['count'], 1)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        WareHouseFactory()
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        self.assertEqual(warehouse_cache.get_stats()['misses'], 2)
+
+    def test_cache_stats(self):
+        self.get_detail_names()
+        self.get_detail_names()
+        response = self.client.get(reverse('catalog-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['details']['hits'], response.data['details']['misses']), (1, 1))
+
+        self.client.force_authenticate(UserFactory())
+        self.assertEqual(self.client.get(reverse('catalog-cache-stats')).status_code, 403)
@@ -0,0 +1,75 @@
+import time
+
+from details.tests.factories import DetailFactory
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APITestCase
+from tasks.tests.factories import UserFactory
+
+
+class TestConditionalGet(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.detail = DetailFactory()
+        self.similar_detail = DetailFactory()
+
+    def assertNotModified(self, url: str, response, queries: int = 1):
+        with self.assertNumQueries(queries):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304,
+        )
+
+    def test_detail(self):
+        url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.detail.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified(url, response)
+
+        self.detail.similar_details.add(self.similar_detail)
+        modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data['similar_details'], [self.similar_detail.id])
+        self.assertNotEqual(modified['ETag'], response['ETag'])
+
+    def test_detail_after_similar_detail_deleted(self):
+        self.detail.similar_details.add(self.similar_detail)
+        url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.detail.id})
+        response = self.client.get(url)
+        self.assertEqual(response.data['similar_details'], [self.similar_detail.id])
+
+        self.client.delete(reverse('retrieve-update-destroy-detail', kwargs={'pk': self.similar_detail.id}))
+        modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data['similar_details'], [])
+
+    def test_detail_expand(self):
+        self.detail.similar_details.add(self.similar_detail)
+        url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.detail.id})
+        response = self.client.get(url, {'expand': 'similar_details'})
+        self.assertNotIn('ETag', response)
+
+        # the expanded similar detail changes, the detail itself does not
+        similar_detail_url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.similar_detail.id})
+        self.client.patch(similar_detail_url, {'name': 'Renamed'})
+        later = http_date(time.time() + 3600)
+        modified = self.client.get(url, {'expand': 'similar_details'}, HTTP_IF_MODIFIED_SINCE=later)
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data['similar_details'][0]['name'], 'Renamed')
+
+    def test_detail_list(self):
+        url = reverse('list-create-detail')
+        response = self.client.get(url)
+        self.assertNotModified(url, response)
+
+        self.similar_detail.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        other_page = self.client.get(url, {'limit': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other_page.status_code, 200)
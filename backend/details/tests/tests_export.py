@@ -0,0 +1,116 @@
+import csv
+import json
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from details.models import AllocationEntry
+from details.tests.factories import DetailInStockFactory, PlannedDetailFactory
+from details.views import ExportStockView
+from django.test import AsyncClient
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from sa_project.services.export import iter_ndjson
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestExport(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.task = TaskFactory(author=self.user, executor=self.user, expected_date=timezone.now().date())
+        self.stock = DetailInStockFactory(quantity=10)
+        self.planned_detail = PlannedDetailFactory(
+            task=self.task,
+            detail=self.stock.detail,
+            planned_quantity=8,
+            quantity_in_stock=2,
+        )
+        # 3 more pcs allocated in the ledger, not compacted yet
+        AllocationEntry.objects.create(
+            task=self.task,
+            planned_detail=self.planned_detail,
+            detail_in_stock=self.stock,
+            quantity=3,
+        )
+
+    def get_content(self, response) -> str:
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_stock_csv(self):
+        response = self.client.get(reverse('export-stock'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="stock.csv"')
+        rows = list(csv.DictReader(self.get_content(response).splitlines()))
+        self.assertEqual(rows, [{
+            'id': str(self.stock.id),
+            'detail': str(self.stock.detail_id),
+            'detail_name': self.stock.detail.name,
+            'detail_unit_of_measurement': self.stock.detail.unit_of_measurement,
+            'warehouse': str(self.stock.warehouse_id),
+            'warehouse_name': self.stock.warehouse.name,
+            'quantity': '7',
+        }])
+
+    def test_export_planned_details_ndjson(self):
+        response = self.client.get(reverse('export-planned-details'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(rows, [{
+            'id': self.planned_detail.id,
+            'task': self.task.id,
+            'task_status': self.task.status,
+            'task_expected_date': self.task.expected_date.isoformat(),
+            'detail': self.stock.detail_id,
+            'detail_name': self.stock.detail.name,
+            'planned_quantity': 8,
+            'allocated_quantity': 5,
+            'missing_quantity': 3,
+        }])
+
+    def test_export_many_rows_in_chunks(self):
+        for _ in range(4):
+            DetailInStockFactory()
+        with patch.object(ExportStockView, 'export_chunk_size', 2):
+            response = self.client.get(reverse('export-stock'), {'format': 'ndjson'})
+            chunks = list(response.streaming_content)
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+    async def test_export_streams_under_asgi(self):
+        await sync_to_async(DetailInStockFactory.create_batch)(4)
+        sent_chunks = []
+
+        def tracking_iter_ndjson(*args):
+            for chunk in iter_ndjson(*args):
+                sent_chunks.append(chunk)
+                yield chunk
+
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        with (
+            patch.object(ExportStockView, 'export_chunk_size', 2),
+            patch('sa_project.services.export.iter_ndjson', tracking_iter_ndjson),
+        ):
+            response = await AsyncClient().get(
+                reverse('export-stock'),
+                {'format': 'ndjson'},
+                headers={'Authorization': f'Bearer {token}'},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            content = aiter(response.streaming_content)
+            first_chunk = await anext(content)
+            # nothing past the first chunk is read before it is sent
+            self.assertEqual(len(sent_chunks), 1)
+            chunks = [first_chunk, *[chunk async for chunk in content]]
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+        self.assertEqual(len(sent_chunks), 3)
+
+    def test_export_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('export-stock'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('detail', json.loads(response.content))
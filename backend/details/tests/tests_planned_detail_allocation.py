@@ -1,13 +1,16 @@
+from details.allocation import AllocationPlan, AllocationSnapshot, GreedyAllocationSolver, LargestFirstStockStrategy
 from details.models import DetailInStock, PlannedDetail
+from details.planner import AllocationPlanner
 from details.services import PlannedDetailAllocationService, PlannedDetailDAO
 from details.tests.factories import (
     DetailFactory, DetailInStockFactory,
     PlannedDetailFactory,
     TestDetailDataGenerator, WareHouseFactory,
 )
-from django.db import connection
-from django.db.models import Sum
+from django.db import connection, transaction
+from django.db.models import F, Sum
 from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from tasks.models import Task
 from tasks.tests.factories import TaskFactory, UserFactory
@@ -90,3 +93,135 @@ class TestDetailAllocation(APITestCase):
         self.full_allocate_task(tasks[0])
         self.partial_allocate_task(tasks[1])
         self.partial_allocate_task(tasks[2])
+
+
+class TestTasksFeasibility(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = UserFactory()
+        cls.detail = DetailFactory()
+        cls.similar_detail = DetailFactory(similar_details=[cls.detail])
+        DetailInStockFactory(detail=cls.detail, quantity=5)
+        DetailInStockFactory(detail=cls.similar_detail, quantity=5)
+
+        today = timezone.now().date()
+        cls.early_task, cls.late_task = (
+            TaskFactory(author=user, executor=user, expected_date=today + timezone.timedelta(days=days))
+            for days in (1, 2)
+        )
+
+    def test_tasks_competing_for_the_same_detail(self):
+        PlannedDetailFactory(task=self.early_task, detail=self.detail, planned_quantity=6, quantity_in_stock=0)
+        PlannedDetailFactory(task=self.late_task, detail=self.detail, planned_quantity=6, quantity_in_stock=0)
+        tasks = [self.late_task, self.early_task]
+
+        with self.assertNumQueries(1):
+            feasibility = PlannedDetailAllocationService.get_tasks_feasibility(tasks)
+        self.assertEqual(feasibility, {self.early_task.id: True, self.late_task.id: False})
+        self.assertEqual(
+            PlannedDetailAllocationService.get_tasks_feasibility(tasks, with_contention=False),
+            {self.early_task.id: True, self.late_task.id: True},
+        )
+
+    def test_infeasible_early_task_takes_nothing(self):
+        PlannedDetailFactory(task=self.early_task, detail=self.detail, planned_quantity=100, quantity_in_stock=0)
+        PlannedDetailFactory(task=self.late_task, detail=self.detail, planned_quantity=5, quantity_in_stock=0)
+
+        feasibility = PlannedDetailAllocationService.get_tasks_feasibility([self.early_task, self.late_task])
+        self.assertEqual(feasibility, {self.early_task.id: False, self.late_task.id: True})
+
+    def test_tasks_competing_through_similar_details(self):
+        PlannedDetailFactory(task=self.early_task, detail=self.detail, planned_quantity=6, quantity_in_stock=0)
+        PlannedDetailFactory(task=self.late_task, detail=self.similar_detail, planned_quantity=3, quantity_in_stock=2)
+        PlannedDetailFactory(task=self.late_task, detail=self.similar_detail, planned_quantity=5, quantity_in_stock=5)
+
+        feasibility = PlannedDetailAllocationService.get_tasks_feasibility([self.early_task, self.late_task])
+        self.assertEqual(feasibility, {self.early_task.id: True, self.late_task.id: True})
+
+        PlannedDetailFactory(task=self.late_task, detail=self.similar_detail, planned_quantity=4, quantity_in_stock=0)
+        feasibility = PlannedDetailAllocationService.get_tasks_feasibility([self.early_task, self.late_task])
+        self.assertEqual(feasibility, {self.early_task.id: True, self.late_task.id: False})
+
+
+class StockTakenWhilePlanningPlanner(AllocationPlanner):
+    """
+    Another allocation takes a piece of every row of the first plan before they are locked.
+    """
+    stock_taken = False
+
+    def plan(self, snapshot: AllocationSnapshot) -> AllocationPlan:
+        plan = super().plan(snapshot)
+        if not self.stock_taken:
+            DetailInStock.objects.filter(id__in=plan.details_in_stock).update(quantity=F('quantity') - 1)
+            self.stock_taken = True
+        return plan
+
+
+class TestStockStrategyAllocation(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = UserFactory()
+        cls.task = TaskFactory(
+            author=user,
+            executor=user,
+            expected_date=timezone.now().date() + timezone.timedelta(days=1),
+        )
+        cls.detail = DetailFactory()
+        cls.warehouses = WareHouseFactory.create_batch(2)
+        for warehouse, quantity in zip(cls.warehouses * 3, (1, 1, 1, 1, 5, 1)):
+            DetailInStockFactory(detail=cls.detail, warehouse=warehouse, quantity=quantity)
+
+    def allocate(self, stock_strategy=None) -> PlannedDetailAllocationService:
+        planned_detail = PlannedDetailFactory(
+            task=self.task,
+            detail=self.detail,
+            planned_quantity=5,
+            quantity_in_stock=0,
+        )
+        detail_allocation_service = PlannedDetailAllocationService(stock_strategy=stock_strategy)
+        with transaction.atomic():
+            detail_allocation_service.allocate_planned_detail(planned_detail, allocate_from_using_similar=False)
+            self.assertEqual(planned_detail.quantity_in_stock, 5)
+            self.assertEqual(DetailInStock.objects.aggregate(total=Sum('quantity'))['total'], 5)
+            transaction.set_rollback(True)
+        return detail_allocation_service
+
+    def test_first_fit_touches_rows_in_id_order(self):
+        stats = self.allocate().stock_access_stats
+        self.assertEqual((stats.rows_locked, stats.rows_touched, stats.warehouses_touched), (5, 5, 2))
+
+    def test_largest_first_locks_only_the_fitting_row(self):
+        stats = self.allocate(LargestFirstStockStrategy()).stock_access_stats
+        self.assertEqual((stats.rows_locked, stats.rows_touched, stats.warehouses_touched), (1, 1, 1))
+
+    def allocate_with_planner(self, stock_strategy=None, planner_class=AllocationPlanner) -> tuple[AllocationPlan, int]:
+        """
+        Allocation plan of a planned detail of 5 and the stock left after it.
+        """
+        with transaction.atomic():
+            PlannedDetailFactory(task=self.task, detail=self.detail, planned_quantity=5, quantity_in_stock=0)
+            plan = planner_class(solver=GreedyAllocationSolver(stock_strategy=stock_strategy)).allocate([self.task])
+            self.assertEqual(plan.allocated_quantity, 5)
+            stock_left = DetailInStock.objects.aggregate(total=Sum('quantity'))['total']
+            transaction.set_rollback(True)
+        return plan, stock_left
+
+    def test_planner_locks_only_the_rows_it_takes_from(self):
+        plan, stock_left = self.allocate_with_planner()
+        stats = plan.stock_access_stats
+        self.assertEqual((stats.rows_locked, stats.rows_touched, stats.warehouses_touched), (5, 5, 2))
+        self.assertEqual(stock_left, 5)
+
+        plan, stock_left = self.allocate_with_planner(LargestFirstStockStrategy())
+        stats = plan.stock_access_stats
+        self.assertEqual((stats.rows_locked, stats.rows_touched, stats.warehouses_touched), (1, 1, 1))
+        self.assertEqual(stock_left, 5)
+
+    def test_planner_plans_again_when_stock_changes_before_the_lock(self):
+        plan, stock_left = self.allocate_with_planner(LargestFirstStockStrategy(), StockTakenWhilePlanningPlanner)
+        stats = plan.stock_access_stats
+        # the row of 5 lost a piece, the second plan takes the rest of it and the next largest row
+        self.assertEqual((stats.rows_locked, stats.rows_touched), (3, 2))
+        self.assertEqual(stock_left, 4)
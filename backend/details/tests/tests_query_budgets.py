@@ -0,0 +1,158 @@
+from details import urls
+from details.models import DetailInStock
+from details.services import PlannedDetailAllocationService, PlannedDetailDAO, StockAvailabilityService
+from details.tests.factories import generate_query_budget_data
+from rest_framework.test import APITestCase
+from sa_project.tests.query_budget import QueryBudgetTestMixin
+
+SIZES = (1, 10, 40)
+PLANNED_DETAILS_PER_TASK = 3
+
+
+class TestDetailQueryBudgets(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        self.allocation_service = PlannedDetailAllocationService()
+
+    def create_data(self, size: int) -> dict:
+        data = generate_query_budget_data(size, PLANNED_DETAILS_PER_TASK)
+        # the cache stats are for staff only
+        data['author'].is_staff = True
+        self.client.force_authenticate(data['author'])
+        return data
+
+    @staticmethod
+    def get_requests(data: dict) -> dict[tuple[str, str], tuple]:
+        planned_detail = data['planned_details'][0]
+        detail = planned_detail.detail
+        similar_detail = detail.similar_details.first()
+        detail_data = {
+            'name': 'budget detail',
+            'unit_of_measurement': 'pcs',
+            'price_for_unit': '1.00',
+            'similar_details': [similar_detail.id],
+        }
+        planned_detail_data = {'detail': detail.id, 'task': data['tasks'][0].id, 'planned_quantity': 2}
+        bulk_planned_details_data = [
+            {'detail': planned_detail.detail_id, 'task': planned_detail.task_id, 'planned_quantity': 2}
+            for planned_detail in data['planned_details']
+        ]
+        stock_dump = 'detail,warehouse,quantity\n' + ''.join(
+            f'{detail_in_stock.detail_id},{detail_in_stock.warehouse_id},{detail_in_stock.quantity + 1}\n'
+            for detail_in_stock in DetailInStock.objects.filter(detail__planneddetail__in=data['planned_details'])
+        )
+        detail_kwargs = {'pk': detail.id}
+        planned_detail_kwargs = {'pk': planned_detail.id}
+        return {
+            ('list-create-detail', 'get'): ({}, None),
+            ('list-create-detail', 'post'): ({}, detail_data),
+            ('retrieve-update-destroy-detail', 'get'): (detail_kwargs, None),
+            ('retrieve-update-destroy-detail', 'put'): (detail_kwargs, detail_data),
+            ('retrieve-update-destroy-detail', 'patch'): (detail_kwargs, {'name': 'budget detail'}),
+            ('retrieve-update-destroy-detail', 'delete'): (detail_kwargs, None),
+            ('list-create-planned-detail', 'get'): ({}, None),
+            ('list-create-planned-detail', 'post'): ({}, planned_detail_data),
+            ('retrieve-update-destroy-planned-detail', 'get'): (planned_detail_kwargs, None),
+            ('retrieve-update-destroy-planned-detail', 'put'): (planned_detail_kwargs, planned_detail_data),
+            ('retrieve-update-destroy-planned-detail', 'patch'): (planned_detail_kwargs, {'planned_quantity': 3}),
+            ('retrieve-update-destroy-planned-detail', 'delete'): (planned_detail_kwargs, None),
+            ('bulk-planned-details', 'post'): ({}, bulk_planned_details_data),
+            ('bulk-planned-details', 'patch'): ({}, [
+                {'id': planned_detail.id, 'planned_quantity': planned_detail.planned_quantity + 1}
+                for planned_detail in data['planned_details']
+            ]),
+            ('list-detail-in-stock', 'get'): ({}, None),
+            ('list-detail-in-stock-totals', 'get'): ({}, None),
+            ('stock-availability', 'post'): ({}, [
+                {'detail': planned_detail.detail_id, 'quantity': planned_detail.planned_quantity}
+                for planned_detail in data['planned_details']
+            ]),
+            ('export-stock', 'get'): ({}, None),
+            ('export-planned-details', 'get'): ({}, None),
+            ('import-stock', 'post'): ({}, stock_dump, 'text/csv'),
+            ('list-warehouse', 'get'): ({}, None),
+            ('catalog-cache-stats', 'get'): ({}, None),
+        }
+
+    def test_every_view_has_a_budget(self):
+        self.assertViewsHaveQueryBudgets(urls.urlpatterns)
+
+    def test_endpoint_budgets(self):
+        self.assertEndpointQueryBudgets(urls.urlpatterns, SIZES, self.create_data, self.get_requests)
+
+    def test_allocation_service_budgets(self):
+        allocation_service = self.allocation_service
+        calls = [
+            (
+                allocation_service.allocate_planned_detail,
+                lambda data: allocation_service.allocate_planned_detail(data['planned_details'][0]),
+                0,
+            ),
+            (
+                allocation_service.allocated_batch_planned_details,
+                lambda data: allocation_service.allocated_batch_planned_details(
+                    data['planned_details'][:PLANNED_DETAILS_PER_TASK],
+                ),
+                PLANNED_DETAILS_PER_TASK,
+            ),
+            (
+                allocation_service.is_enough_details_in_stock,
+                lambda data: allocation_service.is_enough_details_in_stock(data['planned_details'][0]),
+                0,
+            ),
+            (
+                allocation_service.can_full_allocate,
+                lambda data: allocation_service.can_full_allocate(data['planned_details']),
+                0,
+            ),
+            (
+                allocation_service.get_tasks_feasibility,
+                lambda data: allocation_service.get_tasks_feasibility(data['tasks']),
+                0,
+            ),
+            (
+                allocation_service.get_total_quantity_in_stock_batch,
+                lambda data: allocation_service.get_total_quantity_in_stock_batch(data['planned_details']),
+                0,
+            ),
+            (
+                allocation_service.get_total_quantity_in_stock,
+                lambda data: allocation_service.get_total_quantity_in_stock(data['planned_details'][0]),
+                0,
+            ),
+        ]
+        for method, run, items in calls:
+            with self.subTest(method=method.__name__):
+                self.assertQueryCountsConstant(method, SIZES, self.create_data, run, items=items)
+
+    def test_stock_availability_budget(self):
+        availability_service = StockAvailabilityService()
+        self.assertQueryCountsConstant(
+            availability_service.get_quantities,
+            SIZES,
+            self.create_data,
+            lambda data: availability_service.get_quantities(
+                planned_detail.detail_id for planned_detail in data['planned_details']
+            ),
+        )
+
+    def test_bulk_planned_detail_budgets(self):
+        calls = [
+            (
+                PlannedDetailDAO.bulk_create_planned_details,
+                lambda data: PlannedDetailDAO.bulk_create_planned_details([
+                    {'detail_id': planned_detail.detail_id, 'task_id': planned_detail.task_id, 'planned_quantity': 1}
+                    for planned_detail in data['planned_details']
+                ]),
+            ),
+            (
+                PlannedDetailDAO.bulk_update_planned_details,
+                lambda data: PlannedDetailDAO.bulk_update_planned_details([
+                    {'id': planned_detail.id, 'planned_quantity': planned_detail.planned_quantity + 1}
+                    for planned_detail in data['planned_details']
+                ]),
+            ),
+        ]
+        for method, run in calls:
+            with self.subTest(method=method.__name__):
+                self.assertQueryCountsConstant(method, SIZES, self.create_data, run)
@@ -0,0 +1,62 @@
+from details.serializers import DetailInStockSerializer
+from details.tests.factories import DetailFactory, DetailInStockFactory
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+from tasks.tests.factories import UserFactory
+
+
+class TestDetailSparseFields(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.similar_detail = DetailFactory()
+        self.detail = DetailFactory(similar_details=[self.similar_detail])
+
+    def test_detail_list_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('list-create-detail'), {'fields': 'id,name', 'ordering': 'id'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [dict(detail) for detail in response.data['results']],
+            [
+                {'id': self.similar_detail.id, 'name': self.similar_detail.name},
+                {'id': self.detail.id, 'name': self.detail.name},
+            ],
+        )
+        # no similar details prefetch and no price column
+        self.assertFalse(any('"price_for_unit"' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(any('details_detail_similar_details' in query['sql'] for query in queries.captured_queries))
+
+    def test_detail_nested_fields(self):
+        url = reverse('retrieve-update-destroy-detail', kwargs={'pk': self.detail.id})
+        response = self.client.get(url, {'fields': 'name,similar_details.name', 'expand': 'similar_details'})
+        self.assertEqual(
+            response.data,
+            {'name': self.detail.name, 'similar_details': [{'name': self.similar_detail.name}]},
+        )
+
+        response = self.client.get(url, {'fields': 'name,similar_details'})
+        self.assertEqual(response.data, {'name': self.detail.name, 'similar_details': [self.similar_detail.id]})
+
+    def test_detail_in_stock_expand(self):
+        detail_in_stock = DetailInStockFactory(detail=self.detail, quantity=3)
+        request = APIRequestFactory().get(
+            '/',
+            {'expand': 'detail,warehouse', 'fields': 'quantity,detail.name,warehouse'},
+        )
+        request.query_params = request.GET
+        serializer = DetailInStockSerializer(context={'request': request})
+        queryset = serializer.optimize_queryset(type(detail_in_stock).objects.filter(id=detail_in_stock.id))
+
+        with self.assertNumQueries(1):
+            data = DetailInStockSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(data[0]['quantity'], 3)
+        self.assertEqual(data[0]['detail'], {'name': self.detail.name})
+        self.assertEqual(data[0]['warehouse']['name'], detail_in_stock.warehouse.name)
+
+        self.assertEqual(DetailInStockSerializer(detail_in_stock).data['detail'], self.detail.id)
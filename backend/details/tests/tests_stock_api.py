@@ -0,0 +1,101 @@
+from details.models import AllocationEntry
+from details.tests.factories import DetailFactory, DetailInStockFactory, PlannedDetailFactory, WareHouseFactory
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestDetailInStockAPI(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.bearing = DetailFactory()
+        self.similar_bearing = DetailFactory(similar_details=[self.bearing])
+        self.bushing = DetailFactory()
+        self.warehouse, self.other_warehouse = WareHouseFactory(), WareHouseFactory()
+        self.stock = [
+            DetailInStockFactory(detail=self.bearing, warehouse=self.warehouse, quantity=5),
+            DetailInStockFactory(detail=self.bearing, warehouse=self.other_warehouse, quantity=0),
+            DetailInStockFactory(detail=self.similar_bearing, warehouse=self.warehouse, quantity=2),
+            DetailInStockFactory(detail=self.bushing, warehouse=self.other_warehouse, quantity=7),
+        ]
+
+    def get_results(self, url: str, params: dict) -> list[dict]:
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_list_stock(self):
+        # count, page with details and warehouses, similar details of the details
+        with self.assertNumQueries(3):
+            results = self.get_results(reverse('list-detail-in-stock'), {})
+        self.assertEqual([row['id'] for row in results], [stock.id for stock in self.stock])
+        self.assertEqual(results[2]['detail']['name'], self.similar_bearing.name)
+        self.assertEqual(results[2]['detail']['similar_details'], [self.bearing.id])
+        self.assertEqual(results[2]['warehouse'], self.warehouse.id)
+
+    def test_list_stock_filters(self):
+        url = reverse('list-detail-in-stock')
+        self.assertEqual(
+            [row['id'] for row in self.get_results(url, {'detail': self.bearing.id, 'in_stock': 'true'})],
+            [self.stock[0].id],
+        )
+        self.assertEqual(
+            [row['id'] for row in self.get_results(url, {'warehouse': self.other_warehouse.id})],
+            [self.stock[1].id, self.stock[3].id],
+        )
+        self.assertEqual(
+            [row['id'] for row in self.get_results(url, {'substitution_group': self.bearing.substitution_group})],
+            [self.stock[0].id, self.stock[1].id, self.stock[2].id],
+        )
+        self.assertEqual(self.client.get(url, {'detail': 'bearing'}).status_code, 400)
+
+    def test_stock_totals(self):
+        url = reverse('list-detail-in-stock-totals')
+        self.assertEqual(
+            [(row['detail'], row['total_quantity'], row['stock_rows']) for row in self.get_results(url, {})],
+            [(self.bearing.id, 5, 2), (self.similar_bearing.id, 2, 1), (self.bushing.id, 7, 1)],
+        )
+        self.assertEqual(
+            self.get_results(url, {'group_by': 'warehouse', 'in_stock': 'true'}),
+            [
+                {
+                    'warehouse': self.warehouse.id, 'warehouse_name': self.warehouse.name,
+                    'total_quantity': 7, 'stock_rows': 2,
+                },
+                {
+                    'warehouse': self.other_warehouse.id, 'warehouse_name': self.other_warehouse.name,
+                    'total_quantity': 7, 'stock_rows': 1,
+                },
+            ],
+        )
+        self.bearing.refresh_from_db()
+        self.bushing.refresh_from_db()
+        self.assertEqual(
+            sorted(
+                (row['substitution_group'], row['total_quantity'])
+                for row in self.get_results(url, {'group_by': 'substitution_group'})
+            ),
+            sorted([(self.bearing.substitution_group, 7), (self.bushing.substitution_group, 7)]),
+        )
+        self.assertEqual(self.client.get(url, {'group_by': 'task'}).status_code, 400)
+
+    def test_stock_totals_net_of_pending_entries(self):
+        task = TaskFactory(author=self.user, executor=self.user, expected_date='2100-01-01')
+        planned_detail = PlannedDetailFactory(task=task, detail=self.bearing, planned_quantity=3)
+        AllocationEntry.objects.create(
+            task=task,
+            planned_detail=planned_detail,
+            detail_in_stock=self.stock[0],
+            quantity=3,
+        )
+        url = reverse('list-detail-in-stock-totals')
+        self.assertEqual(
+            [(row['detail'], row['total_quantity'], row['stock_rows']) for row in self.get_results(url, {})],
+            [(self.bearing.id, 2, 2), (self.similar_bearing.id, 2, 1), (self.bushing.id, 7, 1)],
+        )
+        self.assertEqual(
+            [row['total_quantity'] for row in self.get_results(url, {'group_by': 'warehouse'})],
+            [4, 7],
+        )
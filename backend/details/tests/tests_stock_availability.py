@@ -0,0 +1,56 @@
+from details.tests.factories import DetailFactory, DetailInStockFactory
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from tasks.tests.factories import UserFactory
+
+
+class TestStockAvailability(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.bearing = DetailFactory()
+        self.similar_bearing = DetailFactory(similar_details=[self.bearing])
+        self.bushing = DetailFactory()
+        self.bearing_stock = DetailInStockFactory(detail=self.bearing, quantity=5)
+        DetailInStockFactory(detail=self.bearing, quantity=1)
+        DetailInStockFactory(detail=self.similar_bearing, quantity=3)
+        self.url = reverse('stock-availability')
+
+    def check(self, items: list[tuple[int, int]]):
+        return self.client.post(
+            self.url,
+            data=[{'detail': detail_id, 'quantity': quantity} for detail_id, quantity in items],
+            format='json',
+        )
+
+    def test_availability(self):
+        with self.assertNumQueries(1):
+            response = self.check([(self.bearing.id, 12), (self.bushing.id, 2), (self.bearing.id, 4)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['detail'], row['own_quantity'], row['similar_quantity'], row['shortfall']) for row in response.data],
+            [(self.bearing.id, 6, 3, 3), (self.bushing.id, 0, 0, 2), (self.bearing.id, 6, 3, 0)],
+        )
+
+    def test_availability_cache(self):
+        self.check([(self.bearing.id, 1), (self.similar_bearing.id, 1)])
+        with self.assertNumQueries(0):
+            self.check([(self.similar_bearing.id, 1)])
+        # only the details that are not cached yet are read
+        with self.assertNumQueries(1):
+            response = self.check([(self.bearing.id, 1), (self.bushing.id, 1)])
+        self.assertEqual(response.status_code, 200)
+
+        self.bearing_stock.quantity = 10
+        self.bearing_stock.save()
+        response = self.check([(self.bearing.id, 1), (self.similar_bearing.id, 1)])
+        self.assertEqual([(row['own_quantity'], row['similar_quantity']) for row in response.data], [(11, 3), (3, 11)])
+
+    def test_availability_unknown_detail(self):
+        response = self.check([(self.bearing.id, 1), (10 ** 9, 1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(list(response.data[1]), ['detail'])
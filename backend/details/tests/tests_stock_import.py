@@ -0,0 +1,113 @@
+import json
+import tempfile
+from io import StringIO
+
+from details.models import AllocationEntry, AllocationEvent, DetailInStock, DetailStockTotal
+from details.services import AllocationEntryDAO
+from details.tests.factories import DetailFactory, DetailInStockFactory, PlannedDetailFactory, WareHouseFactory
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestStockImport(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory(is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.detail = DetailFactory()
+        self.other_detail = DetailFactory()
+        self.warehouse = WareHouseFactory()
+        self.stock = DetailInStockFactory(detail=self.detail, warehouse=self.warehouse, quantity=5)
+        self.stock_copy = DetailInStockFactory(detail=self.detail, warehouse=self.warehouse, quantity=3)
+        AllocationEvent.objects.all().delete()
+
+    def get_stock(self) -> dict[tuple[int, int], list[int]]:
+        stock = {}
+        for detail_in_stock in DetailInStock.objects.order_by('id'):
+            stock.setdefault((detail_in_stock.detail_id, detail_in_stock.warehouse_id), []).append(
+                detail_in_stock.quantity,
+            )
+        return stock
+
+    def test_import_csv(self):
+        dump = (
+            'detail,warehouse,quantity\n'
+            f'{self.detail.id},{self.warehouse.id},2\n'
+            f'{self.other_detail.id},{self.warehouse.id},1\n'
+            f'{self.other_detail.id},{self.warehouse.id},7\n'
+            f'{10 ** 9},{self.warehouse.id},1\n'
+            f'{self.detail.id},{self.warehouse.id},-1\n'
+            f'{self.detail.id},{self.warehouse.id}\n'
+        )
+        response = self.client.generic('POST', reverse('import-stock'), dump, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {name: response.data[name] for name in (
+                'rows', 'rejected', 'rejected_invalid', 'rejected_unknown', 'duplicates', 'inserted', 'updated',
+            )},
+            {
+                'rows': 6, 'rejected': 3, 'rejected_invalid': 2, 'rejected_unknown': 1,
+                'duplicates': 1, 'inserted': 1, 'updated': 2,
+            },
+        )
+        self.assertEqual(response.data['invalid_lines'], ['line 6: out of range', 'line 7: not an integer'])
+        # the last line of a pair wins, the first stock row of a pair takes the quantity
+        self.assertEqual(
+            self.get_stock(),
+            {(self.detail.id, self.warehouse.id): [2, 0], (self.other_detail.id, self.warehouse.id): [7]},
+        )
+        self.assertEqual(DetailStockTotal.objects.get(detail=self.detail).quantity, 2)
+        self.assertEqual(list(AllocationEvent.objects.values_list('detail_id', flat=True)), [self.other_detail.id])
+
+    def test_import_ndjson(self):
+        dump = '\n'.join([
+            json.dumps({'detail': self.detail.id, 'warehouse': self.warehouse.id, 'quantity': 9}),
+            '',
+            '{"detail": ',
+            json.dumps({'detail': self.detail.id, 'warehouse': self.warehouse.id, 'quantity': 1.5}),
+        ])
+        response = self.client.generic('POST', reverse('import-stock'), dump, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows'], response.data['rejected_invalid']), (3, 2))
+        self.assertEqual(self.get_stock(), {(self.detail.id, self.warehouse.id): [9, 0]})
+        self.assertEqual(list(AllocationEvent.objects.values_list('detail_id', flat=True)), [self.detail.id])
+
+    def test_import_over_pending_entries(self):
+        task = TaskFactory(author=self.user, executor=self.user, expected_date='2100-01-01')
+        planned_detail = PlannedDetailFactory(task=task, detail=self.detail, planned_quantity=3)
+        AllocationEntry.objects.create(
+            task=task, planned_detail=planned_detail, detail_in_stock=self.stock, quantity=3,
+        )
+        dump = 'detail,warehouse,quantity\n' f'{self.detail.id},{self.warehouse.id},4\n'
+        response = self.client.generic('POST', reverse('import-stock'), dump, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DetailStockTotal.objects.get(detail=self.detail).quantity, 4)
+
+        AllocationEntryDAO().compact()
+        self.assertEqual(self.get_stock(), {(self.detail.id, self.warehouse.id): [4, 0]})
+        self.assertEqual(DetailStockTotal.objects.get(detail=self.detail).quantity, 4)
+        planned_detail.refresh_from_db()
+        self.assertEqual(planned_detail.quantity_in_stock, 3)
+
+    def test_import_staff_only(self):
+        self.client.force_authenticate(UserFactory())
+        dump = 'detail,warehouse,quantity\n' f'{self.detail.id},{self.warehouse.id},1\n'
+        response = self.client.generic('POST', reverse('import-stock'), dump, content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get_stock(), {(self.detail.id, self.warehouse.id): [5, 3]})
+
+    def test_import_unsupported_media_type(self):
+        response = self.client.post(reverse('import-stock'), {'detail': self.detail.id}, format='json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as dump:
+            dump.write(f'detail,warehouse,quantity\n{self.other_detail.id},{self.warehouse.id},4\n')
+            dump.flush()
+            output = StringIO()
+            call_command('import_stock', dump.name, stdout=output)
+        self.assertIn('Imported 1 rows', output.getvalue())
+        self.assertIn('1 inserted', output.getvalue())
+        self.assertEqual(self.get_stock()[self.other_detail.id, self.warehouse.id], [4])
@@ -1,19 +1,88 @@
 from details.views import (
-    ListCreateDetail, ListCreatePlannedDetails,
+    BulkPlannedDetailsView,
+    CatalogCacheStatsView, ExportPlannedDetailsView,
+    ExportStockView, ImportStockView, ListCreateDetail,
+    ListDetailInStockTotalsView, ListDetailInStockView,
+    StockAvailabilityView,
+    ListCreatePlannedDetails, ListWareHouseView,
     RetrieveUpdateDestroyDetailView,
     RetrieveUpdateDestroyPlannedDetails,
 )
 from django.urls import include, path
 
+# query_budgets: maximum queries per HTTP method whatever the number of rows, enforced by tests_query_budgets
 urlpatterns = [
-    path('', ListCreateDetail.as_view(), name='list-create-detail'),
-    path('<int:pk>/', RetrieveUpdateDestroyDetailView.as_view(), name='retrieve-update-destroy-detail'),
+    path(
+        '',
+        ListCreateDetail.as_view(query_budgets={'get': 5, 'post': 11}),
+        name='list-create-detail',
+    ),
+    path(
+        '<int:pk>/',
+        RetrieveUpdateDestroyDetailView.as_view(query_budgets={'get': 3, 'put': 12, 'patch': 3, 'delete': 12}),
+        name='retrieve-update-destroy-detail',
+    ),
     path(
         'planned-details/', include([
-            path('', ListCreatePlannedDetails.as_view(), name='list-create-planned-detail'),
-            path('<int:pk>/', RetrieveUpdateDestroyPlannedDetails.as_view(), name='retrieve-update-destroy-planned-detail'),
+            path(
+                '',
+                ListCreatePlannedDetails.as_view(query_budgets={'get': 2, 'post': 4}),
+                name='list-create-planned-detail',
+            ),
+            path(
+                '<int:pk>/',
+                RetrieveUpdateDestroyPlannedDetails.as_view(
+                    query_budgets={'get': 1, 'put': 4, 'patch': 2, 'delete': 3},
+                ),
+                name='retrieve-update-destroy-planned-detail',
+            ),
+            path(
+                'export/',
+                ExportPlannedDetailsView.as_view(query_budgets={'get': 1}),
+                name='export-planned-details',
+            ),
+            path(
+                'bulk/',
+                BulkPlannedDetailsView.as_view(query_budgets={'post': 6, 'patch': 6}),
+                name='bulk-planned-details',
+            ),
 
         ]),
     ),
+    path(
+        'stock/',
+        ListDetailInStockView.as_view(query_budgets={'get': 3}),
+        name='list-detail-in-stock',
+    ),
+    path(
+        'stock/totals/',
+        ListDetailInStockTotalsView.as_view(query_budgets={'get': 2}),
+        name='list-detail-in-stock-totals',
+    ),
+    path(
+        'stock/availability/',
+        StockAvailabilityView.as_view(query_budgets={'post': 1}),
+        name='stock-availability',
+    ),
+    path(
+        'stock/export/',
+        ExportStockView.as_view(query_budgets={'get': 1}),
+        name='export-stock',
+    ),
+    path(
+        'stock/import/',
+        ImportStockView.as_view(query_budgets={'post': 8}),
+        name='import-stock',
+    ),
+    path(
+        'warehouses/',
+        ListWareHouseView.as_view(query_budgets={'get': 2}),
+        name='list-warehouse',
+    ),
+    path(
+        'cache-stats/',
+        CatalogCacheStatsView.as_view(query_budgets={'get': 0}),
+        name='catalog-cache-stats',
+    ),
 
 ]
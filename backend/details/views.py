@@ -1,16 +1,40 @@
+import codecs
+
+from details.filters import DetailInStockFilter
 from details.serializers import (
     BaseDetailSerializer,
     BasePlannedDetailSerializer,
+    BulkCreatePlannedDetailSerializer,
+    BulkUpdatePlannedDetailSerializer,
     CreateDetailSerializer,
     CreatePlannedDetailsSerializer,
     DetailInStockSerializer,
+    DetailInStockTotalQuerySerializer,
+    DetailInStockTotalSerializer,
+    DetailInStockWithDetailSerializer,
     DetailWithSimilarDetailsSerializer,
+    StockAvailabilityRequestSerializer,
+    StockAvailabilitySerializer,
+    StockImportResultSerializer,
+    WareHouseSerializer,
+)
+from details.services import (
+    DetailDAO, DetailInStockDAO,
+    PlannedDetailDAO, StockAvailabilityService,
+    WareHouseDAO, detail_cache, warehouse_cache,
 )
-from details.services import DetailDAO, DetailInStockDAO, PlannedDetailDAO
-from drf_spectacular.utils import extend_schema
-from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from details.stock_import import StockImportService
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, inline_serializer
+from rest_framework import generics, serializers
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
 from sa_project.services.base_view import BaseAPIView
+from sa_project.services.cache import cached_response
+from sa_project.services.conditional_get import conditional_get, get_list_fingerprint, get_object_fingerprint
+from sa_project.services.export import StreamingExportMixin
+from sa_project.services.pagination import KeysetLimitOffsetPagination
 
 
 class BaseDetailView(BaseAPIView):
@@ -35,6 +59,7 @@ class BaseDetailInStockView(BaseAPIView):
 
 
 class ListCreateDetail(generics.ListCreateAPIView, BaseDetailView):
+    pagination_class = KeysetLimitOffsetPagination
 
     @extend_schema(responses=CreateDetailSerializer, request=CreateDetailSerializer)
     def post(self, request, *args, **kwargs):
@@ -42,10 +67,15 @@ class ListCreateDetail(generics.ListCreateAPIView, BaseDetailView):
         return super().post(request, *args, **kwargs)
 
     @extend_schema(responses=DetailWithSimilarDetailsSerializer)
+    @conditional_get
+    @cached_response(detail_cache)
     def get(self, request, *args, **kwargs):
         self.serializer_class = DetailWithSimilarDetailsSerializer
         return super().get(request, *args, **kwargs)
 
+    def get_fingerprint(self) -> tuple:
+        return get_list_fingerprint(self.filter_queryset(self.controller.model.objects.all()))
+
     def get_queryset(self):
         controller = self.get_controller()
         q = controller.get_all_details_with_similar_details()
@@ -53,10 +83,18 @@ class ListCreateDetail(generics.ListCreateAPIView, BaseDetailView):
 
 
 class RetrieveUpdateDestroyDetailView(generics.RetrieveUpdateDestroyAPIView, BaseDetailView):
-    pass
+
+    @conditional_get
+    @cached_response(detail_cache)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_fingerprint(self) -> tuple | None:
+        return get_object_fingerprint(self.controller.model.objects.all(), self.kwargs['pk'])
 
 
 class ListCreatePlannedDetails(generics.ListCreateAPIView, BasePlannedDetailsView):
+    pagination_class = KeysetLimitOffsetPagination
 
     @extend_schema(responses=CreatePlannedDetailsSerializer, request=CreatePlannedDetailsSerializer)
     def post(self, request, *args, **kwargs):
@@ -66,3 +104,175 @@ class ListCreatePlannedDetails(generics.ListCreateAPIView, BasePlannedDetailsVie
 
 class RetrieveUpdateDestroyPlannedDetails(generics.RetrieveUpdateDestroyAPIView, BasePlannedDetailsView):
     pass
+
+
+class BulkPlannedDetailsView(BasePlannedDetailsView):
+    """
+    Create or update a list of planned details in one transaction, all or none.
+    """
+
+    @extend_schema(
+        request=BulkCreatePlannedDetailSerializer(many=True),
+        responses={201: BasePlannedDetailSerializer(many=True)},
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = BulkCreatePlannedDetailSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        planned_details = self.get_controller().bulk_create_planned_details(serializer.validated_data)
+        return Response(data=BasePlannedDetailSerializer(planned_details, many=True).data, status=201)
+
+    @extend_schema(
+        request=BulkUpdatePlannedDetailSerializer(many=True),
+        responses=BasePlannedDetailSerializer(many=True),
+    )
+    def patch(self, request, *args, **kwargs):
+        serializer = BulkUpdatePlannedDetailSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        planned_details = self.get_controller().bulk_update_planned_details(serializer.validated_data)
+        return Response(data=BasePlannedDetailSerializer(planned_details, many=True).data, status=200)
+
+
+class ImportStockView(BaseDetailInStockView):
+    """
+    Import a stock dump sent as the request body, CSV with a detail,warehouse,quantity header
+    or NDJSON. Rows replace the quantity in stock of their (detail, warehouse).
+    Staff only, the import locks the stock tables until it commits.
+    """
+    permission_classes = [IsAdminUser]
+    import_formats = {
+        'text/csv': 'csv',
+        'application/x-ndjson': 'ndjson',
+        'application/jsonl': 'ndjson',
+    }
+
+    @extend_schema(
+        request={media_type: OpenApiTypes.STR for media_type in import_formats},
+        responses=StockImportResultSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        media_type = request.content_type.split(';')[0].strip().lower()
+        if media_type not in self.import_formats:
+            raise UnsupportedMediaType(media_type)
+        # the body is read line by line, never loaded as a whole
+        lines = codecs.iterdecode(request._request, 'utf-8-sig')
+        try:
+            result = StockImportService().import_stock(lines, self.import_formats[media_type])
+        except UnicodeDecodeError as exc:
+            raise ParseError(f"The body is not UTF-8: {exc}") from exc
+        return Response(data=StockImportResultSerializer(result.as_dict()).data, status=200)
+
+
+class ListDetailInStockView(generics.ListAPIView, BaseDetailInStockView):
+    serializer_class = DetailInStockWithDetailSerializer
+    filterset_class = DetailInStockFilter
+    pagination_class = KeysetLimitOffsetPagination
+
+    def get_queryset(self):
+        return self.get_controller().get_details_in_stock_with_detail()
+
+
+class ListDetailInStockTotalsView(generics.ListAPIView, BaseDetailInStockView):
+    """
+    Stock totals per detail, warehouse or substitution group (?group_by=) of the filtered stock rows.
+    """
+    serializer_class = DetailInStockTotalSerializer
+    filterset_class = DetailInStockFilter
+
+    @extend_schema(parameters=[DetailInStockTotalQuerySerializer])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        query_serializer = DetailInStockTotalQuerySerializer(data=self.request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        return self.get_controller().get_totals(
+            super().filter_queryset(queryset),
+            query_serializer.validated_data['group_by'],
+        )
+
+
+class ExportStockView(StreamingExportMixin, BaseDetailInStockView):
+    """
+    Every stock row with its detail and warehouse as CSV or NDJSON (?format=csv|ndjson).
+    """
+    export_name = 'stock'
+    export_columns = [
+        'id', 'detail', 'detail_name', 'detail_unit_of_measurement', 'warehouse', 'warehouse_name', 'quantity',
+    ]
+
+    @extend_schema(responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR})
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        return self.get_controller().get_stock_for_export()
+
+
+class ExportPlannedDetailsView(StreamingExportMixin, BasePlannedDetailsView):
+    """
+    Allocation state of every planned detail as CSV or NDJSON (?format=csv|ndjson).
+    """
+    export_name = 'planned-details'
+    export_columns = [
+        'id', 'task', 'task_status', 'task_expected_date', 'detail', 'detail_name',
+        'planned_quantity', 'allocated_quantity', 'missing_quantity',
+    ]
+
+    @extend_schema(responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR})
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        return self.get_controller().get_allocation_state_for_export()
+
+
+class StockAvailabilityView(BaseDetailInStockView):
+    """
+    Own stock, stock of the similar details and shortfall for a list of {detail, quantity} items,
+    each item checked on its own.
+    """
+    max_items = 1000
+
+    @extend_schema(
+        request=StockAvailabilityRequestSerializer(many=True),
+        responses=StockAvailabilitySerializer(many=True),
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = StockAvailabilityRequestSerializer(data=request.data, many=True, max_length=self.max_items)
+        serializer.is_valid(raise_exception=True)
+        availability = StockAvailabilityService().check(serializer.validated_data)
+        if None in availability:
+            does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+            raise serializers.ValidationError([
+                {'detail': [does_not_exist.format(pk_value=item['detail_id'])]} if row is None else {}
+                for item, row in zip(serializer.validated_data, availability)
+            ])
+        return Response(data=StockAvailabilitySerializer(availability, many=True).data, status=200)
+
+
+class ListWareHouseView(generics.ListAPIView, BaseAPIView):
+    serializer_class = WareHouseSerializer
+    controller = WareHouseDAO
+    permission_classes = [IsAuthenticated]
+    queryset = WareHouseDAO.model.objects.all()
+
+    @cached_response(warehouse_cache)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class CatalogCacheStatsView(BaseAPIView):
+    """
+    Hit and miss counters of the detail and warehouse caches.
+    """
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses=inline_serializer(
+        name='CatalogCacheStats',
+        fields={
+            'details': serializers.DictField(child=serializers.IntegerField()),
+            'warehouses': serializers.DictField(child=serializers.IntegerField()),
+        },
+    ))
+    def get(self, request, *args, **kwargs):
+        return Response({'details': detail_cache.get_stats(), 'warehouses': warehouse_cache.get_stats()})
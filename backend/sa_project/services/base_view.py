@@ -1,17 +1,38 @@
 from typing import Type
 
+from django.db.models import QuerySet
 from rest_framework.generics import GenericAPIView, get_object_or_404
+from rest_framework.permissions import SAFE_METHODS
 
 from .base_dao import BaseDao
+from .sparse_fields import EXPAND_QUERY_PARAM, FIELDS_QUERY_PARAM
 
 
 class BaseAPIView(GenericAPIView):
     controller: Type[BaseDao]
+    # maximum queries per HTTP method, declared in urls.py with as_view(query_budgets=...)
+    query_budgets: dict[str, int] = {}
 
     def get_object(self, *args, **kwargs):
-        obj = get_object_or_404(self.controller.model, pk=self.kwargs['pk'])
+        obj = get_object_or_404(self.optimize_queryset(self.controller.model.objects.all()), pk=self.kwargs['pk'])
         self.check_object_permissions(self.request, obj)
         return obj
 
     def get_controller(self):
         return self.controller()
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        return self.optimize_queryset(super().filter_queryset(queryset))
+
+    def optimize_queryset(self, queryset: QuerySet) -> QuerySet:
+        """
+        Load only what ?fields= and ?expand= ask for, the default output keeps the view's queryset.
+        """
+        params = self.request.query_params
+        selects_fields = FIELDS_QUERY_PARAM in params or EXPAND_QUERY_PARAM in params
+        if self.request.method not in SAFE_METHODS or not selects_fields:
+            return queryset
+        serializer = self.get_serializer()
+        if not hasattr(serializer, 'optimize_queryset'):
+            return queryset
+        return serializer.optimize_queryset(queryset)
@@ -0,0 +1,137 @@
+import time
+from functools import wraps
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import transaction
+from rest_framework.response import Response
+
+__all__ = ['VersionedCache', 'cached_response']
+
+
+class VersionedCache:
+    """
+    Cache namespace invalidated by bumping its version. Keys embed the version, so a bump makes
+    every older entry unreachable at once and they expire on their own.
+    Hits and misses are counted in the cache backend, so a shared backend counts for all processes.
+    """
+
+    def __init__(self, namespace: str, timeout: int | None = None, alias: str = DEFAULT_CACHE_ALIAS):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_timeout(self) -> int:
+        return self.timeout if self.timeout is not None else settings.CATALOG_CACHE_TIMEOUT
+
+    def _key(self, name: str) -> str:
+        return f'{self.namespace}:{name}'
+
+    def get_version(self) -> int:
+        version = self.cache.get(self._key('version'))
+        if version is None:
+            # a fresh version never matches entries left from before the version key was evicted
+            self.cache.add(self._key('version'), time.time_ns(), None)
+            version = self.cache.get(self._key('version'))
+        return version
+
+    def invalidate(self):
+        """
+        Bump the version now and again on commit, so readers that cached the old rows
+        before the writing transaction committed are dropped as well.
+        """
+        self._bump_version()
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        try:
+            self.cache.incr(self._key('version'))
+        except ValueError:
+            self.cache.add(self._key('version'), time.time_ns(), None)
+
+    def _count(self, name: str, delta: int = 1):
+        if not delta:
+            return
+        try:
+            self.cache.incr(self._key(name), delta)
+        except ValueError:
+            self.cache.add(self._key(name), delta, None)
+
+    def get(self, key: str, version: int | None = None) -> Any:
+        """
+        Cached value or None, counted as a hit or a miss.
+        """
+        value = self.cache.get(self._key(f'{version or self.get_version()}:{key}'))
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key: str, value: Any, version: int | None = None):
+        """
+        Pass the version read before the value was built, so a value built from rows
+        that were changed in the meantime is stored under the old version.
+        """
+        self.cache.set(self._key(f'{version or self.get_version()}:{key}'), value, self.get_timeout())
+
+    def get_many(self, keys: Iterable[str], version: int | None = None) -> dict[str, Any]:
+        """
+        Cached values of the keys that are cached, every key counted as a hit or a miss.
+        """
+        version = version or self.get_version()
+        keys = list(keys)
+        cached = self.cache.get_many([self._key(f'{version}:{key}') for key in keys])
+        values = {key: cached[self._key(f'{version}:{key}')] for key in keys if self._key(f'{version}:{key}') in cached}
+        self._count('hits', len(values))
+        self._count('misses', len(keys) - len(values))
+        return values
+
+    def set_many(self, values: dict[str, Any], version: int | None = None):
+        version = version or self.get_version()
+        self.cache.set_many({self._key(f'{version}:{key}'): value for key, value in values.items()}, self.get_timeout())
+
+    def get_or_set(self, key: str, default: Callable[[], Any]) -> Any:
+        version = self.get_version()
+        value = self.get(key, version)
+        if value is None:
+            value = default()
+            self.set(key, value, version)
+        return value
+
+    def get_stats(self) -> dict[str, int]:
+        stats = self.cache.get_many([self._key('hits'), self._key('misses')])
+        return {
+            'hits': stats.get(self._key('hits'), 0),
+            'misses': stats.get(self._key('misses'), 0),
+            'version': self.get_version(),
+        }
+
+    def reset_stats(self):
+        self.cache.delete_many([self._key('hits'), self._key('misses')])
+
+
+def cached_response(versioned_cache: VersionedCache):
+    """
+    Cache the data of successful responses of a view method by the full request path.
+    Only for responses that are the same for every user.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.get_full_path()
+            version = versioned_cache.get_version()
+            data = versioned_cache.get(key, version)
+            if data is not None:
+                return Response(data)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                versioned_cache.set(key, response.data, version)
+            return response
+
+        return wrapper
+
+    return decorator
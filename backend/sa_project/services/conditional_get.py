@@ -0,0 +1,58 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.db.models import Count, Max, QuerySet
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from sa_project.services.sparse_fields import EXPAND_QUERY_PARAM
+
+__all__ = ['conditional_get', 'get_object_fingerprint', 'get_list_fingerprint']
+
+
+def get_object_fingerprint(queryset: QuerySet, pk: int) -> tuple | None:
+    """
+    (pk, updated_at) of the object, None if it is not in the queryset.
+    """
+    updated_at = queryset.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return None if updated_at is None else (pk, updated_at)
+
+
+def get_list_fingerprint(queryset: QuerySet) -> tuple | None:
+    """
+    (count, latest updated_at) of the rows: a write changes the latest updated_at, a delete the count.
+    """
+    fingerprint = queryset.order_by().aggregate(count=Count('id'), last_modified=Max('updated_at'))
+    return fingerprint['count'], fingerprint['last_modified']
+
+
+def conditional_get(method):
+    """
+    Answer a view GET with 304 Not Modified when If-None-Match or If-Modified-Since still match,
+    before the data is loaded and serialized. The view's get_fingerprint() returns a tuple
+    that changes with the data, its last item is the last modification time.
+    The fingerprint only covers the view's own rows, so ?expand= responses, which nest related rows, are always sent.
+    """
+
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        if EXPAND_QUERY_PARAM in request.query_params:
+            return method(view, request, *args, **kwargs)
+        fingerprint = view.get_fingerprint()
+        if fingerprint is None:
+            return method(view, request, *args, **kwargs)
+
+        # the path is part of the tag, pages and field selections differ
+        etag = quote_etag(hashlib.md5(f'{request.get_full_path()}|{fingerprint}'.encode()).hexdigest())
+        last_modified = fingerprint[-1]
+        timestamp = int(last_modified.timestamp()) if isinstance(last_modified, datetime) else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = method(view, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            if timestamp is not None:
+                response.headers.setdefault('Last-Modified', http_date(timestamp))
+        return response
+
+    return wrapper
@@ -1,13 +1,17 @@
+from contextlib import contextmanager
 from functools import wraps
-from typing import List
+from typing import Any, Iterable, Iterator, List
 
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Prefetch
 
-def prefetch_related(related_fields: List[str]):
+
+def prefetch_related(related_fields: List[str | Prefetch]):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             queryset = func(*args, **kwargs)
-            return queryset.prefetch_related("".join(related_fields))
+            return queryset.prefetch_related(*related_fields)
 
         return wrapper
 
@@ -19,8 +23,86 @@ def select_related(related_fields: List[str]):
         @wraps(func)
         def wrapper(*args, **kwargs):
             queryset = func(*args, **kwargs)
-            return queryset.select_related("".join(related_fields))
+            return queryset.select_related(*related_fields)
 
         return wrapper
 
     return decorator
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts executed queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(using: str = DEFAULT_DB_ALIAS):
+    """
+    Count the queries executed on a connection inside the block.
+    """
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+def _format_copy_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class CopyRowsFile:
+    """
+    Read-only file over rows in the COPY text format, produced on demand.
+    """
+
+    def __init__(self, rows: Iterable[Iterable[Any]]):
+        self.lines = self._iter_lines(rows)
+        self.buffer = ''
+        self.row_count = 0
+
+    def _iter_lines(self, rows: Iterable[Iterable[Any]]) -> Iterator[str]:
+        for row in rows:
+            self.row_count += 1
+            yield '\t'.join(_format_copy_value(value) for value in row) + '\n'
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def copy_rows(table: str, columns: List[str], rows: Iterable[Iterable[Any]], using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Load rows into a table with COPY FROM STDIN, streaming them in constant memory.
+    Returns the number of rows copied.
+    """
+    connection = connections[using]
+    copy_file = CopyRowsFile(rows)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(table)} "
+            f"({', '.join(connection.ops.quote_name(column) for column in columns)}) FROM STDIN",
+            copy_file,
+        )
+    return copy_file.row_count
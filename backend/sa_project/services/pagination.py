@@ -0,0 +1,169 @@
+import base64
+import json
+from typing import Any, Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.utils.urls import replace_query_param
+
+__all__ = ['KeysetLimitOffsetPagination']
+
+
+class KeysetLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that clients can switch to keyset pagination with ?cursor=
+    (empty for the first page). Keyset pages are read after the last row of the previous page
+    in the view's keyset_ordering, so every page costs the same however deep it is.
+
+    ?count=exact|estimate|none chooses how the total is computed: estimate reads the
+    query planner's row estimate, none skips it. Keyset pages are not counted by default.
+    Keyset pages are at most keyset_max_limit rows, limit/offset pages are not capped.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_modes = ('exact', 'estimate', 'none')
+    default_keyset_ordering = ('id',)
+    keyset_max_limit = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list | None:
+        self.keyset = self.cursor_query_param in request.query_params
+        self.count_mode = self.get_count_mode(request)
+        if not self.keyset and self.count_mode == 'exact':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = self.get_total_count(queryset)
+        if self.keyset:
+            self.ordering = tuple(getattr(view, 'keyset_ordering', self.default_keyset_ordering))
+            queryset = queryset.order_by(*self.ordering)
+            position = self.decode_cursor(request, queryset)
+            if position is not None:
+                queryset = queryset.filter(self.get_keyset_filter(self.ordering, position))
+        else:
+            self.offset = self.get_offset(request)
+            queryset = queryset[self.offset:]
+
+        # one extra row tells if there is a next page without counting
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        results = results[:self.limit]
+        self.last_row = results[-1] if results else None
+        return results
+
+    def get_limit(self, request) -> int | None:
+        limit = super().get_limit(request)
+        if self.keyset and limit is not None:
+            return min(limit, self.keyset_max_limit)
+        return limit
+
+    def get_count_mode(self, request) -> str:
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode in self.count_modes:
+            return count_mode
+        return 'none' if self.keyset else 'exact'
+
+    def get_total_count(self, queryset: QuerySet) -> int | None:
+        if self.count_mode == 'exact':
+            return self.get_count(queryset)
+        if self.count_mode == 'estimate':
+            return self.estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def estimate_count(queryset: QuerySet) -> int:
+        """
+        Row estimate of the query planner, no rows are read.
+        """
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    @staticmethod
+    def get_keyset_filter(ordering: Sequence[str], position: Sequence[Any]) -> Q:
+        """
+        Rows after position: (a, b) > (x, y) written as a >= x AND (a > x OR (a = x AND b > y)),
+        so an index on (a, b) is range scanned from x.
+        """
+        keyset_filter = Q(**{f'{ordering[-1]}__gt': position[-1]})
+        for field, value in zip(reversed(ordering[:-1]), reversed(position[:-1])):
+            keyset_filter = Q(**{f'{field}__gt': value}) | (Q(**{field: value}) & keyset_filter)
+        if len(ordering) > 1:
+            keyset_filter &= Q(**{f'{ordering[0]}__gte': position[0]})
+        return keyset_filter
+
+    def encode_cursor(self, position: Sequence[Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position, cls=DjangoJSONEncoder).encode()).decode()
+
+    def decode_cursor(self, request, queryset: QuerySet) -> list | None:
+        """
+        Position of the cursor, every value converted by the model field of its keyset ordering field.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+        if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    def get_next_link(self) -> str | None:
+        if not self.keyset and self.count_mode == 'exact':
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        if self.keyset:
+            position = [getattr(self.last_row, field) for field in self.ordering]
+            return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_previous_link(self) -> str | None:
+        if self.keyset:
+            return None
+        return super().get_previous_link()
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view) -> list[dict]:
+        return [
+            *super().get_schema_operation_parameters(view),
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset pagination cursor from the next link, empty for the first page',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'How the total count is computed: exact, estimate or none',
+                'schema': {'type': 'string', 'enum': list(self.count_modes)},
+            },
+        ]
@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Callable
+
+__all__ = [
+    'QueryBudget',
+    'query_budget',
+]
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """
+    Maximum number of queries of a call: queries, plus per_item for every item the call works on.
+    It never depends on the number of rows in the database.
+    """
+    queries: int
+    per_item: int = 0
+
+    def get_limit(self, items: int = 0) -> int:
+        return self.queries + self.per_item * items
+
+
+def query_budget(queries: int, per_item: int = 0) -> Callable:
+    """
+    Declare the query budget of a service method, it is enforced by the tests.
+    """
+
+    def decorator(func):
+        func.query_budget = QueryBudget(queries=queries, per_item=per_item)
+        return func
+
+    return decorator
@@ -0,0 +1,159 @@
+from typing import Iterable
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, QuerySet
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+__all__ = ['SparseFieldsSerializerMixin', 'parse_field_paths']
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def parse_field_paths(value: str | None) -> dict | None:
+    """
+    'id,planned_details.detail.name' -> {'id': {}, 'planned_details': {'detail': {'name': {}}}}
+    """
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, path.strip().split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsSerializerMixin:
+    """
+    ModelSerializer mixin for ?fields= and ?expand= on GET requests.
+
+    fields keeps only the listed fields, dotted paths select fields of nested serializers.
+    expand replaces the relations listed in Meta.expandable_fields, a pk by default,
+    with their nested serializer, e.g. ?expand=planned_details.detail.
+    optimize_queryset() then loads only the columns and relations the output needs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            self.select_fields(
+                parse_field_paths(request.query_params.get(FIELDS_QUERY_PARAM)),
+                parse_field_paths(request.query_params.get(EXPAND_QUERY_PARAM)),
+            )
+
+    def select_fields(self, fields: dict | None, expand: dict | None):
+        """
+        Apply parsed ?fields= and ?expand= trees, None keeps all fields or expands nothing.
+        """
+        expand = expand or {}
+        expandable_fields = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand.keys() & expandable_fields.keys():
+            # relations some serializers nest already keep their serializer
+            if not isinstance(self.fields.get(name), serializers.BaseSerializer):
+                serializer_class, kwargs = expandable_fields[name]
+                self.fields[name] = import_string(serializer_class)(read_only=True, **kwargs)
+
+        if fields is not None:
+            for name in self.fields.keys() - fields.keys():
+                self.fields.pop(name)
+        for name, field in self.fields.items():
+            nested_fields = (fields.get(name) or None) if fields is not None else None
+            if nested_fields or expand.get(name):
+                self._select_nested_fields(field, nested_fields, expand.get(name))
+
+    @staticmethod
+    def _select_nested_fields(field: serializers.Field, fields: dict | None, expand: dict | None):
+        serializer = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(serializer, SparseFieldsSerializerMixin):
+            serializer.select_fields(fields, expand)
+
+    def optimize_queryset(self, queryset: QuerySet, extra_fields: Iterable[str] = ()) -> QuerySet:
+        """
+        Load only the columns and relations of the selected fields, unchanged if some field
+        does not map to the model. Relations loaded elsewhere for the full output are dropped.
+        """
+        plan = self.get_query_plan()
+        if plan is None:
+            return queryset
+        only, select_related, prefetch = plan
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        return queryset.prefetch_related(*prefetch).only(*only, *extra_fields)
+
+    def get_query_plan(self) -> tuple[list[str], list[str], list[Prefetch]] | None:
+        """
+        only() fields, select_related() and prefetch_related() lookups of the selected fields.
+        """
+        opts = self.Meta.model._meta
+        only, select_related, prefetch = [opts.pk.name], [], []
+        for field in self.fields.values():
+            if field.source == '*':
+                return None
+            serializer = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(serializer, serializers.BaseSerializer):
+                if not isinstance(serializer, SparseFieldsSerializerMixin):
+                    return None
+                try:
+                    model_field = opts.get_field(field.source)
+                except FieldDoesNotExist:
+                    return None
+                if model_field.one_to_many or model_field.many_to_many:
+                    # a reverse foreign key is matched to its objects by the foreign key column
+                    extra_fields = [model_field.field.name] if model_field.one_to_many else []
+                    nested_queryset = serializer.optimize_queryset(
+                        model_field.related_model._default_manager.all(),
+                        extra_fields,
+                    )
+                    prefetch.append(Prefetch(field.source, queryset=nested_queryset))
+                    continue
+                nested_plan = serializer.get_query_plan()
+                if nested_plan is None:
+                    return None
+                nested_only, nested_select_related, nested_prefetch = nested_plan
+                only.append(field.source)
+                only.extend(f'{field.source}__{name}' for name in nested_only)
+                select_related.append(field.source)
+                select_related.extend(f'{field.source}__{name}' for name in nested_select_related)
+                prefetch.extend(
+                    Prefetch(f'{field.source}__{lookup.prefetch_through}', queryset=lookup.queryset)
+                    for lookup in nested_prefetch
+                )
+            elif isinstance(field, serializers.ManyRelatedField):
+                try:
+                    model_field = opts.get_field(field.source)
+                except FieldDoesNotExist:
+                    return None
+                prefetch.append(Prefetch(field.source, queryset=model_field.related_model._default_manager.only('pk')))
+            else:
+                lookup = self._get_column_lookup(opts, field.source_attrs)
+                if lookup is None:
+                    return None
+                only.append(lookup)
+                for index in range(1, len(field.source_attrs)):
+                    relation = '__'.join(field.source_attrs[:index])
+                    only.append(relation)
+                    select_related.append(relation)
+        return only, select_related, prefetch
+
+    @staticmethod
+    def _get_column_lookup(opts, source_attrs: list[str]) -> str | None:
+        """
+        Lookup of a column reached through forward foreign keys, None for anything else.
+        """
+        for index, name in enumerate(source_attrs):
+            try:
+                model_field = opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if index < len(source_attrs) - 1:
+                if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                    return None
+                opts = model_field.related_model._meta
+            elif not model_field.concrete or model_field.many_to_many:
+                return None
+        return '__'.join(source_attrs)
@@ -0,0 +1,12 @@
+from sa_project.settings import config
+
+# local memory by default, CACHE_URL=rediscache://... or memcache://... to share the cache between processes
+CACHES = {
+    'default': config.cache_url('CACHE_URL', default='locmemcache://sa-project'),
+}
+
+# seconds a catalog read (details, warehouses) stays cached, writes invalidate it earlier
+CATALOG_CACHE_TIMEOUT = config.int('CATALOG_CACHE_TIMEOUT', default=60 * 60)
+
+# seconds a stock availability lookup stays cached, stock writes invalidate it earlier
+STOCK_AVAILABILITY_CACHE_TIMEOUT = config.int('STOCK_AVAILABILITY_CACHE_TIMEOUT', default=30)
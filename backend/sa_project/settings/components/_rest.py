@@ -35,6 +35,10 @@ SPECTACULAR_SETTINGS = {
         "rest_framework.authentication.BasicAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
+    'ENUM_NAME_OVERRIDES': {
+        'TaskStatusEnum': 'tasks.models.Task.Status',
+        'AllocationJobStatusEnum': 'tasks.models.AllocationJob.Status',
+    },
 
 }
 
@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from sa_project.services.query_budget import QueryBudget
+
+__all__ = [
+    'get_view_query_budget',
+    'get_view_methods',
+    'iter_url_patterns',
+    'QueryBudgetTestMixin',
+]
+
+
+def get_view_query_budget(view: Callable, method: str) -> QueryBudget | None:
+    """
+    Budget of a routed view, declared as as_view(query_budgets={'get': 3, ...}) in urls.py.
+    """
+    query_budgets = getattr(view, 'initkwargs', {}).get('query_budgets', view.cls.query_budgets)
+    queries = query_budgets.get(method.lower())
+    return None if queries is None else QueryBudget(queries=queries)
+
+
+def get_view_methods(view: Callable) -> list[str]:
+    """
+    HTTP methods a routed view implements, without the ones every view gets for free.
+    """
+    return [
+        method for method in view.cls.http_method_names
+        if method not in ('head', 'options') and hasattr(view.cls, method)
+    ]
+
+
+def iter_url_patterns(urlpatterns: Iterable[URLPattern | URLResolver]) -> Iterator[URLPattern]:
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+class QueryBudgetTestMixin:
+    """
+    Assertions for APITestCase that enforce query budgets and check they hold at every data size.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget: QueryBudget | Callable, items: int = 0, using: str = DEFAULT_DB_ALIAS):
+        """
+        Fail if the block runs more queries than the budget, given itself or declared on a function, allows.
+        """
+        if not isinstance(budget, QueryBudget):
+            budget = budget.query_budget
+        limit = budget.get_limit(items)
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > limit:
+            queries = '\n'.join(f"{index}. {query['sql']}" for index, query in enumerate(context.captured_queries, 1))
+            self.fail(f"{len(context)} queries executed, the budget is {limit}:\n{queries}")
+
+    def assertQueryCountsConstant(
+            self,
+            budget: QueryBudget | Callable,
+            sizes: Iterable[int],
+            create_data: Callable[[int], Any],
+            run: Callable[[Any], Any],
+            items: int = 0,
+    ):
+        """
+        Run the call on data sets of every size, each rolled back afterwards:
+        it has to stay within the budget and run the same number of queries every time.
+        """
+        query_counts = {}
+        for size in sizes:
+            with transaction.atomic():
+                data = create_data(size)
+                with self.assertQueryBudget(budget, items) as context:
+                    run(data)
+                query_counts[size] = len(context)
+                transaction.set_rollback(True)
+        self.assertEqual(len(set(query_counts.values())), 1, f"Query counts grow with the data: {query_counts}")
+
+    def assertViewsHaveQueryBudgets(self, urlpatterns: Iterable[URLPattern | URLResolver]):
+        for pattern in iter_url_patterns(urlpatterns):
+            for method in get_view_methods(pattern.callback):
+                with self.subTest(view=pattern.name, method=method):
+                    self.assertIsNotNone(
+                        get_view_query_budget(pattern.callback, method),
+                        f"{pattern.name} has no query budget for {method.upper()}",
+                    )
+
+    def assertEndpointQueryBudgets(
+            self,
+            urlpatterns: Iterable[URLPattern | URLResolver],
+            sizes: Iterable[int],
+            create_data: Callable[[int], Any],
+            get_requests: Callable[[Any], dict[tuple[str, str], tuple]],
+    ):
+        """
+        Request every routed view and method on data sets of every size.
+        get_requests maps (url name, method) to the url kwargs and the payload for the created data,
+        sent as JSON unless a content type follows the payload.
+        """
+        for pattern in iter_url_patterns(urlpatterns):
+            name, view = pattern.name, pattern.callback
+            for method in get_view_methods(view):
+
+                def create_request(size, name=name, method=method):
+                    kwargs, payload, *content_type = get_requests(create_data(size))[name, method]
+                    return reverse(name, kwargs=kwargs), payload, content_type
+
+                def run(request, method=method):
+                    url, payload, content_type = request
+                    if content_type:
+                        response = self.client.generic(method.upper(), url, payload, content_type=content_type[0])
+                    else:
+                        response = getattr(self.client, method)(url, data=payload, format='json')
+                    if response.streaming:
+                        # streamed responses query while their content is read
+                        b''.join(response.streaming_content)
+                    self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+
+                with self.subTest(view=name, method=method):
+                    budget = get_view_query_budget(view, method)
+                    self.assertIsNotNone(budget, f"{name} has no query budget for {method.upper()}")
+                    self.assertQueryCountsConstant(budget, sizes, create_request, run)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from tasks.models import Task
+from tasks.models import AllocationJob, Task
 
 
 class TaskAdmin(admin.ModelAdmin):
@@ -10,3 +10,12 @@ class TaskAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Task, TaskAdmin)
+
+
+class AllocationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'created_by', 'processed_tasks', 'total_tasks', 'created_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+admin.site.register(AllocationJob, AllocationJobAdmin)
@@ -0,0 +1,151 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from details.services import PlannedDetailAllocationService, PlannedDetailDAO
+from details.views import ListCreateDetail, ListCreatePlannedDetails
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from sa_project.services.helpers import count_queries
+from tasks.models import Task
+from tasks.services import TaskDAO, TaskService
+from tasks.views import CreateListTaskView
+
+__all__ = [
+    'BenchmarkResult',
+    'AllocationBenchmark',
+    'measure',
+    'build_report',
+    'compare_results',
+]
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    wall_time: float
+    query_count: int
+    peak_memory: int
+    calls: int = 1
+
+
+@contextmanager
+def measure(name: str, calls: int = 1, trace_memory: bool = True, using: str = DEFAULT_DB_ALIAS):
+    """
+    Measure wall time, queries and peak Python memory of the block, the result is filled in on exit.
+    """
+    result = BenchmarkResult(name=name, wall_time=0, query_count=0, peak_memory=0, calls=calls)
+    if trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        with count_queries(using) as counter:
+            yield result
+    finally:
+        result.wall_time = time.perf_counter() - started_at
+        result.query_count = counter.count
+        if trace_memory:
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+class AllocationBenchmark:
+    """
+    Runs the allocation services and the main list endpoints on the current data.
+    Every benchmark is rolled back, so they all start from the same state.
+    """
+
+    def __init__(self, user: User, sample_tasks: int = 100, trace_memory: bool = True):
+        self.user = user
+        self.sample_tasks = sample_tasks
+        self.trace_memory = trace_memory
+        self.task_service = TaskService(
+            task_dao=TaskDAO(),
+            planned_detail_allocation_service=PlannedDetailAllocationService(),
+            planned_detail_dao=PlannedDetailDAO(),
+        )
+        self.request_factory = APIRequestFactory()
+
+    @staticmethod
+    def get_open_tasks():
+        return (
+            Task.objects
+            .filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
+            .order_by('expected_date', 'id')
+        )
+
+    def run(self) -> list[BenchmarkResult]:
+        benchmarks: list[tuple[str, Callable[[], int]]] = [
+            ('allocate_task', self.allocate_task),
+            ('allocate_task_list', self.allocate_task_list),
+            ('task_list_endpoint', lambda: self.get_list(CreateListTaskView, '/api/v1/tasks/')),
+            ('detail_list_endpoint', lambda: self.get_list(ListCreateDetail, '/api/v1/details/')),
+            (
+                'planned_detail_list_endpoint',
+                lambda: self.get_list(ListCreatePlannedDetails, '/api/v1/details/planned-details/'),
+            ),
+        ]
+        results = []
+        for name, benchmark in benchmarks:
+            with transaction.atomic():
+                with measure(name, trace_memory=self.trace_memory) as result:
+                    result.calls = benchmark()
+                transaction.set_rollback(True)
+            results.append(result)
+        return results
+
+    def allocate_task(self) -> int:
+        tasks = list(self.get_open_tasks()[:self.sample_tasks])
+        for task in tasks:
+            self.task_service.allocate_task(task)
+        return len(tasks)
+
+    def allocate_task_list(self) -> int:
+        self.task_service.allocate_task_list(self.get_open_tasks())
+        return 1
+
+    def get_list(self, view_class, path: str) -> int:
+        request = self.request_factory.get(path)
+        force_authenticate(request, user=self.user)
+        response = view_class.as_view()(request)
+        response.render()
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return 1
+
+
+def compare_results(baseline: dict, current: dict) -> list[dict]:
+    """
+    Wall time and query count of the current results relative to a baseline report.
+    """
+    baseline_results = {result['name']: result for result in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        baseline_result = baseline_results.get(result['name'])
+        if baseline_result is None:
+            continue
+        comparison.append({
+            'name': result['name'],
+            'wall_time_ratio': (
+                result['wall_time'] / baseline_result['wall_time'] if baseline_result['wall_time'] else None
+            ),
+            'query_count_delta': result['query_count'] - baseline_result['query_count'],
+            'peak_memory_ratio': (
+                result['peak_memory'] / baseline_result['peak_memory'] if baseline_result['peak_memory'] else None
+            ),
+        })
+    return comparison
+
+
+def build_report(parameters: dict, rows: dict, generation_time: float, results: list[BenchmarkResult]) -> dict:
+    return {
+        'created_at': timezone.now().isoformat(),
+        'parameters': parameters,
+        'rows': rows,
+        'generation_time': generation_time,
+        'results': [asdict(result) for result in results],
+    }
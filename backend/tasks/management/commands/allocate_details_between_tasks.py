@@ -1,17 +1,151 @@
+import json
+import time
+
+from details.allocation import (
+    ALLOCATION_SOLVERS, STOCK_STRATEGIES,
+    AllocationPlan, get_allocation_solver,
+    get_stock_strategy, serialize_plan,
+)
+from details.planner import AllocationPlanner, ShardedAllocationPlanner
 from details.services import PlannedDetailAllocationService, PlannedDetailDAO
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
 from tasks.models import Task
-from tasks.services import TaskDAO, TaskService
+from tasks.services import AllocationWorker, ChunkedAllocationService, TaskDAO, TaskService
 
 
 class Command(BaseCommand):
     help = 'Allocate planned details between tasks'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solver',
+            choices=sorted(ALLOCATION_SOLVERS),
+            default='greedy',
+            help='greedy: tasks in deadline order, fully allocatable first; '
+                 'priority: plan all tasks together to complete the most tasks weighted by deadline',
+        )
+        parser.add_argument(
+            '--stock-strategy',
+            choices=sorted(STOCK_STRATEGIES),
+            default='first-fit',
+            help='first-fit: stock rows in id order; largest-first: one fitting row or the largest rows first; '
+                 'single-warehouse: rows of one warehouse that covers the planned detail if there is one',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the allocation plan as JSON without locking or writing anything',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database to allocate on, a replica is enough for --dry-run',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Allocate every group of similar details in its own transaction using this many threads',
+        )
+        parser.add_argument(
+            '--worker',
+            action='store_true',
+            help=(
+                'Claim open tasks in batches with SKIP LOCKED, '
+                'several workers can run at the same time and share one run'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Tasks per transaction: the size of a claimed batch with --worker (100 by default), '
+                 'otherwise allocate in resumable chunks of this size',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Start a chunked or --worker run from the first task instead of resuming an interrupted one',
+        )
+        parser.add_argument(
+            '--append-only',
+            action='store_true',
+            help='Only insert allocation ledger entries, quantities are updated by compact_allocation_ledger',
+        )
+
     def handle(self, *args, **options):
-        tasks = Task.objects.filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS]).order_by("expected_date")
+        if options['worker'] and options['workers']:
+            raise CommandError('--worker runs one batch at a time, run several worker processes instead of --workers')
+
+        tasks = (
+            Task.objects.using(options['database'])
+            .filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
+            .order_by("expected_date")
+        )
+        solver = get_allocation_solver(options['solver'], options['stock_strategy'])
+        if options['workers']:
+            allocation_planner = ShardedAllocationPlanner(
+                solver=solver,
+                using=options['database'],
+                workers=options['workers'],
+                append_only=options['append_only'],
+            )
+        else:
+            allocation_planner = AllocationPlanner(
+                solver=solver,
+                using=options['database'],
+                append_only=options['append_only'],
+            )
+
+        if options['dry_run']:
+            snapshot, plan = allocation_planner.dry_run(tasks)
+            self.stdout.write(json.dumps(serialize_plan(snapshot, plan), cls=DjangoJSONEncoder, indent=2))
+            return
+
+        if options['worker']:
+            worker = AllocationWorker(allocation_planner=allocation_planner, batch_size=options['batch_size'] or 100)
+            plan = worker.run(restart=options['restart'])
+            self.write_summary(plan)
+            return
+
+        if options['batch_size']:
+            self.allocate_in_chunks(allocation_planner, options['batch_size'], options['restart'])
+            return
+
         task_service = TaskService(
             task_dao=TaskDAO(),
-            planned_detail_allocation_service=PlannedDetailAllocationService(),
+            planned_detail_allocation_service=PlannedDetailAllocationService(
+                stock_strategy=get_stock_strategy(options['stock_strategy']),
+            ),
             planned_detail_dao=PlannedDetailDAO(),
+            allocation_planner=allocation_planner,
+        )
+        plan = task_service.allocate_task_list(tasks)
+        self.write_summary(plan)
+
+    def allocate_in_chunks(self, allocation_planner: AllocationPlanner, batch_size: int, restart: bool):
+        service = ChunkedAllocationService(allocation_planner=allocation_planner, batch_size=batch_size)
+        started_at = time.perf_counter()
+        processed_tasks = 0
+        checkpoint = None
+        for checkpoint, plan in service.run(restart=restart):
+            processed_tasks += len(plan.completed_task_ids) + len(plan.in_progress_task_ids)
+            self.stdout.write(
+                f"{checkpoint.processed_tasks} tasks processed, "
+                f"{plan.allocated_quantity} pcs allocated in the last chunk, "
+                f"{processed_tasks / (time.perf_counter() - started_at):.0f} tasks/s",
+            )
+        if checkpoint is None:
+            self.stdout.write("No tasks to allocate")
+            return
+        self.stdout.write(f"Allocated {checkpoint.allocated_quantity} pcs for {checkpoint.processed_tasks} tasks")
+
+    def write_summary(self, plan: AllocationPlan):
+        self.stdout.write(
+            f"Allocated {plan.allocated_quantity} pcs: "
+            f"{len(plan.completed_task_ids)} tasks completed, "
+            f"{len(plan.in_progress_task_ids)} in progress, "
+            f"{len(plan.details_in_stock)} stock rows updated, "
+            f"{plan.stock_access_stats.rows_locked} locked, "
+            f"{plan.query_count} queries",
         )
-        task_service.allocate_task_list(tasks)
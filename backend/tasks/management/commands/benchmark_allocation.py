@@ -0,0 +1,92 @@
+import json
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from tasks.benchmark import AllocationBenchmark, build_report, compare_results
+from tasks.synthetic_data import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a synthetic data set and measure wall time, queries and peak memory of allocation '
+        'and the main list endpoints. Everything is rolled back unless --keep-data is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1000)
+        parser.add_argument('--planned-details-per-task', type=int, default=10)
+        parser.add_argument('--details', type=int, default=2000)
+        parser.add_argument('--similar-group-size', type=int, default=3)
+        parser.add_argument('--warehouses', type=int, default=10)
+        parser.add_argument('--stock-rows', type=int, default=4000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--sample-tasks',
+            type=int,
+            default=100,
+            help='Tasks allocated one by one with TaskService.allocate_task',
+        )
+        parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, it slows the runs down')
+        parser.add_argument('--keep-data', action='store_true', help='Commit the generated data set')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='JSON report of a previous run to compare with')
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            help='Fail if a wall time grows by more than this factor or a query count grows compared with --compare',
+        )
+
+    def handle(self, *args, **options):
+        parameters = {
+            name: options[name]
+            for name in (
+                'tasks', 'planned_details_per_task', 'details', 'similar_group_size',
+                'warehouses', 'stock_rows', 'seed', 'sample_tasks',
+            )
+        }
+        generator = SyntheticDataGenerator(
+            tasks=options['tasks'],
+            planned_details_per_task=options['planned_details_per_task'],
+            details=options['details'],
+            similar_group_size=options['similar_group_size'],
+            warehouses=options['warehouses'],
+            stock_rows=options['stock_rows'],
+            seed=options['seed'],
+        )
+        with transaction.atomic():
+            started_at = time.perf_counter()
+            user = generator.generate()
+            generation_time = time.perf_counter() - started_at
+
+            benchmark = AllocationBenchmark(
+                user=user,
+                sample_tasks=options['sample_tasks'],
+                trace_memory=not options['no_memory'],
+            )
+            report = build_report(parameters, generator.rows, generation_time, benchmark.run())
+            if not options['keep_data']:
+                transaction.set_rollback(True)
+
+        report_json = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report_json)
+        else:
+            self.stdout.write(report_json)
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                comparison = compare_results(json.load(baseline_file), report)
+            regressions = []
+            for item in comparison:
+                self.stderr.write(
+                    f"{item['name']}: wall time x{item['wall_time_ratio'] or 0:.2f}, "
+                    f"queries {item['query_count_delta']:+d}",
+                )
+                if options['max_regression'] is not None and (
+                        (item['wall_time_ratio'] or 0) > options['max_regression'] or item['query_count_delta'] > 0
+                ):
+                    regressions.append(item['name'])
+            if regressions:
+                raise CommandError(f"Regressions in {', '.join(regressions)}")
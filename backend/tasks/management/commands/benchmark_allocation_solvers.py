@@ -0,0 +1,124 @@
+import random
+import time
+from collections import defaultdict
+
+from details.allocation import (
+    ALLOCATION_SOLVERS, STOCK_STRATEGIES,
+    AllocationSnapshot, get_allocation_solver,
+    get_weighted_completion,
+)
+from details.models import DetailInStock, PlannedDetail
+from django.core.management import BaseCommand
+from django.utils import timezone
+from tasks.models import Task
+
+
+def build_synthetic_snapshot(
+        tasks: int,
+        planned_details: int,
+        details: int,
+        similar_group_size: int,
+        warehouses: int,
+        stock_rows: int,
+        seed: int,
+) -> AllocationSnapshot:
+    """
+    Build an allocation snapshot from unsaved model instances, no database involved.
+    Details are split into groups of similar_group_size details that are all similar to each other.
+    """
+    rnd = random.Random(seed)
+    today = timezone.now().date()
+
+    task_list = [
+        Task(id=task_id, expected_date=today + timezone.timedelta(days=rnd.randint(1, 60)))
+        for task_id in range(1, tasks + 1)
+    ]
+    task_list.sort(key=lambda task: task.expected_date)
+
+    similar_details = {}
+    for group_start in range(1, details + 1, similar_group_size):
+        group = set(range(group_start, min(group_start + similar_group_size, details + 1)))
+        for detail_id in group:
+            similar_details[detail_id] = group - {detail_id}
+
+    planned_details_by_task = defaultdict(list)
+    for planned_detail_id in range(1, planned_details + 1):
+        task_id = rnd.randint(1, tasks)
+        planned_details_by_task[task_id].append(
+            PlannedDetail(
+                id=planned_detail_id,
+                task_id=task_id,
+                detail_id=rnd.randint(1, details),
+                planned_quantity=rnd.randint(1, 20),
+                quantity_in_stock=0,
+            ),
+        )
+
+    details_in_stock = defaultdict(list)
+    for detail_in_stock_id in range(1, stock_rows + 1):
+        detail_in_stock = DetailInStock(
+            id=detail_in_stock_id,
+            detail_id=rnd.randint(1, details),
+            warehouse_id=rnd.randint(1, warehouses),
+            quantity=rnd.randint(1, 50),
+        )
+        details_in_stock[detail_in_stock.detail_id].append(detail_in_stock)
+
+    return AllocationSnapshot(
+        tasks=task_list,
+        planned_details=dict(planned_details_by_task),
+        details_in_stock=dict(details_in_stock),
+        similar_details=similar_details,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compare allocation solvers on a synthetic in-memory data set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=10_000)
+        parser.add_argument('--planned-details', type=int, default=100_000)
+        parser.add_argument('--details', type=int, default=20_000)
+        parser.add_argument('--similar-group-size', type=int, default=3)
+        parser.add_argument('--warehouses', type=int, default=10)
+        parser.add_argument('--stock-rows', type=int, default=40_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--solvers',
+            nargs='+',
+            choices=sorted(ALLOCATION_SOLVERS),
+            default=sorted(ALLOCATION_SOLVERS),
+        )
+        parser.add_argument(
+            '--stock-strategies',
+            nargs='+',
+            choices=sorted(STOCK_STRATEGIES),
+            default=['first-fit'],
+        )
+
+    def handle(self, *args, **options):
+        for solver_name in options['solvers']:
+            for stock_strategy in options['stock_strategies']:
+                snapshot = build_synthetic_snapshot(
+                    tasks=options['tasks'],
+                    planned_details=options['planned_details'],
+                    details=options['details'],
+                    similar_group_size=options['similar_group_size'],
+                    warehouses=options['warehouses'],
+                    stock_rows=options['stock_rows'],
+                    seed=options['seed'],
+                )
+                solver = get_allocation_solver(solver_name, stock_strategy)
+
+                started_at = time.perf_counter()
+                plan = solver.solve(snapshot)
+                elapsed = time.perf_counter() - started_at
+
+                self.stdout.write(
+                    f"{solver_name}/{stock_strategy}: {elapsed:.2f}s, "
+                    f"{len(plan.completed_task_ids)} tasks completed, "
+                    f"weighted completion {get_weighted_completion(snapshot, plan):.2f}, "
+                    f"{plan.allocated_quantity} pcs allocated, "
+                    f"{len(plan.details_in_stock)} stock rows updated, "
+                    f"{len(plan.allocations)} allocations",
+                )
@@ -0,0 +1,46 @@
+import time
+
+from details.allocation import ALLOCATION_SOLVERS, get_allocation_solver
+from details.planner import AllocationPlanner
+from django.core.management import BaseCommand
+from tasks.services import IncrementalAllocationService
+
+
+class Command(BaseCommand):
+    help = 'Re-allocate planned details affected by queued stock and planned detail changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solver',
+            choices=sorted(ALLOCATION_SOLVERS),
+            default='greedy',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Events per transaction',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep polling the queue every this many seconds instead of exiting once it is empty',
+        )
+
+    def handle(self, *args, **options):
+        service = IncrementalAllocationService(
+            allocation_planner=AllocationPlanner(solver=get_allocation_solver(options['solver'])),
+            batch_size=options['batch_size'],
+        )
+        while True:
+            plan = service.process()
+            if plan.planned_details or options['interval'] is None:
+                self.stdout.write(
+                    f"Allocated {plan.allocated_quantity} pcs: "
+                    f"{len(plan.completed_task_ids)} tasks completed, "
+                    f"{len(plan.in_progress_task_ids)} in progress, "
+                    f"{plan.query_count} queries",
+                )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from tasks.services import ALLOCATION_JOB_STALE_AFTER, AllocationJobService
+
+
+class Command(BaseCommand):
+    help = 'Run allocation jobs queued through the API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Tasks per transaction',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before polling an empty queue again',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=float,
+            default=ALLOCATION_JOB_STALE_AFTER.total_seconds(),
+            help='Seconds without a heartbeat after which a running job is claimed again, longer than a batch takes',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        service = AllocationJobService(
+            batch_size=options['batch_size'],
+            stale_after=timedelta(seconds=options['stale_after']),
+        )
+        while True:
+            count = service.run_pending()
+            if count:
+                self.stdout.write(f"Ran {count} allocation jobs")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
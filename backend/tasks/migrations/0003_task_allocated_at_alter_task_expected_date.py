@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:17
+
+import tasks.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0002_alter_task_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='allocated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='expected_date',
+            field=models.DateField(validators=[tasks.models.validate_future_date]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_allocationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_expected_date', models.DateField(blank=True, null=True)),
+                ('last_task_id', models.BigIntegerField(blank=True, null=True)),
+                ('processed_tasks', models.PositiveIntegerField(default=0)),
+                ('allocated_quantity', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Allocation Checkpoint',
+                'verbose_name_plural': 'Allocation Checkpoints',
+                'ordering': ['id'],
+            },
+        ),
+    ]
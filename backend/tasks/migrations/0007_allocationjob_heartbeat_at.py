@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_task_author_expected_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allocationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -22,6 +22,8 @@ class Task(models.Model):
     expected_date = models.DateField(validators=[validate_future_date])
     author = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='created_tasks')
     executor = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='tasks_to_do')
+    # last allocation pass over the task, used by allocation workers to claim tasks
+    allocated_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"id: {self.id} - author: {self.author} - executor: {self.executor}"
@@ -30,3 +32,64 @@ class Task(models.Model):
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
         ordering = ['id']
+        indexes = [
+            # keyset pagination of the task list of an author
+            models.Index(fields=['author', 'expected_date', 'id'], name='task_author_expected_date_idx'),
+        ]
+
+
+class AllocationJob(models.Model):
+    """
+    Allocation requested through the API, queued in the database and run by the run_allocation_jobs worker.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending'
+        RUNNING = 'Running', 'Running'
+        SUCCEEDED = 'Succeeded', 'Succeeded'
+        FAILED = 'Failed', 'Failed'
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING, db_index=True)
+    created_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='allocation_jobs')
+    # ids of the tasks to allocate, all open tasks of created_by if empty
+    task_ids = models.JSONField(default=list, blank=True)
+    solver = models.CharField(max_length=20, default='greedy')
+    total_tasks = models.PositiveIntegerField(default=0)
+    processed_tasks = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # saved with every batch, a running job without a heartbeat for too long is claimed by another worker
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"id: {self.id} - status: {self.status}"
+
+    class Meta:
+        verbose_name = 'Allocation Job'
+        verbose_name_plural = 'Allocation Jobs'
+        ordering = ['id']
+
+
+class AllocationCheckpoint(models.Model):
+    """
+    Position of a chunked allocation run in (expected_date, id) order, committed with every chunk.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_expected_date = models.DateField(null=True, blank=True)
+    last_task_id = models.BigIntegerField(null=True, blank=True)
+    processed_tasks = models.PositiveIntegerField(default=0)
+    allocated_quantity = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.processed_tasks} tasks"
+
+    class Meta:
+        verbose_name = 'Allocation Checkpoint'
+        verbose_name_plural = 'Allocation Checkpoints'
+        ordering = ['id']
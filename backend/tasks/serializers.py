@@ -1,13 +1,18 @@
+from details.allocation import ALLOCATION_SOLVERS
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from tasks.models import Task
+from sa_project.services.sparse_fields import SparseFieldsSerializerMixin
+from tasks.models import AllocationJob, Task
 
 
-class BaseTaskSerializer(serializers.ModelSerializer):
+class BaseTaskSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = '__all__'
         read_only_fields = ['author', 'created_at', 'updated_at', 'id']
+        expandable_fields = {
+            'planned_details': ('details.serializers.BasePlannedDetailSerializer', {'many': True}),
+        }
 
 
 class CreateTaskSerializer(BaseTaskSerializer):
@@ -22,7 +27,37 @@ class SingleTaskSerializer(BaseTaskSerializer):
         model = Task
         fields = BaseTaskSerializer.Meta.fields
         read_only_fields = ['author', 'created_at', 'updated_at', 'id', 'planned_details']
+        expandable_fields = BaseTaskSerializer.Meta.expandable_fields
 
 
 class ListTaskSerializer(SingleTaskSerializer):
-    pass
+    from details.serializers import PlannedDetailWithDetailSerializer
+    planned_details = PlannedDetailWithDetailSerializer(many=True, read_only=True)
+
+
+class AllocationJobSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = AllocationJob
+        exclude = ['created_by']
+        read_only_fields = [
+            'id', 'status', 'total_tasks', 'processed_tasks', 'result', 'error',
+            'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+        ]
+
+
+class CreateAllocationJobSerializer(AllocationJobSerializer):
+    task_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    solver = serializers.ChoiceField(choices=sorted(ALLOCATION_SOLVERS), required=False)
+
+    def validate_task_ids(self, task_ids: list[int]) -> list[int]:
+        """
+        Only tasks of the user can be allocated, tasks of other users are reported as missing.
+        """
+        task_ids = sorted(set(task_ids))
+        own_task_ids = Task.objects.filter(author=self.context['request'].user, id__in=task_ids).values_list(
+            'id', flat=True,
+        )
+        missing_ids = set(task_ids) - set(own_task_ids)
+        if missing_ids:
+            raise serializers.ValidationError(f"Tasks {sorted(missing_ids)} do not exist")
+        return task_ids
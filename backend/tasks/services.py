@@ -1,19 +1,46 @@
-from typing import Iterable
+import logging
+import time
+from datetime import timedelta
+from itertools import islice
+from typing import Iterable, Iterator
 
-from details.services import PlannedDetailAllocationService, PlannedDetailDAO
+from details.allocation import get_allocation_solver
+from details.models import AllocationEvent, DetailInStock
+from details.planner import AllocationPlan, AllocationPlanner
+from details.services import (
+    AllocationEntryDAO, DetailDAO,
+    PlannedDetailAllocationService, PlannedDetailDAO,
+)
 from django.contrib.auth.models import User
-from django.db.models import QuerySet
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, QuerySet
+from django.utils import timezone
 from sa_project.services.base_dao import BaseDao
 from sa_project.services.helpers import prefetch_related
-from tasks.models import Task
+from sa_project.services.query_budget import query_budget
+from tasks.models import AllocationCheckpoint, AllocationJob, Task
 
-__all__ = ['TaskDAO', 'TaskService']
+__all__ = [
+    'ALLOCATION_JOB_STALE_AFTER',
+    'TaskDAO',
+    'TaskService',
+    'AllocationWorker',
+    'ChunkedAllocationService',
+    'IncrementalAllocationService',
+    'AllocationJobDAO',
+    'AllocationJobService',
+]
+
+logger = logging.getLogger(__name__)
+
+# a running allocation job without a heartbeat for this long is claimed by another worker
+ALLOCATION_JOB_STALE_AFTER = timedelta(minutes=10)
 
 
 class TaskDAO(BaseDao):
     model = Task
 
-    @prefetch_related(['planned_details'])
+    @prefetch_related([Prefetch('planned_details', queryset=PlannedDetailDAO.get_planned_details_with_detail())])
     def get_all_task_with_planned_details(self, user: User) -> QuerySet[Task]:
         return self.model.objects.filter(author=user)
 
@@ -21,7 +48,7 @@ class TaskDAO(BaseDao):
     def _change_status(task: Task, status: Task.Status):
         if status != task.status:
             task.status = status
-            task.save(update_fields=['status'])
+            task.save(update_fields=['status', 'updated_at'])
 
     def change_to_in_progress(self, task: Task):
         self._change_status(task, Task.Status.IN_PROGRESS)
@@ -40,11 +67,14 @@ class TaskService:
             task_dao: TaskDAO,
             planned_detail_allocation_service: PlannedDetailAllocationService,
             planned_detail_dao: PlannedDetailDAO,
+            allocation_planner: AllocationPlanner | None = None,
     ):
         self.task_dao = task_dao
         self.planned_detail_allocation_service = planned_detail_allocation_service
         self.planned_detail_dao = planned_detail_dao
+        self.allocation_planner = allocation_planner or AllocationPlanner()
 
+    @query_budget(5, per_item=13)
     def allocate_task(
             self,
             task: Task,
@@ -55,38 +85,398 @@ class TaskService:
         """
         planned_details = self.planned_detail_dao.get_planned_details_from_task(task)
         task.status = Task.Status.IN_PROGRESS
-        task.save(update_fields=['status'])
+        task.save(update_fields=['status', 'updated_at'])
         if self.planned_detail_allocation_service.can_full_allocate(planned_details):
             self.planned_detail_allocation_service.allocated_batch_planned_details(planned_details)
             task.status = Task.Status.COMPLETED
-            task.save(update_fields=['status'])
+            task.save(update_fields=['status', 'updated_at'])
         else:
             self.planned_detail_allocation_service.allocated_batch_planned_details(planned_details)
 
-    def allocate_task_list(self, tasks: Iterable[Task]):
+    @query_budget(14)
+    def allocate_task_list(self, tasks: Iterable[Task]) -> AllocationPlan:
         """
         Allocate a list of tasks with details from stock.
         Tasks that can be fully allocated are handled first.
+        The whole list is planned in memory and written with bulk updates.
         """
-        tasks_to_update = []
-        tasks_to_allocate_partially = []
-
-        # Allocate fully allocatable tasks
-        for task in tasks:
-            planned_details = self.planned_detail_dao.get_planned_details_from_task(task)
-            task.status = Task.Status.IN_PROGRESS
-            task.save(update_fields=['status'])
-            if self.planned_detail_allocation_service.can_full_allocate(planned_details):
-                self.planned_detail_allocation_service.allocated_batch_planned_details(planned_details)
-                task.status = Task.Status.COMPLETED
-                tasks_to_update.append(task.id)
-            else:
-                tasks_to_allocate_partially.append((task, planned_details))
-
-        # Allocate remaining tasks
-        for task, planned_details in tasks_to_allocate_partially:
-            self.planned_detail_allocation_service.allocated_batch_planned_details(planned_details)
+        return self.allocation_planner.allocate(tasks)
+
+    @query_budget(23)
+    def undo_allocation(self, task: Task, allocation_entry_dao: AllocationEntryDAO | None = None):
+        """
+        Give back the stock the task took through the allocation ledger.
+        Reversing entries are compacted right away unless the planner is append-only,
+        and the freed stock is queued for incremental re-allocation.
+        """
+        allocation_entry_dao = allocation_entry_dao or AllocationEntryDAO()
+        with transaction.atomic():
+            entries = allocation_entry_dao.revert_task(task.id)
+            if not entries:
+                return
+            if not self.allocation_planner.append_only:
+                allocation_entry_dao.compact(entry_ids=[entry.id for entry in entries])
+
+            detail_ids = (
+                DetailInStock.objects
+                .filter(id__in=[entry.detail_in_stock_id for entry in entries])
+                .order_by()
+                .values_list('detail_id', flat=True)
+                .distinct()
+            )
+            AllocationEvent.objects.bulk_create(
+                AllocationEvent(detail_id=detail_id, reason=AllocationEvent.Reason.STOCK_INCREASED)
+                for detail_id in detail_ids
+            )
+
+            holds_stock = allocation_entry_dao.annotate_pending_quantity(task.planned_details.all()).filter(
+                quantity_in_stock__gt=-F('pending_quantity'),
+            ).exists()
+            task.status = Task.Status.IN_PROGRESS if holds_stock else Task.Status.TODO
+            task.save(update_fields=['status', 'updated_at'])
+
+
+class AllocationWorker:
+    """
+    Allocates open tasks in batches claimed with FOR UPDATE SKIP LOCKED.
+
+    Several workers can run at the same time: each claims a batch of tasks no other
+    worker holds, allocates it in one transaction and stamps the tasks with allocated_at,
+    so a task is handled once per run. Planned details and stock rows are locked in id
+    order by the planner, so competing workers wait on each other instead of deadlocking.
+
+    The run is an AllocationCheckpoint shared by all workers: the first worker starts it and
+    workers started later join it, so they all skip tasks allocated since the same started_at.
+    The run is finished once no open task of it is left, including tasks other workers hold.
+    """
+
+    def __init__(
+            self,
+            allocation_planner: AllocationPlanner | None = None,
+            batch_size: int = 100,
+            run_name: str = 'allocation_workers',
+    ):
+        self.allocation_planner = allocation_planner or AllocationPlanner()
+        self.batch_size = batch_size
+        self.run_name = run_name
+
+    def get_open_tasks(self, started_at) -> QuerySet[Task]:
+        return (
+            Task.objects.using(self.allocation_planner.using)
+            .filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
+            .filter(Q(allocated_at__isnull=True) | Q(allocated_at__lt=started_at))
+        )
+
+    def claim_tasks(self, started_at) -> list[Task]:
+        """
+        Lock the next batch of open tasks not allocated since started_at, skipping tasks locked by other workers.
+        """
+        return list(
+            self.get_open_tasks(started_at)
+            .order_by('expected_date', 'id')
+            .select_for_update(skip_locked=True)[:self.batch_size],
+        )
+
+    def join_run(self, restart: bool = False) -> AllocationCheckpoint:
+        """
+        The run in progress, or a new one if the last run finished or restart is requested.
+        """
+        using = self.allocation_planner.using
+        AllocationCheckpoint.objects.using(using).get_or_create(name=self.run_name)
+        with transaction.atomic(using=using):
+            checkpoint = AllocationCheckpoint.objects.using(using).select_for_update().get(name=self.run_name)
+            if restart or checkpoint.finished_at is not None or checkpoint.started_at is None:
+                checkpoint.processed_tasks = 0
+                checkpoint.allocated_quantity = 0
+                checkpoint.started_at = timezone.now()
+                checkpoint.finished_at = None
+                checkpoint.save()
+        return checkpoint
+
+    def run(self, restart: bool = False) -> AllocationPlan:
+        """
+        Allocate batches of the shared run until no unclaimed open task is left.
+        """
+        using = self.allocation_planner.using
+        checkpoint = self.join_run(restart)
+        run = AllocationCheckpoint.objects.using(using).filter(id=checkpoint.id, started_at=checkpoint.started_at)
+        total_plan = AllocationPlan()
+        while True:
+            with transaction.atomic(using=using):
+                tasks = self.claim_tasks(checkpoint.started_at)
+                if not tasks:
+                    break
+                plan = self.allocation_planner.allocate(tasks)
+                Task.objects.using(using).filter(id__in=[task.id for task in tasks]).update(
+                    allocated_at=timezone.now(),
+                    updated_at=timezone.now(),
+                )
+                run.update(
+                    processed_tasks=F('processed_tasks') + len(tasks),
+                    allocated_quantity=F('allocated_quantity') + plan.allocated_quantity,
+                    updated_at=timezone.now(),
+                )
+            total_plan.merge(plan)
+
+        # tasks locked by other workers are still open in this transaction, their worker finishes the run
+        if not self.get_open_tasks(checkpoint.started_at).exists():
+            run.filter(finished_at__isnull=True).update(finished_at=timezone.now(), updated_at=timezone.now())
+        return total_plan
+
+
+class ChunkedAllocationService:
+    """
+    Allocates open tasks in deadline order, batch_size tasks per transaction.
+
+    Tasks are streamed with a server-side cursor and the position of the last task of
+    every chunk is committed together with its allocation, so an interrupted run resumes
+    after the last committed chunk instead of starting over.
+    """
+
+    def __init__(
+            self,
+            allocation_planner: AllocationPlanner | None = None,
+            batch_size: int = 1000,
+            checkpoint_name: str = 'allocate_details_between_tasks',
+    ):
+        self.allocation_planner = allocation_planner or AllocationPlanner()
+        self.batch_size = batch_size
+        self.checkpoint_name = checkpoint_name
+
+    def get_checkpoint(self, restart: bool = False) -> AllocationCheckpoint:
+        """
+        Checkpoint of the interrupted run, or a fresh one if the last run finished or restart is requested.
+        """
+        checkpoint, _ = AllocationCheckpoint.objects.using(self.allocation_planner.using).get_or_create(
+            name=self.checkpoint_name,
+        )
+        if restart or checkpoint.finished_at is not None or checkpoint.started_at is None:
+            checkpoint.last_expected_date = None
+            checkpoint.last_task_id = None
+            checkpoint.processed_tasks = 0
+            checkpoint.allocated_quantity = 0
+            checkpoint.started_at = timezone.now()
+            checkpoint.finished_at = None
+            checkpoint.save()
+        return checkpoint
+
+    def get_tasks(self, checkpoint: AllocationCheckpoint) -> QuerySet[Task]:
+        tasks = (
+            Task.objects.using(self.allocation_planner.using)
+            .filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
+            .only('id', 'expected_date', 'status')
+            .order_by('expected_date', 'id')
+        )
+        if checkpoint.last_task_id is not None:
+            tasks = tasks.filter(
+                Q(expected_date__gt=checkpoint.last_expected_date)
+                | Q(expected_date=checkpoint.last_expected_date, id__gt=checkpoint.last_task_id),
+            )
+        return tasks
+
+    def run(self, restart: bool = False) -> Iterator[tuple[AllocationCheckpoint, AllocationPlan]]:
+        """
+        Allocate the remaining chunks, yielding the checkpoint and the plan after every committed chunk.
+        """
+        using = self.allocation_planner.using
+        checkpoint = self.get_checkpoint(restart)
+        tasks = self.get_tasks(checkpoint).iterator(chunk_size=self.batch_size)
+        while chunk := list(islice(tasks, self.batch_size)):
+            started_at = time.perf_counter()
+            with transaction.atomic(using=using):
+                plan = self.allocation_planner.allocate(chunk)
+                checkpoint.last_expected_date = chunk[-1].expected_date
+                checkpoint.last_task_id = chunk[-1].id
+                checkpoint.processed_tasks += len(chunk)
+                checkpoint.allocated_quantity += plan.allocated_quantity
+                checkpoint.save()
+            elapsed = time.perf_counter() - started_at
+            logger.info(
+                "Allocated chunk of %s tasks (%s in total) in %.2fs, %.0f tasks/s",
+                len(chunk),
+                checkpoint.processed_tasks,
+                elapsed,
+                len(chunk) / elapsed if elapsed else 0,
+            )
+            yield checkpoint, plan
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+
+
+class IncrementalAllocationService:
+    """
+    Re-allocates only the planned details affected by queued AllocationEvents.
+
+    Stock of a detail can cover planned details of the detail itself and of its similar
+    details, so a batch of events re-allocates the open planned details of those details,
+    in deadline order. The cost of a batch depends on the changes, not on the backlog.
+    """
+
+    def __init__(self, allocation_planner: AllocationPlanner | None = None, batch_size: int = 500):
+        self.allocation_planner = allocation_planner or AllocationPlanner()
+        self.batch_size = batch_size
+
+    def process_batch(self) -> AllocationPlan | None:
+        """
+        Consume up to batch_size events, None if the queue is empty.
+        Events are claimed with SKIP LOCKED, so several processes can consume the queue.
+        """
+        using = self.allocation_planner.using
+        with transaction.atomic(using=using):
+            events = list(
+                AllocationEvent.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'detail_id')[:self.batch_size],
+            )
+            if not events:
+                return None
+
+            changed_detail_ids = {detail_id for _, detail_id in events}
+            detail_ids = changed_detail_ids.union(
+                DetailDAO.get_similar_detail_ids_query(changed_detail_ids)
+                .using(using)
+                .values_list('to_detail_id', flat=True),
+            )
+            tasks = (
+                Task.objects.using(using)
+                .filter(
+                    status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS],
+                    planned_details__detail_id__in=detail_ids,
+                    planned_details__quantity_in_stock__lt=F('planned_details__planned_quantity'),
+                )
+                .distinct()
+                .order_by('expected_date', 'id')
+            )
+            plan = self.allocation_planner.allocate(tasks, detail_ids=detail_ids)
+            AllocationEvent.objects.using(using).filter(id__in=[event_id for event_id, _ in events]).delete()
+        return plan
+
+    def process(self) -> AllocationPlan:
+        """
+        Consume the queue until it is empty.
+        """
+        total_plan = AllocationPlan()
+        while (plan := self.process_batch()) is not None:
+            total_plan.merge(plan)
+        return total_plan
+
+
+class AllocationJobDAO(BaseDao):
+    model = AllocationJob
+
+    def get_user_jobs(self, user: User) -> QuerySet[AllocationJob]:
+        return self.model.objects.filter(created_by=user)
+
+    def claim_next(self, stale_after: timedelta = ALLOCATION_JOB_STALE_AFTER) -> AllocationJob | None:
+        """
+        Mark the oldest pending job, or a running job without a heartbeat for stale_after, as running,
+        skipping jobs claimed by other workers at the same time.
+        """
+        with transaction.atomic():
+            job = self.model.objects.filter(
+                Q(status=AllocationJob.Status.PENDING)
+                | Q(status=AllocationJob.Status.RUNNING, heartbeat_at__lt=timezone.now() - stale_after),
+            ).order_by('id').select_for_update(skip_locked=True).first()
+            if job is not None:
+                if job.status == AllocationJob.Status.RUNNING:
+                    logger.warning(
+                        "Allocation job %s has no heartbeat since %s, claimed again", job.id, job.heartbeat_at,
+                    )
+                job.status = AllocationJob.Status.RUNNING
+                job.started_at = job.heartbeat_at = timezone.now()
+                job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+        return job
 
-        # Update status of fully allocated tasks to COMPLETED
-        if tasks_to_update:
-            Task.objects.filter(id__in=tasks_to_update).update(status=Task.Status.COMPLETED)
+    def save_progress(self, job: AllocationJob, **fields) -> bool:
+        """
+        Save fields of a running job with a new heartbeat, False if another worker claimed the job since.
+        """
+        job.heartbeat_at = timezone.now()
+        for field_name, value in fields.items():
+            setattr(job, field_name, value)
+        return self.model.objects.filter(id=job.id, started_at=job.started_at).update(
+            heartbeat_at=job.heartbeat_at,
+            **fields,
+        ) == 1
+
+
+class AllocationJobService:
+    """
+    Runs queued allocation jobs outside of the HTTP workers.
+
+    Tasks of a job are allocated in deadline order, batch_size tasks per transaction, and
+    the progress is saved after every batch so it can be polled while the job runs. The
+    progress is the heartbeat of the job: a job whose worker died is claimed again once
+    stale_after has passed, and the old worker stops when it notices.
+    """
+
+    def __init__(
+            self,
+            allocation_job_dao: AllocationJobDAO | None = None,
+            batch_size: int = 100,
+            stale_after: timedelta = ALLOCATION_JOB_STALE_AFTER,
+    ):
+        self.allocation_job_dao = allocation_job_dao or AllocationJobDAO()
+        self.batch_size = batch_size
+        self.stale_after = stale_after
+
+    @staticmethod
+    def get_job_tasks(job: AllocationJob) -> QuerySet[Task]:
+        tasks = Task.objects.filter(author_id=job.created_by_id, status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
+        if job.task_ids:
+            tasks = tasks.filter(id__in=job.task_ids)
+        return tasks.order_by('expected_date', 'id')
+
+    def run(self, job: AllocationJob) -> AllocationJob:
+        allocation_planner = AllocationPlanner(solver=get_allocation_solver(job.solver))
+        task_ids = list(self.get_job_tasks(job).values_list('id', flat=True))
+        if not self.allocation_job_dao.save_progress(job, total_tasks=len(task_ids), processed_tasks=0):
+            return self._claimed_by_other_worker(job)
+
+        total_plan = AllocationPlan()
+        try:
+            for start in range(0, len(task_ids), self.batch_size):
+                tasks = (
+                    Task.objects
+                    .filter(id__in=task_ids[start:start + self.batch_size])
+                    .order_by('expected_date', 'id')
+                )
+                total_plan.merge(allocation_planner.allocate(tasks))
+                processed_tasks = min(start + self.batch_size, len(task_ids))
+                if not self.allocation_job_dao.save_progress(job, processed_tasks=processed_tasks):
+                    return self._claimed_by_other_worker(job)
+        except Exception as error:
+            logger.exception("Allocation job %s failed", job.id)
+            status, error_message = AllocationJob.Status.FAILED, str(error)
+        else:
+            status, error_message = AllocationJob.Status.SUCCEEDED, ''
+        self.allocation_job_dao.save_progress(
+            job,
+            status=status,
+            error=error_message,
+            result={
+                'allocated_quantity': total_plan.allocated_quantity,
+                'completed_task_ids': total_plan.completed_task_ids,
+                'in_progress_task_ids': total_plan.in_progress_task_ids,
+                'query_count': total_plan.query_count,
+            },
+            finished_at=timezone.now(),
+        )
+        return job
+
+    @staticmethod
+    def _claimed_by_other_worker(job: AllocationJob) -> AllocationJob:
+        logger.warning("Allocation job %s was claimed by another worker, stopping", job.id)
+        return job
+
+    def run_pending(self) -> int:
+        """
+        Run pending and stale jobs until the queue is empty, returns the number of jobs run.
+        """
+        count = 0
+        while (job := self.allocation_job_dao.claim_next(self.stale_after)) is not None:
+            self.run(job)
+            count += 1
+        return count
@@ -0,0 +1,149 @@
+import random
+import time
+from dataclasses import dataclass, field
+
+from details.models import Detail, DetailInStock, PlannedDetail, WareHouse
+from details.services import detail_cache, stock_availability_cache, warehouse_cache
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Min, OuterRef, Subquery
+from django.db.models.functions import Least
+from django.utils import timezone
+from sa_project.services.helpers import copy_rows
+from tasks.models import Task
+
+__all__ = ['SyntheticDataGenerator']
+
+
+@dataclass
+class SyntheticDataGenerator:
+    """
+    Bulk loads a synthetic allocation data set: tasks and details with bulk_create,
+    planned details, similar details and stock rows with COPY.
+
+    Details are split into groups of similar_group_size details that are all similar
+    to each other, every task gets planned_details_per_task planned details.
+    """
+    tasks: int = 1000
+    planned_details_per_task: int = 10
+    details: int = 2000
+    similar_group_size: int = 3
+    warehouses: int = 10
+    stock_rows: int = 4000
+    seed: int = 0
+    batch_size: int = 10_000
+    using: str = DEFAULT_DB_ALIAS
+    rows: dict[str, int] = field(default_factory=dict)
+
+    def generate(self) -> User:
+        """
+        Load the data set and return the author of all tasks.
+        """
+        rnd = random.Random(self.seed)
+        author, _ = User.objects.using(self.using).get_or_create(username=f'benchmark-{self.seed}')
+        warehouse_ids = self._create_warehouses()
+        detail_ids = self._create_details()
+        self._create_similar_details(detail_ids)
+        task_ids = self._create_tasks(rnd, author)
+
+        self.rows['planned_details'] = copy_rows(
+            PlannedDetail._meta.db_table,
+            ['task_id', 'detail_id', 'planned_quantity', 'quantity_in_stock'],
+            (
+                (task_id, rnd.choice(detail_ids), rnd.randint(1, 20), 0)
+                for task_id in task_ids
+                for _ in range(self.planned_details_per_task)
+            ),
+            using=self.using,
+        )
+        self.rows['details_in_stock'] = copy_rows(
+            DetailInStock._meta.db_table,
+            ['detail_id', 'warehouse_id', 'quantity'],
+            (
+                (rnd.choice(detail_ids), rnd.choice(warehouse_ids), rnd.randint(1, 50))
+                for _ in range(self.stock_rows)
+            ),
+            using=self.using,
+        )
+        # bulk loads bypass the signals that invalidate the catalog caches
+        detail_cache.invalidate()
+        warehouse_cache.invalidate()
+        stock_availability_cache.invalidate()
+        return author
+
+    def _create_warehouses(self) -> list[int]:
+        run_id = f'{self.seed}-{time.time_ns()}'
+        warehouses = WareHouse.objects.using(self.using).bulk_create(
+            [
+                WareHouse(
+                    name=f'Warehouse {index}',
+                    address=f'Benchmark street {index}',
+                    phone=f'benchmark-{run_id}-{index}',
+                    email=f'warehouse-{run_id}-{index}@benchmark.local',
+                )
+                for index in range(self.warehouses)
+            ],
+        )
+        self.rows['warehouses'] = len(warehouses)
+        return [warehouse.id for warehouse in warehouses]
+
+    def _create_details(self) -> list[int]:
+        detail_ids = []
+        for start in range(0, self.details, self.batch_size):
+            details = Detail.objects.using(self.using).bulk_create(
+                [
+                    Detail(name=f'Detail {index}', unit_of_measurement='pcs', price_for_unit=1)
+                    for index in range(start, min(start + self.batch_size, self.details))
+                ],
+            )
+            detail_ids.extend(detail.id for detail in details)
+        self.rows['details'] = len(detail_ids)
+        return detail_ids
+
+    def _create_similar_details(self, detail_ids: list[int]):
+        if not detail_ids:
+            return
+        through = Detail.similar_details.through
+        self.rows['similar_details'] = copy_rows(
+            through._meta.db_table,
+            ['from_detail_id', 'to_detail_id'],
+            (
+                (from_detail_id, to_detail_id)
+                for start in range(0, len(detail_ids), self.similar_group_size)
+                for from_detail_id in detail_ids[start:start + self.similar_group_size]
+                for to_detail_id in detail_ids[start:start + self.similar_group_size]
+                if from_detail_id != to_detail_id
+            ),
+            using=self.using,
+        )
+        # groups are cliques, so the smallest neighbour is the smallest id of the group
+        smallest_similar_detail = (
+            through.objects.using(self.using)
+            .filter(from_detail_id=OuterRef('id'))
+            .order_by()
+            .values('from_detail_id')
+            .annotate(smallest=Min('to_detail_id'))
+            .values('smallest')
+        )
+        Detail.objects.using(self.using).filter(id__range=(min(detail_ids), max(detail_ids))).update(
+            substitution_group=Least('id', Subquery(smallest_similar_detail)),
+        )
+
+    def _create_tasks(self, rnd: random.Random, author: User) -> list[int]:
+        today = timezone.now().date()
+        task_ids = []
+        for start in range(0, self.tasks, self.batch_size):
+            tasks = Task.objects.using(self.using).bulk_create(
+                [
+                    Task(
+                        description=f'Benchmark task {index}',
+                        expected_date=today + timezone.timedelta(days=rnd.randint(1, 60)),
+                        author=author,
+                        executor=author,
+                    )
+                    for index in range(start, min(start + self.batch_size, self.tasks))
+                ],
+            )
+            task_ids.extend(task.id for task in tasks)
+        self.rows['tasks'] = len(task_ids)
+        return task_ids
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from details.tests.factories import TestDetailDataGenerator
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.models import AllocationJob, Task
+from tasks.services import AllocationJobDAO, AllocationJobService
+
+from .factories import TaskFactory, UserFactory
+
+
+class TestAllocationJobAPI(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        TestDetailDataGenerator().generate_test_data()
+        cls.user = User.objects.first()
+        cls.create_view_name = 'create-allocation-job'
+        cls.retrieve_view_name = 'retrieve-allocation-job'
+
+    def test_create_job_un_auth(self):
+        response = self.client.post(reverse(self.create_view_name))
+        self.assertEqual(response.status_code, 401)
+
+    def test_create_job_does_not_allocate(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse(self.create_view_name), data={'solver': 'priority'}, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], AllocationJob.Status.PENDING)
+        self.assertEqual(AllocationJob.objects.get(id=response.data['id']).solver, 'priority')
+        self.assertEqual(Task.objects.filter(status=Task.Status.TODO).count(), 3)
+
+    def test_create_job_with_unknown_tasks(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse(self.create_view_name), data={'task_ids': [0]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_job_with_tasks_of_other_user(self):
+        self.client.force_authenticate(UserFactory())
+        task_id = Task.objects.first().id
+        response = self.client.post(reverse(self.create_view_name), data={'task_ids': [task_id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['task_ids'], [f"Tasks [{task_id}] do not exist"])
+
+    def test_job_without_task_ids_allocates_own_tasks(self):
+        other_user = UserFactory()
+        self.client.force_authenticate(other_user)
+        own_task = TaskFactory(author=other_user, executor=other_user, expected_date=timezone.now() + timedelta(days=1))
+        self.client.post(reverse(self.create_view_name), format='json')
+
+        self.assertEqual(AllocationJobService().run_pending(), 1)
+
+        job = AllocationJob.objects.get()
+        self.assertEqual(job.total_tasks, 1)
+        self.assertEqual(job.result['in_progress_task_ids'] + job.result['completed_task_ids'], [own_task.id])
+        self.assertEqual(Task.objects.filter(status=Task.Status.TODO).count(), 3)
+
+    def test_stale_running_job_is_claimed_again(self):
+        started_at = timezone.now() - timedelta(hours=1)
+        job = AllocationJob.objects.create(
+            created_by=self.user,
+            status=AllocationJob.Status.RUNNING,
+            started_at=started_at,
+            heartbeat_at=started_at,
+        )
+        AllocationJob.objects.create(
+            created_by=self.user,
+            status=AllocationJob.Status.RUNNING,
+            heartbeat_at=timezone.now(),
+        )
+        allocation_job_dao = AllocationJobDAO()
+
+        self.assertEqual(allocation_job_dao.claim_next(timedelta(minutes=10)), job)
+        self.assertIsNone(allocation_job_dao.claim_next(timedelta(minutes=10)))
+        # the worker that lost the job stops saving into it
+        reclaimed_job = AllocationJob(id=job.id, started_at=started_at)
+        self.assertFalse(allocation_job_dao.save_progress(reclaimed_job, processed_tasks=1))
+
+        AllocationJobService(batch_size=1).run(AllocationJob.objects.get(id=job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, AllocationJob.Status.SUCCEEDED)
+        self.assertEqual(job.processed_tasks, 3)
+
+    def test_job_progress_and_result(self):
+        self.client.force_authenticate(self.user)
+        task_ids = list(Task.objects.order_by('id').values_list('id', flat=True)[:2])
+        job_id = self.client.post(
+            reverse(self.create_view_name),
+            data={'task_ids': task_ids},
+            format='json',
+        ).data['id']
+
+        self.assertEqual(AllocationJobService(batch_size=1).run_pending(), 1)
+
+        response = self.client.get(reverse(self.retrieve_view_name, kwargs={'pk': job_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], AllocationJob.Status.SUCCEEDED)
+        self.assertEqual((response.data['processed_tasks'], response.data['total_tasks']), (2, 2))
+        self.assertEqual(
+            sorted(response.data['result']['completed_task_ids'] + response.data['result']['in_progress_task_ids']),
+            task_ids,
+        )
+        self.assertEqual(Task.objects.filter(status=Task.Status.TODO).count(), 1)
+
+    def test_retrieve_job_of_other_user(self):
+        job = AllocationJob.objects.create(created_by=self.user)
+        self.client.force_authenticate(UserFactory())
+        response = self.client.get(reverse(self.retrieve_view_name, kwargs={'pk': job.id}))
+        self.assertEqual(response.status_code, 404)
@@ -1,5 +1,6 @@
 import json
 
+from details.models import Detail
 from details.tests.factories import TestDetailDataGenerator
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -36,6 +37,20 @@ class TestTaskAPI(APITestCase):
         self.assertEqual(len(response.data.get("results", [])), tasks.count())
         self.assertEqual(json.dumps(tasks_data), json.dumps(response.data['results']))
 
+    def test_get_task_list_embeds_details(self):
+        author = User.objects.first()
+        self.client.force_authenticate(author)
+        for limit in (1, 3):
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse(self.list_create_view_name), {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+
+        planned_detail = response.data['results'][0]['planned_details'][0]
+        detail = Detail.objects.get(id=planned_detail['detail'])
+        self.assertEqual(planned_detail['detail_name'], detail.name)
+        self.assertEqual(planned_detail['detail_unit_of_measurement'], detail.unit_of_measurement)
+        self.assertEqual(planned_detail['detail_price_for_unit'], str(detail.price_for_unit))
+
     def test_create_task(self):
         author = User.objects.first()
         self.client.force_authenticate(author)
@@ -0,0 +1,91 @@
+import json
+from io import StringIO
+
+from details.models import DetailInStock, PlannedDetail
+from details.tests.factories import TestDetailDataGenerator
+from django.core.management import call_command
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.models import AllocationCheckpoint, Task
+
+
+class TestAllocationCommand(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data_generator = TestDetailDataGenerator()
+        cls.data_generator.generate_test_data()
+
+    @staticmethod
+    def get_allocation_state():
+        return (
+            dict(Task.objects.values_list('id', 'status')),
+            dict(PlannedDetail.objects.values_list('id', 'quantity_in_stock')),
+            dict(DetailInStock.objects.values_list('id', 'quantity')),
+        )
+
+    def test_allocate(self):
+        out = StringIO()
+        call_command('allocate_details_between_tasks', stdout=out)
+        self.assertIn('1 tasks completed, 2 in progress', out.getvalue())
+        self.assertEqual(Task.objects.filter(status=Task.Status.COMPLETED).count(), 1)
+
+    def test_dry_run_does_not_write(self):
+        initial_state = self.get_allocation_state()
+        out = StringIO()
+        call_command('allocate_details_between_tasks', '--dry-run', stdout=out)
+        self.assertEqual(initial_state, self.get_allocation_state())
+
+        plan = json.loads(out.getvalue())
+        call_command('allocate_details_between_tasks', stdout=StringIO())
+        task_statuses, planned_detail_quantities, stock_quantities = self.get_allocation_state()
+
+        self.assertEqual(plan['completed_tasks'], 1)
+        for task in plan['tasks']:
+            self.assertEqual(task['status'], task_statuses[task['id']])
+            for planned_detail in task['planned_details']:
+                self.assertEqual(
+                    planned_detail['quantity_in_stock_after'],
+                    planned_detail_quantities[planned_detail['id']],
+                )
+                self.assertEqual(
+                    planned_detail['quantity_in_stock_after'] - planned_detail['quantity_in_stock_before'],
+                    sum(allocation['quantity'] for allocation in planned_detail['allocations']),
+                )
+        for detail_in_stock in plan['details_in_stock']:
+            self.assertEqual(detail_in_stock['quantity_after'], stock_quantities[detail_in_stock['id']])
+            self.assertEqual(detail_in_stock['quantity_before'], initial_state[2][detail_in_stock['id']])
+
+    def test_chunked_allocation(self):
+        out = StringIO()
+        call_command('allocate_details_between_tasks', '--batch-size', '1', stdout=out)
+        self.assertIn('3 tasks processed', out.getvalue())
+
+        checkpoint = AllocationCheckpoint.objects.get()
+        self.assertIsNotNone(checkpoint.finished_at)
+        self.assertEqual(checkpoint.processed_tasks, 3)
+        self.assertEqual(
+            checkpoint.allocated_quantity,
+            PlannedDetail.objects.aggregate(total=Sum('quantity_in_stock'))['total'],
+        )
+        self.assertFalse(Task.objects.filter(status=Task.Status.TODO).exists())
+
+    def test_chunked_allocation_resumes_after_checkpoint(self):
+        first_task, *other_tasks = Task.objects.order_by('expected_date', 'id')
+        AllocationCheckpoint.objects.create(
+            name='allocate_details_between_tasks',
+            last_expected_date=first_task.expected_date,
+            last_task_id=first_task.id,
+            processed_tasks=1,
+            started_at=timezone.now(),
+        )
+
+        call_command('allocate_details_between_tasks', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(Task.objects.get(id=first_task.id).status, Task.Status.TODO)
+        self.assertFalse(
+            Task.objects.filter(id__in=[task.id for task in other_tasks], status=Task.Status.TODO).exists(),
+        )
+        self.assertEqual(AllocationCheckpoint.objects.get().processed_tasks, 3)
+
+        call_command('allocate_details_between_tasks', '--batch-size', '2', stdout=StringIO())
+        self.assertNotEqual(Task.objects.get(id=first_task.id).status, Task.Status.TODO)
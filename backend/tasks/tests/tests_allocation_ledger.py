@@ -0,0 +1,165 @@
+from collections import defaultdict
+from unittest.mock import ANY
+
+from details.models import AllocationEntry, AllocationEvent, DetailInStock, PlannedDetail
+from details.planner import AllocationPlanner
+from details.services import (
+    AllocationEntryDAO, DetailInStockDAO,
+    PlannedDetailAllocationService,
+    PlannedDetailDAO, StockAvailabilityService,
+)
+from details.tests.factories import (
+    DetailFactory, DetailInStockFactory,
+    PlannedDetailFactory,
+    TestDetailDataGenerator, WareHouseFactory,
+)
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.models import Task
+from tasks.services import TaskDAO, TaskService
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestAllocationLedger(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.allocation_entry_dao = AllocationEntryDAO()
+        TestDetailDataGenerator(
+            user_factory=UserFactory,
+            task_factory=TaskFactory,
+            detail_factory=DetailFactory,
+            warehouse_factory=WareHouseFactory,
+            planned_detail_factory=PlannedDetailFactory,
+            detail_in_stock_factory=DetailInStockFactory,
+        ).generate_test_data()
+
+    @staticmethod
+    def get_task_service(append_only: bool = False) -> TaskService:
+        return TaskService(
+            task_dao=TaskDAO(),
+            planned_detail_allocation_service=PlannedDetailAllocationService(),
+            planned_detail_dao=PlannedDetailDAO(),
+            allocation_planner=AllocationPlanner(append_only=append_only),
+        )
+
+    @staticmethod
+    def get_open_tasks():
+        return Task.objects.filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS]).order_by("expected_date")
+
+    @staticmethod
+    def get_allocation_state():
+        return (
+            dict(Task.objects.values_list('id', 'status')),
+            dict(PlannedDetail.objects.values_list('id', 'quantity_in_stock')),
+            dict(DetailInStock.objects.values_list('id', 'quantity')),
+        )
+
+    def test_allocation_is_recorded_in_ledger(self):
+        plan = self.get_task_service().allocate_task_list(self.get_open_tasks())
+
+        self.assertEqual(AllocationEntry.objects.count(), len(plan.allocations))
+        self.assertFalse(AllocationEntry.objects.filter(compacted_at__isnull=True).exists())
+        self.assertEqual(AllocationEntry.objects.aggregate(total=Sum('quantity'))['total'], plan.allocated_quantity)
+
+    def test_append_only_allocation_matches_after_compaction(self):
+        with transaction.atomic():
+            self.get_task_service().allocate_task_list(self.get_open_tasks())
+            expected_state = self.get_allocation_state()
+            transaction.set_rollback(True)
+
+        initial_quantities = dict(DetailInStock.objects.values_list('id', 'quantity'))
+        plan = self.get_task_service(append_only=True).allocate_task_list(self.get_open_tasks())
+        self.assertEqual(initial_quantities, dict(DetailInStock.objects.values_list('id', 'quantity')))
+        self.assertEqual(AllocationEntry.objects.filter(compacted_at__isnull=True).count(), len(plan.allocations))
+
+        # pending entries are taken into account, nothing is allocated twice
+        second_plan = self.get_task_service(append_only=True).allocate_task_list(self.get_open_tasks())
+        self.assertEqual(second_plan.allocated_quantity, 0)
+
+        self.assertEqual(self.allocation_entry_dao.compact(batch_size=2), len(plan.allocations))
+        self.assertEqual(expected_state, self.get_allocation_state())
+
+    def test_append_only_allocation_updates_availability(self):
+        cache.clear()
+        detail_ids = list(DetailInStock.objects.values_list('detail_id', flat=True).distinct())
+        availability_service = StockAvailabilityService()
+        availability_service.get_quantities(detail_ids)
+
+        plan = self.get_task_service(append_only=True).allocate_task_list(self.get_open_tasks())
+        self.assertGreater(plan.allocated_quantity, 0)
+
+        exported = defaultdict(int)
+        for row in DetailInStockDAO.get_stock_for_export():
+            exported[row[1]] += row[-1]
+        available = {
+            detail_id: own_quantity
+            for detail_id, (own_quantity, similar_quantity) in availability_service.get_quantities(detail_ids).items()
+        }
+        self.assertEqual(available, dict(exported))
+
+    def test_legacy_allocation_after_append_only_allocation(self):
+        user = UserFactory()
+        detail = DetailFactory()
+        stock = DetailInStockFactory(detail=detail, quantity=10)
+        first_task, second_task = (
+            TaskFactory(author=user, executor=user, expected_date=timezone.now().date()) for _ in range(2)
+        )
+        first_planned_detail = PlannedDetailFactory(task=first_task, detail=detail, planned_quantity=7)
+        second_planned_detail = PlannedDetailFactory(task=second_task, detail=detail, planned_quantity=7)
+        self.get_task_service(append_only=True).allocate_task_list([first_task])
+
+        # the legacy path sees the pending entries: nothing is allocated twice, nothing is oversold
+        task_service = self.get_task_service()
+        task_service.allocate_task(first_task)
+        task_service.allocate_task(second_task)
+        self.assertEqual(AllocationEntry.objects.filter(task=first_task).count(), 1)
+        second_planned_detail.refresh_from_db()
+        self.assertEqual(second_planned_detail.quantity_in_stock, 3)
+        self.assertEqual(
+            list(AllocationEntry.objects.filter(task=second_task).values_list('quantity', 'compacted_at')),
+            [(3, ANY)],
+        )
+        self.assertFalse(AllocationEntry.objects.filter(task=second_task, compacted_at__isnull=True).exists())
+
+        self.allocation_entry_dao.compact()
+        stock.refresh_from_db()
+        first_planned_detail.refresh_from_db()
+        self.assertEqual((stock.quantity, first_planned_detail.quantity_in_stock), (0, 7))
+
+        # and what it allocated is reverted through the ledger
+        task_service.undo_allocation(second_task)
+        stock.refresh_from_db()
+        second_planned_detail.refresh_from_db()
+        self.assertEqual((stock.quantity, second_planned_detail.quantity_in_stock), (3, 0))
+
+    def test_undo_allocation(self):
+        initial_state = self.get_allocation_state()
+        task_service = self.get_task_service()
+        task_service.allocate_task_list(self.get_open_tasks())
+
+        for task in Task.objects.all():
+            task_service.undo_allocation(task)
+
+        self.assertEqual(initial_state, self.get_allocation_state())
+        self.assertEqual(AllocationEntry.objects.aggregate(total=Sum('quantity'))['total'], 0)
+        self.assertTrue(AllocationEvent.objects.filter(reason=AllocationEvent.Reason.STOCK_INCREASED).exists())
+
+    def test_undo_append_only_allocation(self):
+        initial_state = self.get_allocation_state()
+        task_service = self.get_task_service(append_only=True)
+        task_service.allocate_task_list(self.get_open_tasks())
+        task = Task.objects.get(status=Task.Status.COMPLETED)
+
+        task_service.undo_allocation(task)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.Status.TODO)
+
+        self.allocation_entry_dao.compact()
+        self.assertFalse(task.planned_details.filter(quantity_in_stock__gt=0).exists())
+        self.assertEqual(
+            sum(initial_state[2].values()) - DetailInStock.objects.aggregate(total=Sum('quantity'))['total'],
+            PlannedDetail.objects.aggregate(total=Sum('quantity_in_stock'))['total'],
+        )
@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+
+from details.models import DetailInStock, DetailStockTotal, PlannedDetail
+from details.tests.factories import (
+    DetailFactory, DetailInStockFactory,
+    PlannedDetailFactory, WareHouseFactory,
+)
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, tag
+from django.utils import timezone
+from tasks.models import AllocationCheckpoint, Task
+from tasks.services import AllocationWorker
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestAllocationWorkerRun(TestCase):
+
+    def setUp(self):
+        author, executor = UserFactory.create_batch(2)
+        detail = DetailFactory()
+        DetailInStockFactory(detail=detail, warehouse=WareHouseFactory(), quantity=100)
+        self.tasks = []
+        for days in (1, 2, 3):
+            task = TaskFactory(
+                author=author,
+                executor=executor,
+                expected_date=timezone.now().date() + timezone.timedelta(days=days),
+            )
+            PlannedDetailFactory(task=task, detail=detail, planned_quantity=5)
+            self.tasks.append(task)
+
+    @staticmethod
+    def get_task_ids(plan) -> list[int]:
+        return sorted(plan.completed_task_ids + plan.in_progress_task_ids)
+
+    def test_later_worker_joins_run_in_progress(self):
+        checkpoint = AllocationWorker().join_run()
+        # allocated by a worker of the same run that started earlier and is still running
+        Task.objects.filter(id=self.tasks[0].id).update(allocated_at=timezone.now())
+
+        plan = AllocationWorker(batch_size=1).run()
+
+        self.assertEqual(self.get_task_ids(plan), [task.id for task in self.tasks[1:]])
+        run = AllocationCheckpoint.objects.get(id=checkpoint.id)
+        self.assertEqual(run.started_at, checkpoint.started_at)
+        self.assertEqual(run.processed_tasks, 2)
+        self.assertEqual(run.allocated_quantity, 10)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_worker_starts_new_run_after_finished_run(self):
+        first_plan = AllocationWorker().run()
+        Task.objects.update(status=Task.Status.IN_PROGRESS)
+
+        plan = AllocationWorker().run()
+
+        self.assertEqual(self.get_task_ids(first_plan), [task.id for task in self.tasks])
+        self.assertEqual(self.get_task_ids(plan), [task.id for task in self.tasks])
+        self.assertEqual(AllocationCheckpoint.objects.get().processed_tasks, 3)
+
+    def test_restart_ignores_run_in_progress(self):
+        AllocationWorker().join_run()
+        Task.objects.update(allocated_at=timezone.now())
+
+        self.assertEqual(self.get_task_ids(AllocationWorker().run()), [])
+        AllocationCheckpoint.objects.update(finished_at=None)
+        plan = AllocationWorker().run(restart=True)
+
+        self.assertEqual(self.get_task_ids(plan), [task.id for task in self.tasks])
+
+
+class TestAllocationWorkersOnSameDetails(TransactionTestCase):
+
+    def setUp(self):
+        author, executor = UserFactory.create_batch(2)
+        warehouse = WareHouseFactory()
+        self.first_detail, self.second_detail = DetailFactory.create_batch(2)
+        # the worker's rows of the second detail come first, so writing them in id order
+        # reaches the total of the second detail before the total of the first one
+        for detail in (self.second_detail, self.first_detail):
+            DetailInStockFactory(detail=detail, warehouse=warehouse, quantity=5)
+        self.other_stock = [
+            DetailInStockFactory(detail=detail, warehouse=warehouse, quantity=5)
+            for detail in (self.first_detail, self.second_detail)
+        ]
+        task = TaskFactory(author=author, executor=executor, expected_date=timezone.now().date())
+        for detail in (self.first_detail, self.second_detail):
+            PlannedDetailFactory(task=task, detail=detail, planned_quantity=5)
+
+    def run_worker(self, plans: list, errors: list):
+        try:
+            plans.append(AllocationWorker().run())
+        except DatabaseError as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    def wait_for_lock_wait(self):
+        with connection.cursor() as cursor:
+            for _ in range(100):
+                # the statistics are a snapshot per transaction otherwise
+                cursor.execute('SELECT pg_stat_clear_snapshot()')
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND pid <> pg_backend_pid()",
+                )
+                if cursor.fetchone()[0]:
+                    return
+                time.sleep(0.05)
+        self.fail("The worker never waited for a lock")
+
+    def test_writers_of_disjoint_rows_of_same_details_do_not_deadlock(self):
+        plans, errors = [], []
+        worker = threading.Thread(target=self.run_worker, args=(plans, errors))
+        with transaction.atomic():
+            # another writer updates its own rows of both details, first detail first
+            DetailInStock.objects.filter(id=self.other_stock[0].id).update(quantity=4)
+            worker.start()
+            self.wait_for_lock_wait()
+            DetailInStock.objects.filter(id=self.other_stock[1].id).update(quantity=4)
+        worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(plans[0].allocated_quantity, 10)
+        self.assertEqual(
+            dict(DetailStockTotal.objects.values_list('detail_id', 'quantity')),
+            {self.first_detail.id: 4, self.second_detail.id: 4},
+        )
+
+
+@tag('stress')
+class TestConcurrentAllocationWorkers(TransactionTestCase):
+    workers = 4
+    tasks = 60
+
+    def setUp(self):
+        rnd = random.Random(0)
+        author, executor = UserFactory.create_batch(2)
+        warehouses = WareHouseFactory.create_batch(3)
+        details = DetailFactory.create_batch(6)
+        for detail, similar_detail in zip(details[::2], details[1::2]):
+            detail.similar_details.add(similar_detail)
+        for _ in range(30):
+            DetailInStockFactory(
+                detail=rnd.choice(details),
+                warehouse=rnd.choice(warehouses),
+                quantity=rnd.randint(1, 20),
+            )
+        for _ in range(self.tasks):
+            task = TaskFactory(
+                author=author,
+                executor=executor,
+                expected_date=timezone.now().date() + timezone.timedelta(days=rnd.randint(1, 10)),
+            )
+            for detail in rnd.sample(details, 3):
+                PlannedDetailFactory(task=task, detail=detail, planned_quantity=rnd.randint(1, 15))
+
+    def run_worker(self, plans: list, errors: list):
+        try:
+            plans.append(AllocationWorker(batch_size=5).run())
+        except DatabaseError as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    def test_workers_allocate_every_task_once_without_deadlocks(self):
+        initial_stock = DetailInStock.objects.aggregate(total=Sum('quantity'))['total']
+        plans, errors = [], []
+        threads = [threading.Thread(target=self.run_worker, args=(plans, errors)) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        allocated_task_ids = [
+            task_id
+            for plan in plans
+            for task_id in plan.completed_task_ids + plan.in_progress_task_ids
+        ]
+        self.assertEqual(len(allocated_task_ids), self.tasks)
+        self.assertEqual(len(set(allocated_task_ids)), self.tasks)
+        self.assertFalse(Task.objects.filter(allocated_at__isnull=True).exists())
+
+        allocated_quantity = sum(plan.allocated_quantity for plan in plans)
+        self.assertEqual(allocated_quantity, PlannedDetail.objects.aggregate(total=Sum('quantity_in_stock'))['total'])
+        self.assertEqual(
+            initial_stock - allocated_quantity,
+            DetailInStock.objects.aggregate(total=Sum('quantity'))['total'],
+        )
+        self.assertFalse(PlannedDetail.objects.filter(quantity_in_stock__gt=F('planned_quantity')).exists())
@@ -0,0 +1,64 @@
+import json
+from io import StringIO
+
+from details.models import Detail, DetailInStock, DetailStockTotal, PlannedDetail
+from django.core.management import call_command
+from django.db.models import Sum
+from rest_framework.test import APITestCase
+from tasks.benchmark import compare_results
+from tasks.models import Task
+from tasks.synthetic_data import SyntheticDataGenerator
+
+
+class TestAllocationBenchmark(APITestCase):
+
+    def test_synthetic_data_generator(self):
+        generator = SyntheticDataGenerator(
+            tasks=5,
+            planned_details_per_task=3,
+            details=7,
+            similar_group_size=3,
+            warehouses=2,
+            stock_rows=11,
+        )
+        generator.generate()
+
+        self.assertEqual(Task.objects.count(), 5)
+        self.assertEqual(PlannedDetail.objects.count(), 15)
+        self.assertEqual(DetailInStock.objects.count(), 11)
+        self.assertEqual(generator.rows['similar_details'], 2 * 3 + 2 * 3 + 0)
+        self.assertEqual(Detail.objects.values('substitution_group').distinct().count(), 3)
+        self.assertEqual(
+            DetailStockTotal.objects.aggregate(total=Sum('quantity'))['total'],
+            DetailInStock.objects.aggregate(total=Sum('quantity'))['total'],
+        )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_allocation',
+            '--tasks', '10',
+            '--details', '10',
+            '--stock-rows', '20',
+            '--sample-tasks', '3',
+            stdout=out,
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(
+            [result['name'] for result in report['results']],
+            [
+                'allocate_task',
+                'allocate_task_list',
+                'task_list_endpoint',
+                'detail_list_endpoint',
+                'planned_detail_list_endpoint',
+            ],
+        )
+        self.assertEqual(report['results'][0]['calls'], 3)
+        self.assertTrue(all(result['query_count'] > 0 for result in report['results']))
+        # the data set is rolled back
+        self.assertFalse(Task.objects.exists())
+
+        comparison = compare_results(report, report)
+        self.assertTrue(all(item['query_count_delta'] == 0 for item in comparison))
@@ -0,0 +1,47 @@
+import time
+
+from details.models import PlannedDetail
+from details.tests.factories import PlannedDetailFactory
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APITestCase
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestTaskConditionalGet(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+
+    def test_task(self):
+        task = TaskFactory(author=self.user, executor=self.user, expected_date='2100-01-01')
+        url = reverse('retrieve-update-delete-task', kwargs={'pk': task.id})
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.client.patch(reverse('update-to-review', kwargs={'pk': task.id}))
+        modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data['status'], 'Review')
+
+        # another user's tag is never confirmed
+        self.client.force_authenticate(UserFactory())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=modified['ETag']).status_code, 403)
+
+    def test_task_expand(self):
+        task = TaskFactory(author=self.user, executor=self.user, expected_date='2100-01-01')
+        planned_detail = PlannedDetailFactory(task=task, planned_quantity=5)
+        url = reverse('retrieve-update-delete-task', kwargs={'pk': task.id})
+        response = self.client.get(url, {'expand': 'planned_details'})
+        self.assertNotIn('ETag', response)
+
+        # the expanded planned detail changes, the task itself does not
+        PlannedDetail.objects.filter(id=planned_detail.id).update(planned_quantity=7)
+        later = http_date(time.time() + 3600)
+        modified = self.client.get(url, {'expand': 'planned_details'}, HTTP_IF_MODIFIED_SINCE=later)
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data['planned_details'][0]['planned_quantity'], 7)
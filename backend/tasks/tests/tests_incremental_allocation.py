@@ -0,0 +1,84 @@
+from io import StringIO
+
+from details.models import AllocationEvent, DetailInStock, PlannedDetail
+from details.tests.factories import (
+    DetailFactory, DetailInStockFactory,
+    PlannedDetailFactory, WareHouseFactory,
+)
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.models import Task
+from tasks.services import IncrementalAllocationService
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestIncrementalAllocation(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = UserFactory()
+        cls.warehouse = WareHouseFactory()
+        cls.detail = DetailFactory()
+        cls.similar_detail = DetailFactory()
+        cls.other_detail = DetailFactory()
+        cls.detail.similar_details.add(cls.similar_detail)
+
+        today = timezone.now().date()
+        cls.early_task = TaskFactory(author=user, executor=user, expected_date=today + timezone.timedelta(days=1))
+        cls.late_task = TaskFactory(author=user, executor=user, expected_date=today + timezone.timedelta(days=5))
+        cls.early_planned_detail = PlannedDetailFactory(
+            task=cls.early_task, detail=cls.similar_detail, planned_quantity=4, quantity_in_stock=0,
+        )
+        cls.late_planned_detail = PlannedDetailFactory(
+            task=cls.late_task, detail=cls.detail, planned_quantity=4, quantity_in_stock=0,
+        )
+        cls.other_planned_detail = PlannedDetailFactory(
+            task=cls.late_task, detail=cls.other_detail, planned_quantity=1, quantity_in_stock=0,
+        )
+        cls.other_stock = DetailInStockFactory(detail=cls.other_detail, warehouse=cls.warehouse, quantity=1)
+        AllocationEvent.objects.all().delete()
+
+    def test_stock_increase_enqueues_event(self):
+        detail_in_stock = DetailInStockFactory(detail=self.detail, warehouse=self.warehouse, quantity=2)
+        detail_in_stock = DetailInStock.objects.get(id=detail_in_stock.id)
+        detail_in_stock.quantity = 1
+        detail_in_stock.save()
+        detail_in_stock.quantity = 3
+        detail_in_stock.save()
+
+        self.assertEqual(
+            list(AllocationEvent.objects.values_list('detail_id', 'reason')),
+            [(self.detail.id, AllocationEvent.Reason.STOCK_INCREASED)] * 2,
+        )
+
+    def test_only_affected_planned_details_are_allocated(self):
+        DetailInStockFactory(detail=self.detail, warehouse=self.warehouse, quantity=6)
+
+        plan = IncrementalAllocationService().process()
+
+        # stock of the detail reaches the earlier task through the similar detail
+        self.assertEqual(PlannedDetail.objects.get(id=self.early_planned_detail.id).quantity_in_stock, 4)
+        self.assertEqual(PlannedDetail.objects.get(id=self.late_planned_detail.id).quantity_in_stock, 2)
+        # the other detail had no change, its stock stays untouched
+        self.assertEqual(PlannedDetail.objects.get(id=self.other_planned_detail.id).quantity_in_stock, 0)
+        self.assertEqual(DetailInStock.objects.get(id=self.other_stock.id).quantity, 1)
+        self.assertEqual(plan.completed_task_ids, [self.early_task.id])
+        self.assertEqual(plan.in_progress_task_ids, [self.late_task.id])
+        self.assertFalse(AllocationEvent.objects.exists())
+
+    def test_empty_queue(self):
+        plan = IncrementalAllocationService().process()
+        self.assertEqual(plan.allocated_quantity, 0)
+        self.assertEqual(PlannedDetail.objects.filter(quantity_in_stock__gt=0).count(), 0)
+
+    def test_bulk_allocation_does_not_enqueue(self):
+        call_command('allocate_details_between_tasks', stdout=StringIO())
+        self.assertEqual(Task.objects.get(id=self.late_task.id).status, Task.Status.IN_PROGRESS)
+        self.assertFalse(AllocationEvent.objects.exists())
+
+    def test_command(self):
+        DetailInStockFactory(detail=self.detail, warehouse=self.warehouse, quantity=8)
+        call_command('process_allocation_events', stdout=StringIO())
+        self.assertEqual(Task.objects.get(id=self.early_task.id).status, Task.Status.COMPLETED)
+        self.assertEqual(Task.objects.get(id=self.late_task.id).status, Task.Status.IN_PROGRESS)
+        self.assertEqual(PlannedDetail.objects.get(id=self.late_planned_detail.id).quantity_in_stock, 4)
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from sa_project.services.pagination import KeysetLimitOffsetPagination
+from tasks.models import Task
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestKeysetPagination(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        today = timezone.now().date()
+        # several tasks share every expected date
+        self.tasks = [
+            TaskFactory(
+                author=self.user,
+                executor=self.user,
+                expected_date=today + timezone.timedelta(days=index % 3 + 1),
+            )
+            for index in range(7)
+        ]
+        TaskFactory(author=UserFactory(), executor=self.user, expected_date=today + timezone.timedelta(days=1))
+
+    def walk(self, url: str) -> tuple[list[dict], list[int]]:
+        pages = []
+        while url:
+            # the page and the prefetched planned details, whatever the position
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            self.assertIsNone(response.data['previous'])
+            pages.append(response.data['results'])
+            url = response.data['next']
+        return pages, [len(page) for page in pages]
+
+    def test_task_list_keyset_pages(self):
+        pages, page_sizes = self.walk(f"{reverse('list-create-task')}?cursor=&limit=3")
+
+        self.assertEqual(page_sizes, [3, 3, 1])
+        expected_ids = [
+            task.id for task in sorted(self.tasks, key=lambda task: (task.expected_date, task.id))
+        ]
+        self.assertEqual([task['id'] for page in pages for task in page], expected_ids)
+
+    def test_keyset_pages_follow_new_rows(self):
+        response = self.client.get(f"{reverse('list-create-task')}?cursor=&limit=4")
+        last_task = Task.objects.get(id=response.data['results'][-1]['id'])
+        # rows added before the cursor do not shift the next page like an offset would
+        TaskFactory(author=self.user, executor=self.user, expected_date=last_task.expected_date)
+        Task.objects.filter(id=response.data['results'][0]['id']).delete()
+
+        next_page = self.client.get(response.data['next']).data['results']
+        self.assertTrue(all(
+            (task['expected_date'], task['id']) > (str(last_task.expected_date), last_task.id)
+            for task in next_page
+        ))
+
+    def test_only_keyset_pages_are_capped(self):
+        url = reverse('list-create-task')
+        with patch.object(KeysetLimitOffsetPagination, 'keyset_max_limit', 2):
+            keyset_page = self.client.get(url, {'limit': 5, 'cursor': ''}).data
+            offset_page = self.client.get(url, {'limit': 5}).data
+        self.assertEqual(len(keyset_page['results']), 2)
+        self.assertIn('limit=2', keyset_page['next'])
+        self.assertEqual(len(offset_page['results']), 5)
+
+    def test_count_modes(self):
+        url = reverse('list-create-task')
+        response = self.client.get(url, {'limit': 3})
+        self.assertEqual(response.data['count'], 7)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 3, 'offset': 3, 'count': 'none'})
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIn('offset=6', response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+        response = self.client.get(url, {'limit': 3, 'offset': 6, 'count': 'none'})
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(url, {'limit': 3, 'cursor': '', 'count': 'estimate'})
+        self.assertIsInstance(response.data['count'], int)
+        response = self.client.get(url, {'limit': 3, 'cursor': '', 'count': 'exact'})
+        self.assertEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('list-create-task'), {'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 404)
+
+        for position in (['abc', 1], ['2020-01-01', 'x'], [None, 1], ['2020-01-01'], [[], {}]):
+            cursor = KeysetLimitOffsetPagination().encode_cursor(position)
+            with self.subTest(position=position):
+                response = self.client.get(reverse('list-create-task'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
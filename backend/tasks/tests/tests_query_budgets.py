@@ -0,0 +1,89 @@
+from details.services import PlannedDetailAllocationService, PlannedDetailDAO
+from details.tests.factories import generate_query_budget_data
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from sa_project.tests.query_budget import QueryBudgetTestMixin
+from tasks import urls
+from tasks.models import AllocationJob
+from tasks.services import TaskDAO, TaskService
+
+SIZES = (1, 10, 40)
+PLANNED_DETAILS_PER_TASK = 3
+
+
+class TestTaskQueryBudgets(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        self.task_service = TaskService(
+            task_dao=TaskDAO(),
+            planned_detail_allocation_service=PlannedDetailAllocationService(),
+            planned_detail_dao=PlannedDetailDAO(),
+        )
+
+    def create_data(self, size: int) -> dict:
+        data = generate_query_budget_data(size, PLANNED_DETAILS_PER_TASK)
+        self.client.force_authenticate(data['author'])
+        data['job'] = AllocationJob.objects.create(
+            created_by=data['author'],
+            task_ids=[task.id for task in data['tasks']],
+        )
+        return data
+
+    @staticmethod
+    def get_requests(data: dict) -> dict[tuple[str, str], tuple[dict, dict | None]]:
+        task = data['tasks'][0]
+        task_data = {
+            'description': 'budget task',
+            'expected_date': str(timezone.now().date() + timezone.timedelta(days=1)),
+            'executor': data['author'].id,
+        }
+        task_kwargs = {'pk': task.id}
+        return {
+            ('list-create-task', 'get'): ({}, None),
+            ('list-create-task', 'post'): ({}, task_data),
+            ('retrieve-update-delete-task', 'get'): (task_kwargs, None),
+            ('retrieve-update-delete-task', 'put'): (task_kwargs, task_data),
+            ('retrieve-update-delete-task', 'patch'): (task_kwargs, {'description': 'budget task'}),
+            ('retrieve-update-delete-task', 'delete'): (task_kwargs, None),
+            ('update-to-in-progress', 'patch'): (task_kwargs, None),
+            ('update-to-review', 'patch'): (task_kwargs, None),
+            ('update-to-completed', 'patch'): (task_kwargs, None),
+            ('create-allocation-job', 'post'): ({}, {'task_ids': [task.id for task in data['tasks']]}),
+            ('retrieve-allocation-job', 'get'): ({'pk': data['job'].id}, None),
+        }
+
+    def test_every_view_has_a_budget(self):
+        self.assertViewsHaveQueryBudgets(urls.urlpatterns)
+
+    def test_endpoint_budgets(self):
+        self.assertEndpointQueryBudgets(urls.urlpatterns, SIZES, self.create_data, self.get_requests)
+
+    def test_allocate_task_budget(self):
+        self.assertQueryCountsConstant(
+            TaskService.allocate_task,
+            SIZES,
+            self.create_data,
+            lambda data: self.task_service.allocate_task(data['tasks'][0]),
+            items=PLANNED_DETAILS_PER_TASK,
+        )
+
+    def test_allocate_task_list_budget(self):
+        self.assertQueryCountsConstant(
+            TaskService.allocate_task_list,
+            SIZES,
+            self.create_data,
+            lambda data: self.task_service.allocate_task_list(data['tasks']),
+        )
+
+    def test_undo_allocation_budget(self):
+        def create_data(size: int) -> dict:
+            data = self.create_data(size)
+            self.task_service.allocate_task_list(data['tasks'])
+            return data
+
+        self.assertQueryCountsConstant(
+            TaskService.undo_allocation,
+            SIZES,
+            create_data,
+            lambda data: self.task_service.undo_allocation(data['tasks'][0]),
+        )
@@ -0,0 +1,49 @@
+from details.tests.factories import DetailFactory, PlannedDetailFactory
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from tasks.tests.factories import TaskFactory, UserFactory
+
+
+class TestTaskSparseFields(APITestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+        self.task = TaskFactory(author=self.user, executor=self.user, expected_date=timezone.now().date())
+        self.detail = DetailFactory()
+        self.planned_detail = PlannedDetailFactory(task=self.task, detail=self.detail, planned_quantity=2)
+
+    def test_task_list_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('list-create-task'), {'fields': 'id,status,planned_details.detail_name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['results'],
+            [{'id': self.task.id, 'status': self.task.status, 'planned_details': [{'detail_name': self.detail.name}]}],
+        )
+        task_query, planned_details_query = [query['sql'] for query in queries.captured_queries[-2:]]
+        self.assertNotIn('"description"', task_query)
+        self.assertNotIn('"planned_quantity"', planned_details_query)
+        self.assertNotIn('"price_for_unit"', planned_details_query)
+
+    def test_task_expand_planned_details_detail(self):
+        url = reverse('retrieve-update-delete-task', kwargs={'pk': self.task.id})
+        response = self.client.get(url, {'fields': 'id,planned_details', 'expand': 'planned_details.detail'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data), ['id', 'planned_details'])
+        [planned_detail] = response.data['planned_details']
+        self.assertEqual(planned_detail['id'], self.planned_detail.id)
+        self.assertEqual(planned_detail['detail']['name'], self.detail.name)
+
+        # task, author for the permission, planned details joined with their details
+        # and the details' similar details, expanded responses are not fingerprinted
+        with self.assertNumQueries(4):
+            self.client.get(url, {'expand': 'planned_details.detail'})
+
+    def test_task_default_output(self):
+        response = self.client.get(reverse('retrieve-update-delete-task', kwargs={'pk': self.task.id}))
+        self.assertNotIn('planned_details', response.data)
+        self.assertIn('description', response.data)
@@ -1,11 +1,20 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from details.exceptions import ComponentAllocationError
+from details.models import DetailInStock, PlannedDetail
+from details.planner import ShardedAllocationPlanner
 from details.services import PlannedDetailAllocationService, PlannedDetailDAO
 from details.tests.factories import (
     DetailFactory, DetailInStockFactory,
     PlannedDetailFactory,
     TestDetailDataGenerator, WareHouseFactory,
 )
-from django.db import connection
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
 from django.test.utils import CaptureQueriesContext
+from django.test import TransactionTestCase
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from tasks.models import Task
 from tasks.services import TaskDAO, TaskService
@@ -59,3 +68,156 @@ class TestTaskAllocation(APITestCase):
         tasks = Task.objects.all()
         self.assertEqual(tasks.filter(status=Task.Status.COMPLETED).count(), 1)
         self.assertEqual(tasks.filter(status=Task.Status.IN_PROGRESS).count(), 2)
+
+    def allocate_task_list_row_by_row(self, tasks):
+        """
+        Reference allocation: one task and one planned detail at a time.
+        """
+        tasks_to_allocate_partially = []
+        for task in tasks:
+            planned_details = self.planned_detail_dao.get_planned_details_from_task(task)
+            task.status = Task.Status.IN_PROGRESS
+            task.save(update_fields=['status'])
+            if self.detail_allocation_service.can_full_allocate(planned_details):
+                self.detail_allocation_service.allocated_batch_planned_details(planned_details)
+                task.status = Task.Status.COMPLETED
+                task.save(update_fields=['status'])
+            else:
+                tasks_to_allocate_partially.append(planned_details)
+
+        for planned_details in tasks_to_allocate_partially:
+            self.detail_allocation_service.allocated_batch_planned_details(planned_details)
+
+    @staticmethod
+    def get_allocation_state():
+        return (
+            dict(Task.objects.values_list('id', 'status')),
+            dict(PlannedDetail.objects.values_list('id', 'quantity_in_stock')),
+            dict(DetailInStock.objects.values_list('id', 'quantity')),
+        )
+
+    def get_open_tasks(self):
+        return Task.objects.filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS]).order_by("expected_date")
+
+    def test_allocate_task_list_matches_row_by_row_allocation(self):
+        with transaction.atomic():
+            self.allocate_task_list_row_by_row(self.get_open_tasks())
+            expected_state = self.get_allocation_state()
+            transaction.set_rollback(True)
+
+        plan = self.task_service.allocate_task_list(self.get_open_tasks())
+        self.assertEqual(expected_state, self.get_allocation_state())
+        self.assertEqual(
+            sum(planned_detail.quantity_in_stock for planned_detail in PlannedDetail.objects.all()),
+            plan.allocated_quantity,
+        )
+
+    def test_allocate_task_list_query_count_does_not_grow(self):
+        plan = self.task_service.allocate_task_list(self.get_open_tasks())
+        Task.objects.update(status=Task.Status.TODO)
+        PlannedDetail.objects.update(quantity_in_stock=0)
+
+        self.data_generator.generate_test_data()
+        self.data_generator.generate_test_data()
+        bigger_plan = self.task_service.allocate_task_list(self.get_open_tasks())
+
+        self.assertEqual(plan.query_count, bigger_plan.query_count)
+
+    def test_sharded_allocation_matches_allocate_task_list(self):
+        with transaction.atomic():
+            self.task_service.allocate_task_list(self.get_open_tasks())
+            expected_state = self.get_allocation_state()
+            transaction.set_rollback(True)
+
+        planner = ShardedAllocationPlanner(workers=1)
+        components, task_components = planner.get_components(list(self.get_open_tasks()))
+        self.assertEqual(len(components), 2)
+        self.assertEqual(max(len(indexes) for indexes in task_components.values()), 2)
+
+        plan = planner.allocate(self.get_open_tasks())
+        self.assertEqual(expected_state, self.get_allocation_state())
+        self.assertEqual(len(plan.completed_task_ids), 1)
+
+    def test_sharded_allocation_of_task_spanning_two_components(self):
+        """
+        The greedy fully allocatable first pass runs per component: a task that can't be covered
+        in one component still takes the stock of the other component ahead of a later task.
+        """
+        detail_x, detail_y = DetailFactory.create_batch(2)
+        DetailInStockFactory.create(detail=detail_x, quantity=10, warehouse=WareHouseFactory.create())
+        author, executor = UserFactory.create_batch(2)
+        spanning_task, later_task = (
+            TaskFactory.create(author=author, executor=executor, expected_date=timezone.now() + timedelta(days=days))
+            for days in (1, 2)
+        )
+        PlannedDetailFactory.create(task=spanning_task, detail=detail_x, planned_quantity=10)
+        PlannedDetailFactory.create(task=spanning_task, detail=detail_y, planned_quantity=10)
+        PlannedDetailFactory.create(task=later_task, detail=detail_x, planned_quantity=10)
+        tasks = Task.objects.filter(id__in=[spanning_task.id, later_task.id]).order_by('expected_date', 'id')
+
+        with transaction.atomic():
+            plan = self.task_service.allocate_task_list(tasks)
+            self.assertEqual(plan.completed_task_ids, [later_task.id])
+            self.assertEqual(later_task.planned_details.get().quantity_in_stock, 10)
+            transaction.set_rollback(True)
+
+        plan = ShardedAllocationPlanner(workers=1).allocate(tasks)
+        self.assertEqual(plan.completed_task_ids, [])
+        self.assertEqual(plan.in_progress_task_ids, [spanning_task.id, later_task.id])
+        self.assertEqual(spanning_task.planned_details.get(detail=detail_x).quantity_in_stock, 10)
+        self.assertEqual(later_task.planned_details.get().quantity_in_stock, 0)
+
+    def test_sharded_allocation_reports_failed_component(self):
+        detail_x, detail_y = DetailFactory.create_batch(2)
+        author, executor = UserFactory.create_batch(2)
+        tasks = []
+        for detail in (detail_x, detail_y):
+            DetailInStockFactory.create(detail=detail, quantity=10, warehouse=WareHouseFactory.create())
+            task = TaskFactory.create(author=author, executor=executor, expected_date=timezone.now())
+            PlannedDetailFactory.create(task=task, detail=detail, planned_quantity=5)
+            tasks.append(task)
+        planner = ShardedAllocationPlanner(workers=1)
+        allocate_component = planner._allocate_component
+
+        def fail_component_of_detail_y(component_tasks, detail_ids):
+            if detail_y.id in detail_ids:
+                raise OperationalError("could not serialize access due to concurrent update")
+            return allocate_component(component_tasks, detail_ids)
+
+        with (
+            patch.object(planner, '_allocate_component', fail_component_of_detail_y),
+            self.assertRaises(ComponentAllocationError) as context,
+        ):
+            planner.allocate(Task.objects.filter(id__in=[task.id for task in tasks]).order_by('id'))
+
+        self.assertEqual(context.exception.detail_ids, [detail_y.id])
+        self.assertIsInstance(context.exception.__cause__, OperationalError)
+        self.assertIn(str(detail_y.id), str(context.exception))
+        # the other component is allocated and its task status written
+        tasks[0].refresh_from_db()
+        tasks[1].refresh_from_db()
+        self.assertEqual(tasks[0].status, Task.Status.COMPLETED)
+        self.assertEqual(tasks[1].planned_details.get().quantity_in_stock, 0)
+
+
+class TestParallelTaskAllocation(TransactionTestCase):
+
+    def setUp(self):
+        TestDetailDataGenerator().generate_test_data()
+
+    def test_allocate_components_in_parallel(self):
+        initial_stock = DetailInStock.objects.aggregate(total=Sum('quantity'))['total']
+        tasks = Task.objects.filter(status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS]).order_by("expected_date")
+
+        plan = ShardedAllocationPlanner(workers=2).allocate(tasks)
+
+        self.assertEqual(Task.objects.filter(status=Task.Status.COMPLETED).count(), 1)
+        self.assertEqual(Task.objects.filter(status=Task.Status.IN_PROGRESS).count(), 2)
+        self.assertEqual(
+            initial_stock - plan.allocated_quantity,
+            DetailInStock.objects.aggregate(total=Sum('quantity'))['total'],
+        )
+        self.assertEqual(
+            plan.allocated_quantity,
+            PlannedDetail.objects.aggregate(total=Sum('quantity_in_stock'))['total'],
+        )
@@ -1,15 +1,48 @@
 from django.urls import path
 from tasks.views import (
-    CreateListTaskView, RetrieveUpdateDestroyTaskView,
+    CreateAllocationJobView, CreateListTaskView,
+    RetrieveAllocationJobView, RetrieveUpdateDestroyTaskView,
     UpdateCompletedTaskView, UpdateInProgressTaskView,
     UpdateReviewTaskView,
 )
 
+# query_budgets: maximum queries per HTTP method whatever the number of rows, enforced by tests_query_budgets
 urlpatterns = [
-    path('', CreateListTaskView.as_view(), name='list-create-task'),
-    path('<int:pk>/', RetrieveUpdateDestroyTaskView.as_view(), name='retrieve-update-delete-task'),
+    path(
+        '',
+        CreateListTaskView.as_view(query_budgets={'get': 3, 'post': 3}),
+        name='list-create-task',
+    ),
+    path(
+        '<int:pk>/',
+        RetrieveUpdateDestroyTaskView.as_view(query_budgets={'get': 3, 'put': 4, 'patch': 3, 'delete': 7}),
+        name='retrieve-update-delete-task',
+    ),
 
-    path('update-in-progress/<int:pk>/', UpdateInProgressTaskView.as_view(), name='update-to-in-progress'),
-    path('update-review/<int:pk>/', UpdateReviewTaskView.as_view(), name='update-to-review'),
-    path('update-completed/<int:pk>/', UpdateCompletedTaskView.as_view(), name='update-to-completed'),
+    path(
+        'update-in-progress/<int:pk>/',
+        UpdateInProgressTaskView.as_view(query_budgets={'patch': 4}),
+        name='update-to-in-progress',
+    ),
+    path(
+        'update-review/<int:pk>/',
+        UpdateReviewTaskView.as_view(query_budgets={'patch': 4}),
+        name='update-to-review',
+    ),
+    path(
+        'update-completed/<int:pk>/',
+        UpdateCompletedTaskView.as_view(query_budgets={'patch': 4}),
+        name='update-to-completed',
+    ),
+
+    path(
+        'allocate/',
+        CreateAllocationJobView.as_view(query_budgets={'post': 2}),
+        name='create-allocation-job',
+    ),
+    path(
+        'allocate/<int:pk>/',
+        RetrieveAllocationJobView.as_view(query_budgets={'get': 1}),
+        name='retrieve-allocation-job',
+    ),
 ]
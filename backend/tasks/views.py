@@ -4,11 +4,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from sa_project.services.base_permission import IsAuthorOrExecutorReadOnly
 from sa_project.services.base_view import BaseAPIView
+from sa_project.services.conditional_get import conditional_get, get_object_fingerprint
+from sa_project.services.pagination import KeysetLimitOffsetPagination
 from tasks.serializers import (
-    BaseTaskSerializer, CreateTaskSerializer,
+    AllocationJobSerializer, BaseTaskSerializer,
+    CreateAllocationJobSerializer, CreateTaskSerializer,
     ListTaskSerializer, SingleTaskSerializer,
 )
-from tasks.services import TaskDAO
+from tasks.services import AllocationJobDAO, TaskDAO
 
 
 class BaseTaskView(BaseAPIView):
@@ -20,6 +23,8 @@ class BaseTaskView(BaseAPIView):
 
 class CreateListTaskView(generics.ListCreateAPIView, BaseTaskView):
     serializer_class = ListTaskSerializer
+    pagination_class = KeysetLimitOffsetPagination
+    keyset_ordering = ('expected_date', 'id')
 
     @extend_schema(responses=CreateTaskSerializer, request=CreateTaskSerializer)
     def post(self, request, *args, **kwargs):
@@ -38,9 +43,14 @@ class RetrieveUpdateDestroyTaskView(BaseTaskView, generics.RetrieveUpdateDestroy
     serializer_class = BaseTaskSerializer
 
     @extend_schema(responses=SingleTaskSerializer)
+    @conditional_get
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
+    def get_fingerprint(self) -> tuple | None:
+        # only tasks the user may read, a 304 is answered before the object permissions are checked
+        return get_object_fingerprint(self.controller.model.objects.filter(author=self.request.user), self.kwargs['pk'])
+
 
 class UpdateTaskView(BaseTaskView, generics.UpdateAPIView):
     serializer_class = BaseTaskSerializer
@@ -72,8 +82,37 @@ class UpdateReviewTaskView(BaseTaskView):
 class UpdateCompletedTaskView(BaseTaskView):
 
     @extend_schema(responses=BaseTaskSerializer, request=None)
-    def patch(self, serializer: CreateTaskSerializer):
+    def patch(self, request, *args, **kwargs):
         obj = self.get_object()
         controller = self.get_controller()
         controller.change_to_completed(obj)
         return Response(data=self.serializer_class(obj).data, status=200)
+
+
+class BaseAllocationJobView(BaseAPIView):
+    serializer_class = AllocationJobSerializer
+    controller: AllocationJobDAO = AllocationJobDAO
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return self.get_controller().get_user_jobs(user=self.request.user)
+
+
+class CreateAllocationJobView(BaseAllocationJobView, generics.CreateAPIView):
+    """
+    Queue an allocation of all open tasks of the user or of task_ids, run by the run_allocation_jobs worker.
+    """
+    serializer_class = CreateAllocationJobSerializer
+
+    @extend_schema(responses={202: AllocationJobSerializer})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(created_by=request.user)
+        return Response(data=AllocationJobSerializer(job).data, status=202)
+
+
+class RetrieveAllocationJobView(BaseAllocationJobView, generics.RetrieveAPIView):
+
+    def get_object(self, *args, **kwargs):
+        return generics.get_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])